@@ -1,78 +1,454 @@
 import logging
+import os
 
 import librosa  # ty: ignore[unresolved-import]
 import numpy as np
+from governor import wrap_command
 from models import AudioFeatures
+from scipy.signal import sosfilt  # ty: ignore[unresolved-import]
+from timing import run_streaming
 
 logger = logging.getLogger(__name__)
 
+# Bump when a change to the analysis changes feature values; reanalyze.py then
+# refreshes tracks analyzed with an older version (NULL: before versioning)
+FEATURE_VERSION = 5
+FEATURE_NAMES = ("tempo_bpm", "rms_energy", "spectral_centroid", "zero_crossing_rate")
+ANALYSIS_SR = 44100  # the house MP3 rate, which is what analysis has always seen
+# ffmpeg decodes for analysis in stereo, like the house MP3, so loudness is measured on
+# what's played; features are computed on the (L+R)/sqrt(2) downmix that -ac 1 produced
+PCM_CHANNELS = 2
+ANALYSIS_WINDOW_S = 120.0
+N_FFT = 2048
+HOP_LENGTH = 512
+# "full" runs HPSS and estimates tempo over the whole window; "fast" skips HPSS and
+# estimates tempo on three short excerpts (start, middle, end of the window)
+TIERS = ("fast", "full")
+FAST_EXCERPT_S = 20.0
+HPSS_KERNEL = 31  # librosa's default median filter width, in frames
+BLOCK_FRAMES = 256  # STFT frames analyzed at a time, ~3 s of audio
+TEMPO_AC_SIZE_S = 8.0  # librosa's default tempogram window
+TEMPOGRAM_BLOCK = 1024
+# Embedding: per-frame MFCCs and chroma, summarized as their mean and variance over the
+# window and stored as a little-endian float32 BLOB
+N_MFCC = 20
+N_CHROMA = 12
+EMBEDDING_DIM = 2 * (N_MFCC + N_CHROMA)
+EMBEDDING_DTYPE = "<f4"
+# Loudness (EBU R128 / ITU-R BS.1770) over the whole track, not just the analysis window
+LOUDNESS_BLOCK_S = 0.1  # gating blocks are 4 of these (400 ms, 75% overlap)
+LOUDNESS_ABSOLUTE_GATE_LUFS = -70.0
+LOUDNESS_RELATIVE_GATE_LU = -10.0
+CUE_THRESHOLD_LUFS = -50.0  # a 100 ms block quieter than this is silence for cue in/out
+# Playout gain: bring tracks to this integrated loudness, but never push the sample peak
+# above PEAK_CEILING_DBFS
+LOUDNESS_TARGET_LUFS = float(os.environ.get("LOUDNESS_TARGET_LUFS", "-16"))
+PEAK_CEILING_DBFS = -1.0
+# Acoustic fingerprint (fingerprint_index.py matches it): the strongest pitch classes of each
+# ~0.5 s window of the analysis window, hashed a few windows at a time
+FP_WINDOW_FRAMES = 43
+FP_PEAKS = 3  # pitch classes kept per window
+FP_SPAN = 3  # windows per hash; each takes N_CHROMA bits
+FP_SILENCE_DB = 40.0  # windows this far below the median window get no hash
 
-def extract_features(file_path: str) -> AudioFeatures:
-    """Extract audio features from an MP3 file using librosa."""
-    logger.info(f"Extracting features from {file_path}")
 
-    y, sr = librosa.load(file_path, sr=None, mono=True, duration=120.0)
+class LoudnessMeter:
+    """Integrated loudness, sample peak and cue points of a PCM stream (ITU-R BS.1770-4).
 
-    # Harmonic/percussive separation for cleaner feature extraction
-    y_harmonic, y_percussive = librosa.effects.hpss(y)
+    The K-weighted mean square, summed over channels, is kept per 100 ms block; the
+    400 ms gating blocks are formed from those at the end. That is 8 bytes per 100 ms,
+    so a whole track fits in a few kilobytes.
+    """
 
-    # Tempo (BPM) from percussive signal
-    tempo, _ = librosa.beat.beat_track(y=y_percussive, sr=sr)
-    tempo_bpm = float(np.atleast_1d(tempo)[0])
+    def __init__(self, sr: int):
+        self.sr = sr
+        self._sos = _k_weighting(sr)
+        self._zi: np.ndarray | None = None
+        self._block = round(sr * LOUDNESS_BLOCK_S)
+        self._pending = np.empty(0)
+        self._powers: list[np.ndarray] = []
+        self._peak = 0.0
 
-    # Short-time Fourier transform for spectral features
-    S = np.abs(librosa.stft(y))
+    def feed(self, frames: np.ndarray):
+        """(n, channels) float frames."""
+        if not len(frames):
+            return
+        if self._zi is None:
+            self._zi = np.zeros((len(self._sos), 2, frames.shape[1]))
+        self._peak = max(self._peak, float(np.abs(frames).max()))
+        weighted, self._zi = sosfilt(self._sos, frames, axis=0, zi=self._zi)
+        squares = np.concatenate([self._pending, (weighted**2).sum(axis=1)])
+        whole = len(squares) // self._block * self._block
+        self._powers.append(squares[:whole].reshape(-1, self._block).mean(axis=1))
+        self._pending = squares[whole:]
 
-    # RMS energy
-    rms = librosa.feature.rms(S=S).mean()
-    rms_energy = float(rms)
+    def _block_powers(self) -> np.ndarray:
+        return np.concatenate(self._powers) if self._powers else np.empty(0)
 
-    # Spectral centroid
-    centroid = librosa.feature.spectral_centroid(y=y, sr=sr).mean()
-    spectral_centroid = float(centroid)
+    def integrated_lufs(self) -> float | None:
+        """Gated integrated loudness; None for silence or audio shorter than one gating block."""
+        powers = self._block_powers()
+        if len(powers) < 4:
+            return None
+        gating_blocks = np.convolve(powers, np.full(4, 0.25), mode="valid")
+        gated = gating_blocks[gating_blocks > _power(LOUDNESS_ABSOLUTE_GATE_LUFS)]
+        if not len(gated):
+            return None
+        gated = gated[gated > _power(_lufs(gated.mean()) + LOUDNESS_RELATIVE_GATE_LU)]
+        return _lufs(gated.mean())
 
-    # Zero crossing rate
-    zcr = librosa.feature.zero_crossing_rate(y).mean()
-    zero_crossing_rate = float(zcr)
+    def peak_dbfs(self) -> float | None:
+        return 20 * float(np.log10(self._peak)) if self._peak > 0 else None
 
-    logger.info(
-        f"Features: tempo={tempo_bpm:.1f} rms={rms_energy:.4f} "
-        f"centroid={spectral_centroid:.1f} zcr={zero_crossing_rate:.4f}"
-    )
+    def cue_points(self) -> tuple[float, float] | None:
+        """(cue in, cue out) seconds around the 100 ms blocks above CUE_THRESHOLD_LUFS."""
+        audible = np.flatnonzero(self._block_powers() > _power(CUE_THRESHOLD_LUFS))
+        if not len(audible):
+            return None
+        return round(audible[0] * LOUDNESS_BLOCK_S, 3), round((audible[-1] + 1) * LOUDNESS_BLOCK_S, 3)
 
-    return AudioFeatures(
-        tempo_bpm=tempo_bpm,
-        rms_energy=rms_energy,
-        spectral_centroid=spectral_centroid,
-        zero_crossing_rate=zero_crossing_rate,
-    )
 
+def _k_weighting(sr: int) -> np.ndarray:
+    """BS.1770 K-weighting (high shelf, then high-pass) as second-order sections for sr.
 
-def normalize_features(features: AudioFeatures, mins: dict, maxs: dict) -> np.ndarray:
-    """Normalize features to 0-1 range using running min/max."""
+    The 48 kHz coefficients in the spec are re-derived for other rates from their analog
+    prototypes, as libebur128 does.
+    """
+    # High shelf, +4 dB above ~1.7 kHz: models the head
+    k = np.tan(np.pi * 1681.974450955533 / sr)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh**0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0,
+        2 * (k * k - vh) / a0,
+        (vh - vb * k / q + k * k) / a0,
+        1.0,
+        2 * (k * k - 1) / a0,
+        (1 - k / q + k * k) / a0,
+    ]
+    # RLB high-pass at ~38 Hz
+    k = np.tan(np.pi * 38.13547087602444 / sr)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass])
 
-    def norm(val, lo, hi):
-        if hi == lo:
-            return 0.0
-        return (val - lo) / (hi - lo)
 
-    return np.array(
-        [
-            norm(features.tempo_bpm, mins["tempo_bpm"], maxs["tempo_bpm"]),
-            norm(features.rms_energy, mins["rms_energy"], maxs["rms_energy"]),
-            norm(
-                features.spectral_centroid,
-                mins["spectral_centroid"],
-                maxs["spectral_centroid"],
-            ),
-            norm(
-                features.zero_crossing_rate,
-                mins["zero_crossing_rate"],
-                maxs["zero_crossing_rate"],
-            ),
-        ]
-    )
+def _lufs(power: float) -> float:
+    return -0.691 + 10 * float(np.log10(power))
 
 
-def euclidean_distance(a: np.ndarray, b: np.ndarray) -> float:
-    return float(np.sqrt(np.sum((a - b) ** 2)))
+def _power(lufs: float) -> float:
+    return 10 ** ((lufs + 0.691) / 10)
+
+
+def playout_gain_db(loudness_lufs: float | None, peak_dbfs: float | None) -> float | None:
+    """Gain that brings a track to LOUDNESS_TARGET_LUFS without its peak passing PEAK_CEILING_DBFS."""
+    if loudness_lufs is None:
+        return None
+    gain = LOUDNESS_TARGET_LUFS - loudness_lufs
+    if peak_dbfs is not None:
+        gain = min(gain, PEAK_CEILING_DBFS - peak_dbfs)
+    return gain
+
+
+class FeatureAccumulator:
+    """Streaming feature extraction from mono float32 PCM.
+
+    Samples are analyzed in blocks of BLOCK_FRAMES STFT frames as they arrive, so
+    memory stays flat whatever the input's length or original sample rate. Only the
+    first ANALYSIS_WINDOW_S seconds are analyzed; the rest is counted for the duration.
+    Per-frame values match a single STFT over the whole window: RMS, centroid and ZCR
+    are kept as running sums, HPSS is run per block with enough neighbouring frames for
+    its median filter, and only the 128-band mel frames for onset strength are kept.
+    The embedding's MFCC and chroma frames are likewise reduced to running sums and
+    sums of squares; the chroma frames are also kept for the fingerprint. Loudness and
+    cue points are measured over the whole stream.
+    """
+
+    def __init__(
+        self, sr: int = ANALYSIS_SR, tier: str = "full", seconds: float = ANALYSIS_WINDOW_S, channels: int = 1
+    ):
+        if tier not in TIERS:
+            raise ValueError(f"Unknown analysis tier: {tier}")
+        if channels not in (1, 2):
+            raise ValueError(f"Unsupported channel count: {channels}")
+        self.sr = sr
+        self.tier = tier
+        self.channels = channels
+        self.total_samples = 0
+        self._loudness = LoudnessMeter(sr)
+        self._limit = int(sr * seconds)
+        self._buf = np.zeros(N_FFT // 2, dtype=np.float32)  # leading pad, as librosa.stft(center=True)
+        self._frames = 0
+        self._rms_sum = 0.0
+        self._centroid_sum = 0.0
+        self._zcr_sum = 0.0
+        self._mel_basis = librosa.filters.mel(sr=sr, n_fft=N_FFT)
+        self._mel: list[np.ndarray] = []
+        self._chroma_basis = librosa.filters.chroma(sr=sr, n_fft=N_FFT, tuning=0.0)
+        self._embed_sum = np.zeros(N_MFCC + N_CHROMA)
+        self._embed_sq_sum = np.zeros(N_MFCC + N_CHROMA)
+        self._chroma: list[np.ndarray] = []
+        # HPSS: frames already separated (kept as left context) and frames still waiting for right context
+        self._hpss_left = np.empty((1 + N_FFT // 2, 0), dtype=np.float32)
+        self._hpss_pending = self._hpss_left
+        self._features: AudioFeatures | None = None
+
+    def feed(self, chunk: bytes):
+        """PCM byte sink, e.g. for convert_to_standard_mp3(pcm_sink=...); interleaved if stereo."""
+        self.feed_samples(np.frombuffer(chunk, dtype="<f4").reshape(-1, self.channels))
+
+    def feed_samples(self, samples: np.ndarray):
+        """Mono samples, or (n, 2) stereo frames."""
+        frames = samples.reshape(len(samples), -1)
+        self._loudness.feed(frames)
+        if frames.shape[1] == 2:
+            samples = (frames[:, 0] + frames[:, 1]) * np.float32(np.sqrt(0.5))  # as ffmpeg -ac 1
+        take = max(0, min(len(samples), self._limit - self.total_samples))
+        self.total_samples += len(samples)
+        if not take:
+            return
+        step = BLOCK_FRAMES * HOP_LENGTH
+        for start in range(0, take, step):
+            self._buf = np.concatenate([self._buf, samples[start : min(take, start + step)]])
+            if self._frames_available() >= BLOCK_FRAMES:
+                self._analyze_block(BLOCK_FRAMES)
+
+    @property
+    def duration_s(self) -> float | None:
+        return self.total_samples / self.sr if self.total_samples else None
+
+    def result(self) -> AudioFeatures:
+        """Finish the stream and return its features."""
+        if self._features is None:
+            self._features = self._finish()
+        return self._features
+
+    def _frames_available(self) -> int:
+        return 1 + (len(self._buf) - N_FFT) // HOP_LENGTH if len(self._buf) >= N_FFT else 0
+
+    def _analyze_block(self, n_frames: int):
+        y = self._buf[: (n_frames - 1) * HOP_LENGTH + N_FFT]
+        S = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False))
+        self._frames += n_frames
+        self._rms_sum += float(librosa.feature.rms(S=S, frame_length=N_FFT, hop_length=HOP_LENGTH).sum())
+        self._centroid_sum += float(
+            librosa.feature.spectral_centroid(S=S, sr=self.sr, n_fft=N_FFT, hop_length=HOP_LENGTH).sum()
+        )
+        self._zcr_sum += float(
+            librosa.feature.zero_crossing_rate(y, frame_length=N_FFT, hop_length=HOP_LENGTH, center=False).sum()
+        )
+        self._buf = self._buf[n_frames * HOP_LENGTH :]
+        power = S**2
+        mel = self._mel_basis @ power
+        chroma = self._chroma_basis @ power
+        self._chroma.append(chroma)
+        self._embed(mel, chroma)
+        if self.tier == "full":
+            self._separate(S, final=False)
+        else:
+            self._mel.append(mel)
+
+    def _embed(self, mel: np.ndarray, chroma: np.ndarray):
+        """Add a block's MFCC and chroma frames to the embedding sums.
+
+        Both are per-frame: power_to_db without top_db and a fixed tuning keep blocks
+        independent of each other, as the whole window would be.
+        """
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel, top_db=None), n_mfcc=N_MFCC)
+        chroma = librosa.util.normalize(chroma, norm=np.inf, axis=0)
+        frames = np.vstack([mfcc, chroma]).astype(np.float64)
+        self._embed_sum += frames.sum(axis=1)
+        self._embed_sq_sum += (frames**2).sum(axis=1)
+
+    def _separate(self, S: np.ndarray, final: bool):
+        """Blockwise HPSS: a frame is separated once HPSS_KERNEL // 2 frames follow it."""
+        context = HPSS_KERNEL // 2
+        pending = np.concatenate([self._hpss_pending, S], axis=1)
+        ready = pending.shape[1] if final else pending.shape[1] - context
+        if ready <= 0:
+            self._hpss_pending = pending
+            return
+        frames = np.concatenate([self._hpss_left, pending], axis=1)
+        start = self._hpss_left.shape[1]
+        _, S_percussive = librosa.decompose.hpss(frames, kernel_size=HPSS_KERNEL)
+        self._mel.append(self._mel_basis @ S_percussive[:, start : start + ready] ** 2)
+        self._hpss_left = frames[:, max(0, start + ready - context) : start + ready]
+        self._hpss_pending = pending[:, ready:]
+
+    def _finish(self) -> AudioFeatures:
+        if not self.total_samples:
+            raise RuntimeError("No audio samples decoded")
+        self._buf = np.concatenate([self._buf, np.zeros(N_FFT // 2, dtype=np.float32)])  # trailing pad
+        if self._frames_available():
+            self._analyze_block(self._frames_available())
+        if self.tier == "full":
+            self._separate(self._hpss_left[:, :0], final=True)
+
+        onset_env = librosa.onset.onset_strength(
+            S=librosa.power_to_db(np.concatenate(self._mel, axis=1)),
+            sr=self.sr,
+            hop_length=HOP_LENGTH,
+            aggregate=np.median,
+        )
+        self._mel = []
+        fingerprint = fingerprint_hashes(np.concatenate(self._chroma, axis=1))
+        self._chroma = []
+        tempo_bpm = _full_tempo(onset_env, self.sr) if self.tier == "full" else _fast_tempo(onset_env, self.sr)
+        rms_energy = self._rms_sum / self._frames
+        spectral_centroid = self._centroid_sum / self._frames
+        zero_crossing_rate = self._zcr_sum / self._frames
+        mean = self._embed_sum / self._frames
+        variance = np.maximum(self._embed_sq_sum / self._frames - mean**2, 0.0)
+
+        loudness_lufs = self._loudness.integrated_lufs()
+        cue = self._loudness.cue_points()
+
+        logger.info(
+            f"Features ({self.tier}): tempo={tempo_bpm:.1f} rms={rms_energy:.4f} "
+            f"centroid={spectral_centroid:.1f} zcr={zero_crossing_rate:.4f} loudness={loudness_lufs} LUFS cue={cue}"
+        )
+
+        return AudioFeatures(
+            tempo_bpm=tempo_bpm,
+            rms_energy=rms_energy,
+            spectral_centroid=spectral_centroid,
+            zero_crossing_rate=zero_crossing_rate,
+            embedding=np.concatenate([mean, variance]).tolist(),
+            loudness_lufs=loudness_lufs,
+            peak_dbfs=self._loudness.peak_dbfs(),
+            cue_in_s=cue[0] if cue else None,
+            cue_out_s=cue[1] if cue else None,
+            fingerprint=fingerprint,
+        )
+
+
+def extract_features(file_path: str, tier: str = "full") -> AudioFeatures:
+    """Extract audio features from an audio file, decoding it with ffmpeg block by block."""
+    logger.info(f"Extracting features from {file_path} ({tier})")
+    accumulator = FeatureAccumulator(tier=tier, channels=PCM_CHANNELS)
+    # The whole file is decoded for loudness and cue-out; features still use the first ANALYSIS_WINDOW_S
+    cmd = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        file_path,
+        "-map",
+        "0:a:0",
+        "-ac",
+        str(PCM_CHANNELS),
+        "-ar",
+        str(ANALYSIS_SR),
+        "-f",
+        "f32le",
+        "pipe:1",
+    ]
+    result = run_streaming(wrap_command(cmd), accumulator.feed, timeout=300, chunk_bytes=4 * PCM_CHANNELS * ANALYSIS_SR)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg decode failed: {result.stderr[-500:]}")
+    return accumulator.result()
+
+
+def features_from_pcm(y: np.ndarray, sr: int, tier: str = "full") -> AudioFeatures:
+    """Extract audio features from mono PCM samples (or (n, 2) stereo frames) already in memory."""
+    accumulator = FeatureAccumulator(sr=sr, tier=tier, channels=1 if y.ndim == 1 else y.shape[1])
+    accumulator.feed_samples(y)
+    return accumulator.result()
+
+
+def _full_tempo(onset_env: np.ndarray, sr: int) -> float:
+    """Tempo over the whole window, as librosa.beat.beat_track reports it.
+
+    beat_track's tempo is the tempogram estimate below (0 when there are no onsets);
+    the beat positions it also tracks were never used, so that step is skipped.
+    """
+    return _tempo(onset_env, sr) if onset_env.any() else 0.0
+
+
+def _fast_tempo(onset_env: np.ndarray, sr: int) -> float:
+    """Median tempo estimate over excerpts from the start, middle and end.
+
+    An excerpt with no onsets counts as 0, as in _full_tempo, rather than librosa's prior.
+    """
+    frames = int(FAST_EXCERPT_S * sr / HOP_LENGTH)
+    total = len(onset_env)
+    starts = [0] if total <= 3 * frames else [0, (total - frames) // 2, total - frames]
+    return float(np.median([_full_tempo(onset_env[start : start + frames], sr) for start in starts]))
+
+
+def _tempo(onset_env: np.ndarray, sr: int) -> float:
+    """librosa.feature.tempo with its default mean aggregation, without materializing the tempogram.
+
+    The tempogram has one autocorrelation column per onset frame (~700 lags x 10k frames,
+    ~300 MB of temporaries for 120 s); its mean is summed TEMPOGRAM_BLOCK columns at a time.
+    """
+    win_length = librosa.time_to_frames(TEMPO_AC_SIZE_S, sr=sr, hop_length=HOP_LENGTH).item()
+    n = len(onset_env)
+    padded = np.pad(onset_env, win_length // 2, mode="linear_ramp", end_values=[0, 0])
+    frames = librosa.util.frame(padded, frame_length=win_length, hop_length=1)[:, :n]
+    window = librosa.filters.get_window("hann", win_length, fftbins=True)[:, np.newaxis]
+    total = np.zeros(win_length)
+    for start in range(0, n, TEMPOGRAM_BLOCK):
+        ac = librosa.autocorrelate(frames[:, start : start + TEMPOGRAM_BLOCK] * window, axis=0)
+        total += librosa.util.normalize(ac, norm=np.inf, axis=0).sum(axis=1)
+    tempo = librosa.feature.tempo(tg=(total / n)[:, np.newaxis], sr=sr, hop_length=HOP_LENGTH)
+    return float(tempo[0])
+
+
+def fingerprint_hashes(chroma: np.ndarray) -> list[int]:
+    """Hash (N_CHROMA, frames) chroma power into one value per FP_WINDOW_FRAMES window.
+
+    Each window is reduced to a bitmask of its FP_PEAKS strongest pitch classes, and its
+    hash packs that mask with those of the next FP_SPAN - 1 windows: a short chord
+    progression, which survives re-encoding, resampling and gain changes. Windows near
+    silence (and the hashes spanning them) are -1.
+    """
+    n = chroma.shape[1] // FP_WINDOW_FRAMES
+    if n < FP_SPAN:
+        return []
+    windows = chroma[:, : n * FP_WINDOW_FRAMES].reshape(N_CHROMA, n, FP_WINDOW_FRAMES).sum(axis=2).T
+    energy = windows.sum(axis=1)
+    audible = energy > np.median(energy) * 10 ** (-FP_SILENCE_DB / 10)
+    masks = (1 << np.argsort(windows, axis=1)[:, -FP_PEAKS:]).sum(axis=1)
+    count = n - FP_SPAN + 1
+    hashes = sum(masks[i : i + count] << (N_CHROMA * i) for i in range(FP_SPAN))
+    spans_audible = np.lib.stride_tricks.sliding_window_view(audible, FP_SPAN).all(axis=1)
+    return np.where(spans_audible, hashes, -1).tolist()
+
+
+def normalize_matrix(values: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Scale each feature column to 0-1 between its bounds, clipping values outside them."""
+    span = hi - lo
+    scaled = np.divide(values - lo, span, out=np.zeros(values.shape), where=span > 0)
+    return np.clip(scaled, 0.0, 1.0)
+
+
+def embedding_blob(embedding: list[float] | None) -> bytes | None:
+    """Pack an embedding for the tracks.embedding column."""
+    return None if embedding is None else np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def embedding_matrix(blobs: list[bytes]) -> np.ndarray:
+    """Unpack tracks.embedding BLOBs into one (len(blobs), EMBEDDING_DIM) array."""
+    return np.frombuffer(b"".join(blobs), dtype=EMBEDDING_DTYPE).reshape(len(blobs), EMBEDDING_DIM)
+
+
+def cosine_distances(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """1 - cosine similarity between query and each row of matrix, after z-scoring both.
+
+    MFCC means are in the hundreds and chroma variances near zero, so each dimension
+    is standardized over the matrix first; otherwise the first coefficients decide alone.
+    """
+    values = matrix.astype(np.float64)
+    mean = values.mean(axis=0)
+    std = values.std(axis=0)
+    std[std == 0] = 1.0
+    values = (values - mean) / std
+    query = (query.astype(np.float64) - mean) / std
+    norms = np.linalg.norm(values, axis=1) * np.linalg.norm(query)
+    similarity = np.divide(values @ query, norms, out=np.zeros(len(values)), where=norms > 0)
+    return 1.0 - similarity
@@ -26,7 +26,15 @@ CREATE TABLE IF NOT EXISTS tracks (
     submitted_at TEXT NOT NULL,
     ready_at TEXT,
     comment TEXT,
-    youtube_video_id TEXT
+    youtube_video_id TEXT,
+    analysis_tier TEXT,
+    feature_version INTEGER,
+    embedding BLOB,
+    loudness_lufs REAL,
+    peak_dbfs REAL,
+    cue_in_s REAL,
+    cue_out_s REAL,
+    media_hash TEXT
 );
 
 CREATE TABLE IF NOT EXISTS play_log (
@@ -35,6 +43,8 @@ CREATE TABLE IF NOT EXISTS play_log (
     played_at TEXT NOT NULL
 );
 
+CREATE INDEX IF NOT EXISTS idx_play_log_track ON play_log(track_id);
+
 CREATE TABLE IF NOT EXISTS jobs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     track_id TEXT NOT NULL REFERENCES tracks(id),
@@ -42,9 +52,176 @@ CREATE TABLE IF NOT EXISTS jobs (
     created_at TEXT NOT NULL,
     started_at TEXT,
     finished_at TEXT,
+    error_msg TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    source_bytes INTEGER,
+    est_duration_s REAL,
+    queue_wait_s REAL,
+    stage TEXT,
+    raw_path TEXT,
+    converted_path TEXT,
+    features_json TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT,
+    transcode_mode TEXT,
+    import_id INTEGER REFERENCES imports(id),
+    source_key TEXT,
+    media_hash TEXT
+);
+
+-- Tracks whose submission attached to another track's in-flight job for the same source
+-- (jobs.source_key) instead of getting a job of their own; the job's result fans out to them
+CREATE TABLE IF NOT EXISTS job_followers (
+    track_id TEXT PRIMARY KEY REFERENCES tracks(id),
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    attached_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_followers_job ON job_followers(job_id);
+
+-- Content-addressed media files (media_store.py), kept with their analysis after the
+-- file itself is deleted; tracks.media_hash references them
+CREATE TABLE IF NOT EXISTS media (
+    hash TEXT PRIMARY KEY,
+    size_bytes INTEGER NOT NULL,
+    analysis_json TEXT,
+    created_at TEXT NOT NULL
+);
+
+-- The media file each source (jobs.source_key) was last ingested as
+CREATE TABLE IF NOT EXISTS media_sources (
+    source_key TEXT PRIMARY KEY,
+    media_hash TEXT NOT NULL REFERENCES media(hash),
+    title TEXT,
+    artist TEXT,
+    recorded_at TEXT NOT NULL
+);
+
+-- Inverted index of acoustic fingerprints (fingerprint_index.py): one row per hash
+-- occurrence, at its window offset in the track
+CREATE TABLE IF NOT EXISTS fingerprints (
+    hash INTEGER NOT NULL,
+    track_id TEXT NOT NULL REFERENCES tracks(id),
+    offset INTEGER NOT NULL,
+    PRIMARY KEY (hash, track_id, offset)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_fingerprints_track ON fingerprints(track_id);
+
+-- Tracks that sound like an earlier one, found when the later one was fingerprinted
+CREATE TABLE IF NOT EXISTS fingerprint_matches (
+    track_id TEXT NOT NULL REFERENCES tracks(id),
+    match_id TEXT NOT NULL REFERENCES tracks(id),
+    score REAL NOT NULL,
+    offset_s REAL NOT NULL,
+    found_at TEXT NOT NULL,
+    PRIMARY KEY (track_id, match_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_fingerprint_matches_match ON fingerprint_matches(match_id);
+
+-- Trigram index over normalized titles for the fuzzy duplicate check (title_index.py).
+-- The triggers queue new and retitled tracks (trigram_count NULL) for title_index.sync().
+CREATE TABLE IF NOT EXISTS title_trigrams (
+    trigram TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    PRIMARY KEY (trigram, track_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_title_trigrams_track ON title_trigrams(track_id);
+
+CREATE TABLE IF NOT EXISTS title_index (
+    track_id TEXT PRIMARY KEY,
+    trigram_count INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_title_index_pending ON title_index(track_id) WHERE trigram_count IS NULL;
+
+CREATE TRIGGER IF NOT EXISTS tracks_title_insert AFTER INSERT ON tracks BEGIN
+    INSERT OR REPLACE INTO title_index (track_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tracks_title_update AFTER UPDATE OF title ON tracks
+WHEN NEW.title IS NOT OLD.title BEGIN
+    INSERT OR REPLACE INTO title_index (track_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tracks_title_delete AFTER DELETE ON tracks BEGIN
+    DELETE FROM title_trigrams WHERE track_id = OLD.id;
+    DELETE FROM title_index WHERE track_id = OLD.id;
+END;
+
+-- One row per playlist import; its jobs point back here through jobs.import_id
+CREATE TABLE IF NOT EXISTS imports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source_url TEXT NOT NULL,
+    playlist_title TEXT,
+    submitter TEXT NOT NULL,
+    user_id TEXT REFERENCES users(id),
+    created_at TEXT NOT NULL,
+    listed INTEGER NOT NULL,
+    queued INTEGER NOT NULL,
+    duplicates INTEGER NOT NULL,
+    over_budget INTEGER NOT NULL
+);
+
+-- Resumable uploads in progress (POST /uploads, PATCH /uploads/{id}). The data goes to
+-- raw/upload-{id}.part, preallocated to length as a sparse file; offset is how much of
+-- it has been received. A row becomes a track at /finish, or expires unless it's resumed.
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    submitter TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0,
+    title TEXT,
+    artist TEXT,
+    comment TEXT,
+    container TEXT,
+    codec TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+-- Title/artist/duration of YouTube videos, looked up ahead of the download. Rows start
+-- 'pending' and double as the metadata lane's queue.
+CREATE TABLE IF NOT EXISTS youtube_metadata (
+    video_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    title TEXT,
+    artist TEXT,
+    duration_s REAL,
+    requested_at TEXT NOT NULL,
+    fetched_at TEXT,
     error_msg TEXT
 );
 
+CREATE TABLE IF NOT EXISTS job_timings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL,
+    track_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    wall_s REAL NOT NULL,
+    cpu_s REAL,
+    peak_rss_kb INTEGER,
+    input_bytes INTEGER,
+    recorded_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_timings_job ON job_timings(job_id);
+CREATE INDEX IF NOT EXISTS idx_job_timings_recorded ON job_timings(recorded_at);
+
+-- Mood-matching normalization bounds per audio feature (percentiles over the library)
+CREATE TABLE IF NOT EXISTS feature_stats (
+    feature TEXT PRIMARY KEY,
+    lo REAL NOT NULL,
+    hi REAL NOT NULL,
+    track_count INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS config (
     key TEXT PRIMARY KEY,
     value TEXT NOT NULL
@@ -104,6 +281,33 @@ CREATE TABLE IF NOT EXISTS passkey_challenges (
 );
 """
 
+# Full-text search over the library (GET /library/search): an external-content FTS5 table
+# on tracks, kept in sync by triggers. Created after the migrations, since it indexes
+# tracks.comment.
+LIBRARY_SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, artist, submitter, comment,
+    content='tracks', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts (rowid, title, artist, submitter, comment)
+    VALUES (NEW.rowid, NEW.title, NEW.artist, NEW.submitter, NEW.comment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, submitter, comment)
+    VALUES ('delete', OLD.rowid, OLD.title, OLD.artist, OLD.submitter, OLD.comment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF title, artist, submitter, comment ON tracks BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title, artist, submitter, comment)
+    VALUES ('delete', OLD.rowid, OLD.title, OLD.artist, OLD.submitter, OLD.comment);
+    INSERT INTO tracks_fts (rowid, title, artist, submitter, comment)
+    VALUES (NEW.rowid, NEW.title, NEW.artist, NEW.submitter, NEW.comment);
+END;
+"""
+
 CONFIG_DEFAULTS = {
     "programming_mode": "rotation",
     "rotation_tracks_per_block": "3",
@@ -111,14 +315,8 @@ CONFIG_DEFAULTS = {
     "rotation_block_start_log_id": "0",
     "skip_requested": "false",
     "last_returned_track_id": "",
-    "feature_min_tempo_bpm": "0",
-    "feature_max_tempo_bpm": "1",
-    "feature_min_rms_energy": "0",
-    "feature_max_rms_energy": "1",
-    "feature_min_spectral_centroid": "0",
-    "feature_max_spectral_centroid": "1",
-    "feature_min_zero_crossing_rate": "0",
-    "feature_max_zero_crossing_rate": "1",
+    "analysis_tier": "auto",
+    "mood_distance": "features",
 }
 
 
@@ -169,6 +367,57 @@ def init_db():
             conn.execute("ALTER TABLE push_subscriptions ADD COLUMN user_id TEXT REFERENCES users(id)")
         except sqlite3.OperationalError:
             pass  # column already exists
+        try:
+            conn.execute("ALTER TABLE tracks ADD COLUMN analysis_tier TEXT")
+        except sqlite3.OperationalError:
+            pass  # column already exists
+        try:
+            conn.execute("ALTER TABLE tracks ADD COLUMN feature_version INTEGER")
+        except sqlite3.OperationalError:
+            pass  # column already exists
+        try:
+            conn.execute("ALTER TABLE tracks ADD COLUMN embedding BLOB")
+        except sqlite3.OperationalError:
+            pass  # column already exists
+        for column in ("loudness_lufs REAL", "peak_dbfs REAL", "cue_in_s REAL", "cue_out_s REAL", "media_hash TEXT"):
+            try:
+                conn.execute(f"ALTER TABLE tracks ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass  # column already exists
+        for column in (
+            "priority INTEGER NOT NULL DEFAULT 0",
+            "source_bytes INTEGER",
+            "est_duration_s REAL",
+            "queue_wait_s REAL",
+            "stage TEXT",
+            "raw_path TEXT",
+            "converted_path TEXT",
+            "features_json TEXT",
+            "attempts INTEGER NOT NULL DEFAULT 0",
+            "next_attempt_at TEXT",
+            "transcode_mode TEXT",
+            "import_id INTEGER REFERENCES imports(id)",
+            "source_key TEXT",
+            "media_hash TEXT",
+        ):
+            try:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            except sqlite3.OperationalError:
+                pass  # column already exists
+        # At most one in-flight job per source (created here, after jobs.source_key exists)
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_source_key_inflight ON jobs(source_key)"
+            " WHERE source_key IS NOT NULL AND status IN ('pending', 'processing')"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_media_hash ON tracks(media_hash)")
+        # Tracks from before the title index are queued for it
+        conn.execute("INSERT OR IGNORE INTO title_index (track_id) SELECT id FROM tracks")
+        # Rebuilt on every start: backfills existing tracks, and the index follows tracks.rowid,
+        # which a VACUUM may renumber
+        conn.executescript(LIBRARY_SEARCH_SCHEMA)
+        conn.execute("INSERT INTO tracks_fts (tracks_fts) VALUES ('rebuild')")
+        # Normalization bounds moved from config to feature_stats
+        conn.execute("DELETE FROM config WHERE key LIKE 'feature_min_%' OR key LIKE 'feature_max_%'")
         # Backfill youtube_video_id from source_url for tracks submitted before this column existed
         rows = conn.execute(
             "SELECT id, source_url FROM tracks"
@@ -1,33 +1,37 @@
+import glob
+import json
 import logging
 import os
-import subprocess
 import time
+from collections.abc import Callable
+
+import ytdl_service
+from governor import ffmpeg_thread_args, wrap_command
+from timing import run, run_streaming
 
 logger = logging.getLogger(__name__)
 
 MEDIA_DIR = os.environ.get("MEDIA_DIR", "/media")
 COOKIES_PATH = "/app/cookies/youtube.txt"
+# Files yt-dlp leaves next to a download that aren't the audio itself
+YTDLP_SIDE_FILES = (".part", ".ytdl", ".temp")
 
+# Placeholder titles of playlist entries that can't be downloaded
+YOUTUBE_UNAVAILABLE_TITLES = {"[Deleted video]", "[Private video]"}
 
-def download_youtube(url: str, track_id: str) -> tuple[str, str, str]:
-    """
-    Download a YouTube video as MP3.
-    Returns (title, artist, output_path).
-    """
-    output_template = os.path.join(MEDIA_DIR, "raw", f"{track_id}.%(ext)s")
-    os.makedirs(os.path.join(MEDIA_DIR, "raw"), exist_ok=True)
+# The format convert_to_standard_mp3 encodes to; sources already in it are only remuxed
+HOUSE_CODEC = "mp3"
+HOUSE_BITRATE = 128000
+HOUSE_SAMPLE_RATE = 44100
+HOUSE_CHANNELS = 2
 
-    cmd = [
-        "yt-dlp",
-        "--extract-audio",
-        "--audio-format",
-        "mp3",
-        "--audio-quality",
-        "0",
-        "--output",
-        output_template,
+
+def ytdlp_args() -> list[str]:
+    """yt-dlp options for YouTube downloads as CLI arguments, without the output template and URL."""
+    args = [
+        "--format",
+        "bestaudio/best",  # "best" only for the rare video without a separate audio stream
         "--no-playlist",
-        "--write-info-json",
         "--quiet",
         "--remote-components",
         "ejs:github",
@@ -36,97 +40,182 @@ def download_youtube(url: str, track_id: str) -> tuple[str, str, str]:
         "--extractor-args",
         "youtube:player_client=web_safari",
     ]
-
     if os.path.exists(COOKIES_PATH):
-        cmd += ["--cookies", COOKIES_PATH]
-        logger.info("Using YouTube cookies")
+        args += ["--cookies", COOKIES_PATH]
+    return args
+
+
+BOT_CHECK_ERROR = "YouTube bot-check failed: upload fresh cookies.txt in the admin panel (Tools → YouTube Cookies)."
+
 
-    cmd.append(url)
+def _is_bot_check(message: str) -> bool:
+    return "Sign in to confirm" in message or "bot" in message.lower()
+
+
+def _title_and_artist(info: dict) -> tuple[str, str]:
+    title = info.get("title") or "Unknown Title"
+    # YouTube videos often have uploader as artist
+    artist = info.get("artist") or info.get("uploader") or "Unknown Artist"
+    return title, artist
+
+
+def fetch_youtube_metadata(url: str) -> tuple[str, str, float | None]:
+    """
+    Look up a YouTube video's title, artist and duration without downloading it
+    (yt-dlp's --skip-download), on ytdl_service's metadata engine. Takes seconds, where
+    the download and conversion take minutes. Returns (title, artist, duration_s).
+    """
+    try:
+        info = ytdl_service.fetch_metadata(ytdlp_args(), url, COOKIES_PATH)
+    except ytdl_service.YtdlError as e:
+        if _is_bot_check(str(e)):
+            raise RuntimeError(BOT_CHECK_ERROR) from e
+        raise RuntimeError(f"yt-dlp failed: {e}") from e
+    title, artist = _title_and_artist(info)
+    return title, artist, info.get("duration")
+
+
+def list_youtube_playlist(url: str, max_entries: int) -> tuple[str, list[dict]]:
+    """
+    Flat listing of a YouTube playlist (yt-dlp's --flat-playlist): each video's id, title,
+    channel and duration from the playlist pages alone, without visiting any video.
+    Returns (playlist_title, [{"video_id", "title", "artist", "duration_s"}]) for at most
+    max_entries videos, in playlist order.
+    """
+    args = [arg for arg in ytdlp_args() if arg != "--no-playlist"]
+    args += ["--yes-playlist", "--flat-playlist", "--playlist-items", f"1:{max_entries}"]
+    try:
+        info = ytdl_service.fetch_metadata(args, url, COOKIES_PATH, timeout=120)
+    except ytdl_service.YtdlError as e:
+        if _is_bot_check(str(e)):
+            raise RuntimeError(BOT_CHECK_ERROR) from e
+        raise RuntimeError(f"yt-dlp failed: {e}") from e
+    entries = []
+    for entry in info["entries"]:
+        if not entry["id"] or entry["title"] in YOUTUBE_UNAVAILABLE_TITLES:
+            continue
+        title, artist = _title_and_artist(entry)
+        entries.append({"video_id": entry["id"], "title": title, "artist": artist, "duration_s": entry["duration"]})
+    return info.get("title") or "YouTube playlist", entries
+
+
+def download_youtube(url: str, track_id: str) -> tuple[str, str, str]:
+    """
+    Download a YouTube video's best audio-only stream as served (usually Opus in WebM,
+    or AAC in M4A), without post-processing; convert_to_standard_mp3 is the only encode.
+    The download runs on a warm engine from ytdl_service rather than a yt-dlp process.
+    Returns (title, artist, output_path).
+    """
+    raw_dir = os.path.join(MEDIA_DIR, "raw")
+    output_template = os.path.join(raw_dir, f"{track_id}.%(ext)s")
+    os.makedirs(raw_dir, exist_ok=True)
+
+    args = ytdlp_args()
+    if "--cookies" in args:
+        logger.info("Using YouTube cookies")
 
     logger.info(f"Downloading YouTube: {url}")
     max_attempts = 3
     for attempt in range(1, max_attempts + 1):
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)  # noqa: S603
-        if result.returncode == 0:
+        try:
+            info = ytdl_service.download(args, url, output_template, COOKIES_PATH, timeout=300)
             break
-        stderr = result.stderr
-        if "Sign in to confirm" in stderr or "bot" in stderr.lower():
-            raise RuntimeError(
-                "YouTube bot-check failed: upload fresh cookies.txt in the admin panel (Tools → YouTube Cookies)."
-            )
-        if "needs to be reloaded" in stderr and attempt < max_attempts:
-            logger.warning(
-                f"yt-dlp transient error (attempt {attempt}/{max_attempts}), retrying in 3s: {stderr.strip()}"
-            )
-            time.sleep(3)
-            continue
-        raise RuntimeError(f"yt-dlp failed: {stderr}")
-
-    output_path = os.path.join(MEDIA_DIR, "raw", f"{track_id}.mp3")
-    info_path = os.path.join(MEDIA_DIR, "raw", f"{track_id}.info.json")
-
-    title = "Unknown Title"
-    artist = "Unknown Artist"
-
-    if os.path.exists(info_path):
-        import json
-
-        with open(info_path) as f:
-            info = json.load(f)
-        title = info.get("title", title)
-        # YouTube videos often have uploader as artist
-        artist = info.get("artist") or info.get("uploader") or artist
-        os.unlink(info_path)
-
-    if not os.path.exists(output_path):
-        # yt-dlp may have saved with a different extension first
-        for ext in ["webm", "m4a", "opus"]:
-            candidate = os.path.join(MEDIA_DIR, "raw", f"{track_id}.{ext}")
-            if os.path.exists(candidate):
-                output_path = candidate
-                break
-        else:
+        except ytdl_service.YtdlError as e:
+            message = str(e)
+            if _is_bot_check(message):
+                raise RuntimeError(BOT_CHECK_ERROR) from e
+            if "needs to be reloaded" in message and attempt < max_attempts:
+                logger.warning(
+                    f"yt-dlp transient error (attempt {attempt}/{max_attempts}), retrying in 3s: {message.strip()}"
+                )
+                time.sleep(3)
+                continue
+            raise RuntimeError(f"yt-dlp failed: {message}") from e
+    else:
+        raise RuntimeError("yt-dlp failed: no attempts made")
+
+    title, artist = _title_and_artist(info)
+
+    output_path = info.get("filepath")
+    if not output_path or not os.path.exists(output_path):
+        # The extension is whatever the chosen stream's container is
+        candidates = [
+            path
+            for path in glob.glob(os.path.join(glob.escape(raw_dir), f"{glob.escape(track_id)}.*"))
+            if not path.endswith(YTDLP_SIDE_FILES)
+        ]
+        if not candidates:
             raise RuntimeError(f"Downloaded file not found for track {track_id}")
+        candidates.sort(key=os.path.getmtime)
+        output_path = candidates[-1]  # newest, should an earlier attempt have left a file behind
 
     return title, artist, output_path
 
 
-def convert_to_standard_mp3(input_path: str, track_id: str, comment_tag: str, title: str = "", artist: str = "") -> str:
+def convert_to_standard_mp3(
+    input_path: str,
+    output_path: str,
+    pcm_sink: Callable[[bytes], None] | None = None,
+    pcm_rate: int = 44100,
+    pcm_channels: int = 2,
+) -> tuple[str, str]:
     """
-    Convert any audio file to standard MP3/128kbps with ID3 tags.
-    Returns the output path.
+    Convert any audio file to standard MP3/128kbps at output_path.
+    Returns (output path, transcode mode).
+
+    The source's tags are dropped and none are written apart from ffmpeg's own, so the
+    same audio always converts to the same bytes and media_store can deduplicate it.
+
+    The mode is "copy" when the source is already an MP3 in the house format: its
+    frames are remuxed unchanged (no encode, no generation loss) and only the tags are
+    rewritten. Otherwise it's "encode".
+
+    If pcm_sink is given, the same ffmpeg run also streams the decoded audio to it as
+    interleaved little-endian float32 at pcm_rate, so the source is decoded once for
+    both encoding and analysis.
     """
-    output_dir = os.path.join(MEDIA_DIR, "tracks")
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"{track_id}.mp3")
+    mode = "copy" if is_house_format(probe_audio(input_path)) else "encode"
+    if mode == "copy":
+        codec_args = ["-c:a", "copy"]
+    else:
+        codec_args = [
+            "-acodec",
+            "libmp3lame",
+            "-ab",
+            "128k",
+            "-ar",
+            str(HOUSE_SAMPLE_RATE),
+            "-ac",
+            str(HOUSE_CHANNELS),
+        ]
 
+    threads = ffmpeg_thread_args()
     cmd = [
         "ffmpeg",
+        *threads,
         "-i",
         input_path,
-        "-vn",
-        "-acodec",
-        "libmp3lame",
-        "-ab",
-        "128k",
-        "-ar",
-        "44100",
-        "-ac",
-        "2",
+        "-map",
+        "0:a:0",
+        "-map_metadata",
+        "-1",
+        *codec_args,
         "-id3v2_version",
         "3",
-        "-metadata",
-        f"comment={comment_tag}",
-        "-metadata",
-        f"title={title}",
-        "-metadata",
-        f"artist={artist}",
+        "-fflags",
+        "+bitexact",  # no encoder version tag: the bytes don't change with an ffmpeg upgrade
+        *threads,
         "-y",
         output_path,
     ]
 
-    logger.info(f"Converting {input_path} -> {output_path}")
-    result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)  # noqa: S603
+    logger.info(f"Converting {input_path} -> {output_path} ({mode})")
+    if pcm_sink is None:
+        result = run(wrap_command(cmd), timeout=300)
+    else:
+        cmd += ["-map", "0:a:0", "-ac", str(pcm_channels), "-ar", str(pcm_rate), "-f", "f32le", "pipe:1"]
+        # 1s of samples per chunk; always a whole number of float32 frames
+        result = run_streaming(wrap_command(cmd), pcm_sink, timeout=300, chunk_bytes=4 * pcm_channels * pcm_rate)
 
     if result.returncode != 0:
         raise RuntimeError(f"ffmpeg conversion failed: {result.stderr[-500:]}")
@@ -135,4 +224,47 @@ def convert_to_standard_mp3(input_path: str, track_id: str, comment_tag: str, ti
     if os.path.exists(input_path) and input_path != output_path:
         os.unlink(input_path)
 
-    return output_path
+    return output_path, mode
+
+
+def probe_audio(path: str) -> dict | None:
+    """ffprobe's description of the first audio stream, or None if it can't be probed."""
+    try:
+        result = run(
+            ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_streams", "-select_streams", "a:0", path],
+            timeout=60,
+        )
+    except OSError as e:
+        logger.warning(f"ffprobe failed for {path}: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+    streams = json.loads(result.stdout).get("streams", [])
+    return streams[0] if streams else None
+
+
+def is_house_format(stream: dict | None) -> bool:
+    """Whether an ffprobe audio stream is already what convert_to_standard_mp3 would encode."""
+    if not stream:
+        return False
+    try:
+        return (
+            stream.get("codec_name") == HOUSE_CODEC
+            and int(stream.get("bit_rate", 0)) == HOUSE_BITRATE
+            and int(stream.get("sample_rate", 0)) == HOUSE_SAMPLE_RATE
+            and int(stream.get("channels", 0)) == HOUSE_CHANNELS
+        )
+    except ValueError:
+        return False
+
+
+def probe_duration_s(path: str) -> float | None:
+    """Audio duration from ffprobe; only needed when the decode didn't count samples."""
+    result = run(["ffprobe", "-v", "quiet", "-print_format", "json", "-show_streams", path], timeout=60)
+    if result.returncode != 0:
+        return None
+    info = json.loads(result.stdout)
+    for stream in info.get("streams", []):
+        if stream.get("codec_type") == "audio":
+            return float(stream.get("duration", 0)) or None
+    return None
@@ -0,0 +1,128 @@
+"""Acoustic fingerprint index, for spotting the same song submitted twice.
+
+audio.fingerprint_hashes gives a track one hash per ~0.5 s window of its analysis window.
+The fingerprints table maps each hash to the (track, window offset) pairs it occurs at,
+so matching a new track is one indexed lookup per distinct hash, however large the
+library. Candidates are scored by offset voting: another copy of the same recording
+shares many hashes at one consistent offset, while chance collisions scatter.
+
+Tracks sharing a stored file (tracks.media_hash) are the same bytes and never reported
+against each other; the fingerprint is for different files of the same song: an upload
+and a YouTube rip, or two rips of different quality.
+"""
+
+import os
+from collections import Counter, defaultdict
+from datetime import UTC, datetime
+
+from audio import ANALYSIS_SR, FP_WINDOW_FRAMES, HOP_LENGTH
+
+WINDOW_S = FP_WINDOW_FRAMES * HOP_LENGTH / ANALYSIS_SR
+# A match needs this share of the shorter fingerprint's hashes at one offset, and at least
+# MATCH_MIN_HASHES of them
+MATCH_MIN_SCORE = float(os.environ.get("FINGERPRINT_MATCH_SCORE", "0.1"))
+MATCH_MIN_HASHES = 20
+_LOOKUP_BATCH = 500  # hashes per IN (...) query, under SQLite's variable limit
+
+
+def _now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+def _postings(fingerprint: list[int] | None) -> dict[int, list[int]]:
+    """hash -> the window offsets it occurs at, skipping silent windows."""
+    postings: dict[int, list[int]] = defaultdict(list)
+    for offset, value in enumerate(fingerprint or []):
+        if value >= 0:
+            postings[value].append(offset)
+    return postings
+
+
+def match(conn, fingerprint: list[int] | None, exclude: set[str] | None = None) -> list[dict]:
+    """Indexed tracks that sound like fingerprint, best first.
+
+    Returns [{"track_id", "score", "offset_s"}]; offset_s is where the query's start
+    falls in the matched track (negative if the query starts earlier).
+    """
+    exclude = exclude or set()
+    query = _postings(fingerprint)
+    hashes = list(query)
+    votes: Counter[tuple[str, int]] = Counter()
+    for start in range(0, len(hashes), _LOOKUP_BATCH):
+        batch = hashes[start : start + _LOOKUP_BATCH]
+        rows = conn.execute(
+            f"SELECT hash, track_id, offset FROM fingerprints WHERE hash IN ({','.join('?' * len(batch))})",  # noqa: S608
+            batch,
+        ).fetchall()
+        for row in rows:
+            if row["track_id"] not in exclude:
+                for offset in query[row["hash"]]:
+                    votes[row["track_id"], row["offset"] - offset] += 1
+
+    best: dict[str, tuple[int, int]] = {}
+    for (track_id, delta), count in votes.items():
+        if count >= MATCH_MIN_HASHES and count > best.get(track_id, (0, 0))[0]:
+            best[track_id] = (count, delta)
+    if not best:
+        return []
+    query_size = sum(len(offsets) for offsets in query.values())
+    sizes = dict(
+        conn.execute(
+            f"SELECT track_id, COUNT(*) FROM fingerprints WHERE track_id IN ({','.join('?' * len(best))})"  # noqa: S608
+            " GROUP BY track_id",
+            list(best),
+        ).fetchall()
+    )
+    matches = []
+    for track_id, (count, delta) in best.items():
+        score = count / min(query_size, sizes[track_id])
+        if score >= MATCH_MIN_SCORE:
+            matches.append({"track_id": track_id, "score": round(score, 3), "offset_s": round(delta * WINDOW_S, 1)})
+    return sorted(matches, key=lambda m: -m["score"])
+
+
+def index_track(conn, track_id: str, fingerprint: list[int] | None) -> list[dict]:
+    """(Re)index track_id, recording the library tracks it matches. Returns those matches."""
+    remove_track(conn, track_id)
+    row = conn.execute("SELECT media_hash FROM tracks WHERE id=?", (track_id,)).fetchone()
+    exclude = {track_id}
+    if row and row["media_hash"]:
+        shared = conn.execute("SELECT id FROM tracks WHERE media_hash=?", (row["media_hash"],)).fetchall()
+        exclude.update(r["id"] for r in shared)
+    matches = match(conn, fingerprint, exclude)
+    found_at = _now()
+    conn.executemany(
+        "INSERT INTO fingerprint_matches (track_id, match_id, score, offset_s, found_at) VALUES (?, ?, ?, ?, ?)",
+        [(track_id, m["track_id"], m["score"], m["offset_s"], found_at) for m in matches],
+    )
+    conn.executemany(
+        "INSERT INTO fingerprints (hash, track_id, offset) VALUES (?, ?, ?)",
+        [(value, track_id, offset) for value, offsets in _postings(fingerprint).items() for offset in offsets],
+    )
+    return matches
+
+
+def remove_track(conn, track_id: str):
+    """Drop a track's postings, and its matches in either direction."""
+    conn.execute("DELETE FROM fingerprints WHERE track_id=?", (track_id,))
+    conn.execute("DELETE FROM fingerprint_matches WHERE track_id=? OR match_id=?", (track_id, track_id))
+
+
+def matches_for(conn, track_ids: list[str]) -> list[dict]:
+    """Recorded matches involving any of track_ids, from either side.
+
+    Returns [{"track_id", "match_id", "score", "offset_s"}], track_id being the one in track_ids.
+    """
+    if not track_ids:
+        return []
+    marks = ",".join("?" * len(track_ids))
+    rows = conn.execute(
+        f"""
+        SELECT track_id, match_id, score, offset_s FROM fingerprint_matches WHERE track_id IN ({marks})
+        UNION ALL
+        SELECT match_id, track_id, score, -offset_s FROM fingerprint_matches WHERE match_id IN ({marks})
+        ORDER BY score DESC
+        """,  # noqa: S608
+        [*track_ids, *track_ids],
+    ).fetchall()
+    return [dict(r) for r in rows]
@@ -0,0 +1,121 @@
+"""Ingest throttling: how hard the worker may work, from the listener count and host load.
+
+The decision reaches subprocesses only: ffmpeg and yt-dlp get its niceness and I/O
+class through wrap_command (and the yt-dlp engines apply it to themselves), and ffmpeg
+its thread cap. Feature extraction runs in the API process and is not governed; only
+the number of concurrent jobs limits it.
+"""
+
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from metrics import get_listener_count
+
+logger = logging.getLogger(__name__)
+
+# Ingest backs off as soon as this many people are listening. With fewer (but some)
+# listeners it also backs off when the host is busy, until the load falls below
+# LOAD_RELEASE_RATIO of the threshold. The load includes ingest's own ffmpeg and
+# analysis, so with nobody listening it is ignored: there is no stream to protect.
+LISTENER_THRESHOLD = int(os.environ.get("GOVERNOR_LISTENER_THRESHOLD", "1"))
+LOAD_PER_CPU_THRESHOLD = float(os.environ.get("GOVERNOR_LOAD_PER_CPU", "1.0"))
+LOAD_RELEASE_RATIO = 0.75
+# Worker threads allowed when nobody is listening; throttled ingest always drops to one
+MAX_CONCURRENCY = max(1, int(os.environ.get("WORKER_MAX_CONCURRENCY", "1")))
+THROTTLED_NICENESS = 10
+
+_NICE = shutil.which("nice")
+_IONICE = shutil.which("ionice")
+
+
+@dataclass
+class GovernorDecision:
+    throttled: bool
+    reason: str
+    listeners: int | None
+    load_per_cpu: float
+    niceness: int  # added to ingest subprocesses (yt-dlp, ffmpeg)
+    ionice_idle: bool  # run ingest subprocesses in the idle I/O class
+    max_concurrency: int
+    ffmpeg_threads: int | None  # None lets ffmpeg choose
+    decided_at: str
+
+
+_current: GovernorDecision | None = None
+
+
+def decide() -> GovernorDecision:
+    """Re-evaluate the policy from the listener count and load average, and remember the result."""
+    global _current
+    listeners = get_listener_count()
+    load_per_cpu = os.getloadavg()[0] / (os.cpu_count() or 1)
+
+    reasons = []
+    if listeners and listeners >= LISTENER_THRESHOLD:
+        reasons.append(f"{listeners} listener(s)")
+    elif listeners is None or listeners:  # unknown (Icecast unreachable) counts as someone listening
+        # Hysteresis: once throttled, stay so until the load is well under the threshold
+        was_throttled = _current is not None and _current.throttled
+        limit = LOAD_PER_CPU_THRESHOLD * (LOAD_RELEASE_RATIO if was_throttled else 1)
+        if load_per_cpu >= limit:
+            reasons.append(
+                f"{listeners if listeners is not None else 'unknown'} listener(s), load {load_per_cpu:.2f}/cpu"
+            )
+    throttled = bool(reasons)
+
+    decision = GovernorDecision(
+        throttled=throttled,
+        reason=", ".join(reasons) if throttled else ("no listeners" if listeners == 0 else "host idle"),
+        listeners=listeners,
+        load_per_cpu=round(load_per_cpu, 2),
+        niceness=THROTTLED_NICENESS if throttled else 0,
+        ionice_idle=throttled,
+        max_concurrency=1 if throttled else MAX_CONCURRENCY,
+        ffmpeg_threads=1 if throttled else None,
+        decided_at=datetime.now(UTC).isoformat(),
+    )
+    if _current is None or _current.throttled != decision.throttled:
+        logger.info(f"Ingest governor: {'throttled' if throttled else 'full speed'} ({decision.reason})")
+    _current = decision
+    return decision
+
+
+def pin_full_speed(reason: str):
+    """Use a fixed full-speed decision in this process from now on, for work throttled some other way."""
+    global _current
+    _current = GovernorDecision(
+        throttled=False,
+        reason=reason,
+        listeners=None,
+        load_per_cpu=0.0,
+        niceness=0,
+        ionice_idle=False,
+        max_concurrency=MAX_CONCURRENCY,
+        ffmpeg_threads=None,
+        decided_at=datetime.now(UTC).isoformat(),
+    )
+
+
+def current() -> GovernorDecision:
+    """The most recent decision, deciding now if there isn't one yet."""
+    return _current or decide()
+
+
+def wrap_command(cmd: list[str]) -> list[str]:
+    """Prefix an ingest subprocess with nice/ionice according to the current decision."""
+    decision = current()
+    prefix = []
+    if decision.niceness and _NICE:
+        prefix += [_NICE, "-n", str(decision.niceness)]
+    if decision.ionice_idle and _IONICE:
+        prefix += [_IONICE, "-c", "3"]
+    return prefix + cmd
+
+
+def ffmpeg_thread_args() -> list[str]:
+    """`-threads N` for ffmpeg when the current decision caps it, otherwise nothing."""
+    threads = current().ffmpeg_threads
+    return ["-threads", str(threads)] if threads else []
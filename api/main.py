@@ -7,7 +7,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from metrics import start_metrics_poller, stop_metrics_poller
 from routers import admin, auth, internal, push, status, submit
+from scheduler import recompute_feature_stats
+from title_index import build as build_title_index
 from worker import reset_stuck_jobs, start_worker, stop_worker
+from ytdl_service import shutdown as stop_ytdl_engines
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,13 +24,17 @@ async def lifespan(app: FastAPI):
     _station_name = os.getenv("STATION_NAME", "Family Radio")
     logger.info("Starting up %s API", _station_name)
     init_db()
+    build_title_index()
+    recompute_feature_stats()
     reset_stuck_jobs()
+    submit.expire_uploads()
     start_worker()
     start_metrics_poller()
     yield
     logger.info("Shutting down %s API", _station_name)
     stop_worker()
     stop_metrics_poller()
+    stop_ytdl_engines()
 
 
 app = FastAPI(title=os.getenv("STATION_NAME", "Family Radio") + " API", lifespan=lifespan)
@@ -39,8 +46,9 @@ app.add_middleware(
     CORSMiddleware,  # ty: ignore[invalid-argument-type]
     allow_origins=_origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "DELETE", "PATCH"],
-    allow_headers=["Content-Type", "X-Admin-Token"],
+    allow_methods=["GET", "HEAD", "POST", "DELETE", "PATCH"],
+    allow_headers=["Content-Type", "X-Admin-Token", "Upload-Offset"],
+    expose_headers=["Upload-Offset", "Upload-Length"],
 )
 
 app.include_router(auth.router)
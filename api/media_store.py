@@ -0,0 +1,134 @@
+"""Content-addressed store for finished tracks.
+
+A converted MP3 is hashed (SHA-256) and stored once as tracks/{hash[:2]}/{hash}.mp3, no
+matter how many tracks play it; tracks.media_hash is the reference, and a file is only
+deleted with its last track. The files carry no per-track tags (title, artist and track
+id reach Liquidsoap as annotations), so the same audio always hashes the same.
+
+Two caches hang off the hash:
+- media: the analysis results per file, so identical audio is never analyzed twice.
+- media_sources: which file a source (jobs.source_key: an upload's SHA-256, or a YouTube
+  video id) produced, so submitting that source again skips transcode and analysis.
+"""
+
+import hashlib
+import json
+import os
+from datetime import UTC, datetime
+
+from audio import FEATURE_VERSION
+
+MEDIA_DIR = os.environ.get("MEDIA_DIR", "/media")
+STORE_DIR = os.path.join(MEDIA_DIR, "tracks")
+# Conversions are written here first; same filesystem as the store, so moving one in is atomic
+INCOMING_DIR = os.path.join(STORE_DIR, ".incoming")
+
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def _now() -> str:
+    return datetime.now(UTC).isoformat()
+
+
+def incoming_path(track_id: str) -> str:
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    return os.path.join(INCOMING_DIR, f"{track_id}.mp3")
+
+
+def path_for(media_hash: str) -> str:
+    return os.path.join(STORE_DIR, media_hash[:2], f"{media_hash}.mp3")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store(conn, path: str) -> tuple[str, str]:
+    """Move a finished conversion into the store. Returns (media hash, stored path).
+
+    If the store already holds the same bytes, the new copy is deleted instead.
+    """
+    media_hash = file_sha256(path)
+    stored = path_for(media_hash)
+    if os.path.exists(stored):
+        os.unlink(path)
+    else:
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        os.replace(path, stored)
+    conn.execute(
+        "INSERT OR IGNORE INTO media (hash, size_bytes, created_at) VALUES (?, ?, ?)",
+        (media_hash, os.path.getsize(stored), _now()),
+    )
+    return media_hash, stored
+
+
+def save_analysis(conn, media_hash: str, saved: dict):
+    """Cache a file's analysis: the job's saved dict (features, duration_s, analysis_tier, feature_version)."""
+    conn.execute("UPDATE media SET analysis_json=? WHERE hash=?", (json.dumps(saved), media_hash))
+
+
+def cached_analysis(conn, media_hash: str) -> dict | None:
+    """The file's cached analysis, if it's from the current feature version."""
+    row = conn.execute("SELECT analysis_json FROM media WHERE hash=?", (media_hash,)).fetchone()
+    saved = json.loads(row["analysis_json"]) if row and row["analysis_json"] else None
+    return saved if saved and saved.get("feature_version") == FEATURE_VERSION else None
+
+
+def save_source(conn, source_key: str, media_hash: str, title: str, artist: str):
+    conn.execute(
+        "INSERT OR REPLACE INTO media_sources (source_key, media_hash, title, artist, recorded_at)"
+        " VALUES (?, ?, ?, ?, ?)",
+        (source_key, media_hash, title, artist, _now()),
+    )
+
+
+def cached_source(conn, source_key: str) -> dict | None:
+    """What a source was last ingested as, if its file is still stored and its analysis current.
+
+    Returns {"media_hash", "path", "title", "artist", "analysis"}.
+    """
+    row = conn.execute(
+        "SELECT media_hash, title, artist FROM media_sources WHERE source_key=?", (source_key,)
+    ).fetchone()
+    if not row:
+        return None
+    path = path_for(row["media_hash"])
+    analysis = cached_analysis(conn, row["media_hash"])
+    if analysis is None or not os.path.exists(path):
+        return None
+    return {**dict(row), "path": path, "analysis": analysis}
+
+
+def hash_references(conn, media_hash: str, except_track_id: str = "") -> int:
+    """Tracks, and unfinished jobs, that reference a stored file (other than except_track_id's)."""
+    return conn.execute(
+        """
+        SELECT (SELECT COUNT(*) FROM tracks WHERE media_hash=? AND id!=?)
+             + (SELECT COUNT(*) FROM jobs WHERE media_hash=? AND track_id!=?
+                AND status IN ('pending', 'processing'))
+        """,
+        (media_hash, except_track_id, media_hash, except_track_id),
+    ).fetchone()[0]
+
+
+def unreferenced_file(conn, track_id: str) -> str | None:
+    """The file to delete along with track_id: its own, unless another track still plays it.
+
+    An unfinished job that has stored or reused the file (jobs.media_hash) also keeps it:
+    its track only references the file once the job completes. Tracks converted before
+    the store existed have no media_hash, and are matched by path.
+    """
+    row = conn.execute("SELECT file_path, media_hash FROM tracks WHERE id=?", (track_id,)).fetchone()
+    if not row or not row["file_path"]:
+        return None
+    if row["media_hash"]:
+        others = hash_references(conn, row["media_hash"], except_track_id=track_id)
+    else:
+        others = conn.execute(
+            "SELECT COUNT(*) FROM tracks WHERE file_path=? AND id!=?", (row["file_path"], track_id)
+        ).fetchone()[0]
+    return None if others else row["file_path"]
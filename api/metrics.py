@@ -19,6 +19,15 @@ def get_listener_count() -> int | None:
     return _listener_count
 
 
+def refresh_listener_count() -> int | None:
+    """Poll Icecast now and remember the result. For processes that don't run the poller."""
+    global _listener_count
+    count = _fetch_listener_count()
+    if count is not None:
+        _listener_count = count
+    return count
+
+
 def _fetch_listener_count() -> int | None:
     try:
         with urllib.request.urlopen(_ICECAST_URL, timeout=5) as resp:  # noqa: S310
@@ -56,12 +65,10 @@ def _push_cloudwatch(count: int) -> None:
 
 
 def _metrics_loop() -> None:
-    global _listener_count
     logger.info("Metrics poller started")
     while not _stop_event.is_set():
-        count = _fetch_listener_count()
+        count = refresh_listener_count()
         if count is not None:
-            _listener_count = count
             _push_cloudwatch(count)
         _stop_event.wait(timeout=_POLL_INTERVAL_S)
     logger.info("Metrics poller stopped")
@@ -19,17 +19,34 @@ class Track:
     error_msg: str | None
     submitted_at: str
     ready_at: str | None
+    analysis_tier: str | None  # 'fast' | 'full'; fast tracks are re-analyzed when the worker is idle
+    feature_version: int | None  # audio.FEATURE_VERSION that produced the features; NULL before versioning
+    loudness_lufs: float | None  # integrated loudness (EBU R128); sets the playout gain
+    peak_dbfs: float | None
+    cue_in_s: float | None  # playout skips leading and trailing silence
+    cue_out_s: float | None
 
 
 @dataclass
 class Job:
     id: int
     track_id: str
-    status: str  # 'pending' | 'processing' | 'done' | 'failed'
+    status: str  # 'pending' | 'processing' | 'done' | 'dead'
     created_at: str
     started_at: str | None
     finished_at: str | None
     error_msg: str | None
+    priority: int  # higher runs first
+    source_bytes: int | None  # upload size, used to estimate job cost
+    est_duration_s: float | None
+    queue_wait_s: float | None  # time from creation to first start
+    stage: str | None  # last completed stage: 'downloaded' | 'converted' | 'analyzed'
+    raw_path: str | None
+    converted_path: str | None
+    features_json: str | None
+    attempts: int  # failed attempts so far
+    next_attempt_at: str | None  # retry backoff: not picked before this time
+    transcode_mode: str | None  # 'copy' (source already in the house format, remuxed) | 'encode'
 
 
 @dataclass
@@ -38,3 +55,9 @@ class AudioFeatures:
     rms_energy: float
     spectral_centroid: float
     zero_crossing_rate: float
+    embedding: list[float] | None = None  # audio.EMBEDDING_DIM values: MFCC and chroma mean, then variance
+    loudness_lufs: float | None = None  # integrated loudness of the whole track (EBU R128)
+    peak_dbfs: float | None = None  # sample peak
+    cue_in_s: float | None = None  # first and last non-silent 100 ms; None if the track is all silence
+    cue_out_s: float | None = None
+    fingerprint: list[int] | None = None  # audio.fingerprint_hashes, one per ~0.5 s window (-1: silence)
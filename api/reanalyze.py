@@ -0,0 +1,163 @@
+"""Re-analyze tracks whose features came from an older audio.FEATURE_VERSION.
+
+Run inside the API container:
+
+    docker compose exec api python reanalyze.py [--workers N] [--limit N] [--all]
+
+Tracks are analyzed in parallel worker processes (one per core by default), at a low
+CPU priority. Each result is saved as soon as it's ready, so an interrupted run picks
+up where it stopped. While anyone is listening, only one track is analyzed at a time.
+Unlike ingest, the pool isn't throttled on the load average: a pool across all cores
+raises the load by itself, and its processes' niceness (THROTTLED_NICENESS, inherited
+by ffmpeg) already keeps them behind the stream and the API. The pool processes pin
+the ingest governor to full speed, so the ffmpeg they start isn't reniced on top of
+that by a decision based on the pool's own load.
+The normalization bounds are recomputed once at the end. Re-analyzed tracks are also
+(re)fingerprinted, which is how tracks from before fingerprinting get into the index.
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict
+
+from audio import FEATURE_VERSION, embedding_blob, extract_features
+from database import db, init_db
+from fingerprint_index import index_track
+from governor import LISTENER_THRESHOLD, THROTTLED_NICENESS, pin_full_speed
+from media_store import save_analysis
+from metrics import refresh_listener_count
+from scheduler import recompute_feature_stats
+
+logger = logging.getLogger("reanalyze")
+
+LISTENER_POLL_S = 30
+
+
+def stale_tracks(include_current: bool = False, limit: int | None = None) -> list:
+    """Ready tracks analyzed with an older feature version (or all ready tracks).
+
+    Tracks sharing a stored file are listed once; saving the result updates them all.
+    """
+    with db() as conn:
+        return conn.execute(
+            """
+            SELECT id, file_path, media_hash, duration_s FROM tracks
+            WHERE status='ready' AND file_path IS NOT NULL
+              AND (? OR feature_version IS NULL OR feature_version < ?)
+            GROUP BY COALESCE(media_hash, id)
+            ORDER BY MIN(ready_at)
+            LIMIT ?
+            """,
+            (include_current, FEATURE_VERSION, limit if limit is not None else -1),
+        ).fetchall()
+
+
+def _init_process():
+    # Background work: leave the CPU to the stream and the API. ffmpeg decoders inherit this.
+    os.nice(THROTTLED_NICENESS)
+    pin_full_speed("reanalyze.py pool process (niced, throttled on listeners)")
+
+
+def _analyze(file_path: str) -> dict:
+    return asdict(extract_features(file_path, "full"))
+
+
+def _save(row, features: dict):
+    with db() as conn:
+        conn.execute(
+            """
+            UPDATE tracks SET tempo_bpm=?, rms_energy=?, spectral_centroid=?, zero_crossing_rate=?,
+                embedding=?, loudness_lufs=?, peak_dbfs=?, cue_in_s=?, cue_out_s=?,
+                analysis_tier='full', feature_version=?
+            WHERE id=? OR media_hash=?
+            """,
+            (
+                features["tempo_bpm"],
+                features["rms_energy"],
+                features["spectral_centroid"],
+                features["zero_crossing_rate"],
+                embedding_blob(features["embedding"]),
+                features["loudness_lufs"],
+                features["peak_dbfs"],
+                features["cue_in_s"],
+                features["cue_out_s"],
+                FEATURE_VERSION,
+                row["id"],
+                row["media_hash"],
+            ),
+        )
+        if row["media_hash"]:
+            analysis = {**features, "duration_s": row["duration_s"], "analysis_tier": "full"}
+            save_analysis(conn, row["media_hash"], {**analysis, "feature_version": FEATURE_VERSION})
+        sharing = conn.execute("SELECT id FROM tracks WHERE id=? OR media_hash=?", (row["id"], row["media_hash"]))
+        for track in sharing.fetchall():
+            index_track(conn, track["id"], features["fingerprint"])
+
+
+def reanalyze(workers: int, include_current: bool = False, limit: int | None = None) -> tuple[int, int]:
+    """Re-analyze stale tracks. Returns (analyzed, failed)."""
+    todo = deque(stale_tracks(include_current, limit))
+    total = len(todo)
+    logger.info(f"{total} track(s) to re-analyze for feature version {FEATURE_VERSION}, {workers} process(es)")
+    if not todo:
+        return 0, 0
+
+    analyzed = failed = 0
+    in_flight: dict[Future, sqlite3.Row] = {}
+    polled_at = 0.0
+    throttled = False
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_process) as pool:
+            while todo or in_flight:
+                if time.monotonic() - polled_at >= LISTENER_POLL_S:
+                    listeners = refresh_listener_count()
+                    listening = listeners is not None and listeners >= LISTENER_THRESHOLD
+                    if listening != throttled:
+                        logger.info(f"{'Throttled' if listening else 'Full speed'}: {listeners} listener(s)")
+                    throttled = listening
+                    polled_at = time.monotonic()
+
+                while todo and len(in_flight) < (1 if throttled else workers):
+                    row = todo.popleft()
+                    in_flight[pool.submit(_analyze, row["file_path"])] = row
+
+                finished, _ = wait(in_flight, timeout=LISTENER_POLL_S, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    row = in_flight.pop(future)
+                    try:
+                        _save(row, future.result())
+                        analyzed += 1
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"Track {row['id']} failed: {e}")
+                if finished:
+                    logger.info(f"{analyzed + failed}/{total} done ({failed} failed)")
+    except KeyboardInterrupt:
+        logger.info(f"Interrupted after {analyzed} track(s); run again to continue")
+    finally:
+        if analyzed:
+            recompute_feature_stats()
+    return analyzed, failed
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Re-analyze tracks with an outdated feature version.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="analysis processes (default: cores)")
+    parser.add_argument("--limit", type=int, help="stop after this many tracks")
+    parser.add_argument("--all", action="store_true", help="re-analyze every ready track, not just stale ones")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    init_db()
+    _, failed = reanalyze(max(1, args.workers), include_current=args.all, limit=args.limit)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,74 @@
+import random
+import re
+import subprocess
+from dataclasses import dataclass
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int  # total attempts including the first; 1 means never retry
+    base_delay_s: float
+    max_delay_s: float
+
+    def delay_s(self, attempt: int) -> float:
+        """Exponential backoff after the given (1-based) failed attempt, with equal jitter."""
+        capped = min(self.max_delay_s, self.base_delay_s * 2 ** (attempt - 1))
+        return capped / 2 + random.uniform(0, capped / 2)
+
+
+POLICIES = {
+    # Needs fresh cookies from the admin; retrying only burns requests against YouTube
+    "bot_check": RetryPolicy(max_attempts=1, base_delay_s=0, max_delay_s=0),
+    # Private/removed video, missing upload, unknown source: will never succeed
+    "permanent": RetryPolicy(max_attempts=1, base_delay_s=0, max_delay_s=0),
+    # bgutil-provider restarting or briefly overloaded
+    "pot_provider": RetryPolicy(max_attempts=5, base_delay_s=30, max_delay_s=600),
+    "network": RetryPolicy(max_attempts=5, base_delay_s=60, max_delay_s=1800),
+    "ffmpeg": RetryPolicy(max_attempts=3, base_delay_s=30, max_delay_s=300),
+    "unknown": RetryPolicy(max_attempts=2, base_delay_s=120, max_delay_s=120),
+}
+
+# Specific messages only: a bare "not found" also matches transient errors such as a CDN
+# fragment's "HTTP Error 404: Not Found" or a missing binary ("ffmpeg: not found")
+_PERMANENT_MARKERS = (
+    "video unavailable",
+    "this video is not available",
+    "private video",
+    "has been removed",
+    "not available in your country",
+    "unsupported url",
+    "uploaded file not found",
+    "unknown source_type",
+)
+_TRACK_GONE = re.compile(r"\btrack \S+ not found")  # deleted while its job was queued
+_POT_PROVIDER_MARKERS = ("bgutil", "4416", "po token", "pot provider")
+_NETWORK_MARKERS = (
+    "timed out",
+    "connection reset",
+    "connection refused",
+    "remote end closed",
+    "temporary failure in name resolution",
+    "network is unreachable",
+    "http error 5",
+    "http error 429",
+    "unable to download",
+    "needs to be reloaded",
+)
+
+
+def classify(exc: BaseException) -> str:
+    """Map a job failure to a key of POLICIES."""
+    message = str(exc).lower()
+    if "bot-check failed" in message:
+        return "bot_check"
+    if isinstance(exc, subprocess.TimeoutExpired | ConnectionError | TimeoutError):
+        return "network"
+    if any(marker in message for marker in _POT_PROVIDER_MARKERS):
+        return "pot_provider"
+    if any(marker in message for marker in _PERMANENT_MARKERS) or _TRACK_GONE.search(message):
+        return "permanent"
+    if any(marker in message for marker in _NETWORK_MARKERS):
+        return "network"
+    if "ffmpeg" in message:
+        return "ffmpeg"
+    return "unknown"
@@ -1,11 +1,19 @@
 import logging
 import os
 import socket
-from datetime import UTC, datetime
+import sqlite3
+from dataclasses import asdict
+from datetime import UTC, datetime, timedelta
 
+import governor
+import timing
 from database import db, get_config, set_config
 from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile
+from fingerprint_index import remove_track
+from media_store import unreferenced_file
 from pydantic import BaseModel
+from scheduler import recompute_feature_stats
+from worker import attach_to_inflight, get_pending_jobs, get_worker_status, release_track
 
 COOKIES_PATH = "/app/cookies/youtube.txt"
 
@@ -13,6 +21,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+QUEUE_STATS_WINDOW_DAYS = 30
 
 
 def require_admin(x_admin_token: str = Header(None)):
@@ -25,6 +34,16 @@ def require_admin(x_admin_token: str = Header(None)):
 class ConfigUpdate(BaseModel):
     programming_mode: str | None = None
     rotation_tracks_per_block: int | None = None
+    analysis_tier: str | None = None
+    mood_distance: str | None = None
+
+
+class JobPriorityUpdate(BaseModel):
+    priority: int
+
+
+class RequeueRequest(BaseModel):
+    job_ids: list[int] | None = None  # None re-queues every dead job
 
 
 @router.get("/admin/config")
@@ -33,6 +52,8 @@ def get_admin_config(auth=Depends(require_admin)):
         "programming_mode": get_config("programming_mode"),
         "rotation_tracks_per_block": int(get_config("rotation_tracks_per_block")),
         "rotation_current_submitter_idx": int(get_config("rotation_current_submitter_idx")),
+        "analysis_tier": get_config("analysis_tier"),
+        "mood_distance": get_config("mood_distance"),
     }
 
 
@@ -50,6 +71,18 @@ def update_admin_config(update: ConfigUpdate, auth=Depends(require_admin)):
         set_config("rotation_tracks_per_block", str(update.rotation_tracks_per_block))
         logger.info(f"Tracks per block set to: {update.rotation_tracks_per_block}")
 
+    if update.analysis_tier is not None:
+        if update.analysis_tier not in ("auto", "fast", "full"):
+            raise HTTPException(400, "analysis_tier must be 'auto', 'fast' or 'full'")
+        set_config("analysis_tier", update.analysis_tier)
+        logger.info(f"Analysis tier set to: {update.analysis_tier}")
+
+    if update.mood_distance is not None:
+        if update.mood_distance not in ("features", "embedding"):
+            raise HTTPException(400, "mood_distance must be 'features' or 'embedding'")
+        set_config("mood_distance", update.mood_distance)
+        logger.info(f"Mood distance set to: {update.mood_distance}")
+
     return {"ok": True}
 
 
@@ -106,7 +139,9 @@ def delete_track(track_id: str, auth=Depends(require_admin)):
         if not row:
             raise HTTPException(404, "Track not found")
 
-        file_path = row["file_path"]
+        file_path = unreferenced_file(conn, track_id)  # None while another track plays the same file
+        release_track(conn, track_id)
+        remove_track(conn, track_id)
 
         conn.execute("DELETE FROM play_log WHERE track_id=?", (track_id,))
         conn.execute("DELETE FROM jobs WHERE track_id=?", (track_id,))
@@ -116,5 +151,180 @@ def delete_track(track_id: str, auth=Depends(require_admin)):
         os.unlink(file_path)
         logger.info(f"Deleted file: {file_path}")
 
+    recompute_feature_stats()
     logger.info(f"Deleted track: {track_id}")
     return {"ok": True}
+
+
+@router.get("/admin/duplicates")
+def get_duplicates(auth=Depends(require_admin)):
+    """Pairs of tracks whose audio fingerprints match: the same song, submitted twice."""
+    with db() as conn:
+        rows = conn.execute(
+            """
+            SELECT m.score, m.offset_s, m.found_at,
+                   t.id AS track_id, t.title, t.artist, t.submitter, t.source_type,
+                   o.id AS match_id, o.title AS match_title, o.artist AS match_artist,
+                   o.submitter AS match_submitter, o.source_type AS match_source_type
+            FROM fingerprint_matches m
+            JOIN tracks t ON t.id = m.track_id
+            JOIN tracks o ON o.id = m.match_id
+            ORDER BY m.found_at DESC
+            """
+        ).fetchall()
+    return {"duplicates": [dict(r) for r in rows]}
+
+
+@router.delete("/admin/duplicates/{track_id}/{match_id}")
+def dismiss_duplicate(track_id: str, match_id: str, auth=Depends(require_admin)):
+    """Dismiss a fingerprint match that isn't a duplicate (a cover, a remix)."""
+    with db() as conn:
+        conn.execute("DELETE FROM fingerprint_matches WHERE track_id=? AND match_id=?", (track_id, match_id))
+    return {"ok": True}
+
+
+@router.get("/admin/status")
+def get_admin_status(auth=Depends(require_admin)):
+    """Ingest worker state and the resource governor's current decision."""
+    return {
+        "governor": asdict(governor.decide()),
+        "worker": get_worker_status(),
+    }
+
+
+@router.get("/admin/ingest-timings")
+def get_ingest_timings(days: int = 30, auth=Depends(require_admin)):
+    """Per-stage ingest latency percentiles (p50/p90/p99) and histograms."""
+    return timing.summarize(days=days)
+
+
+@router.get("/admin/slow-jobs")
+def get_slow_jobs(limit: int = 10, days: int = 30, auth=Depends(require_admin)):
+    """Slowest recent jobs with their download/transcode/analysis/probe breakdown."""
+    return {"jobs": timing.slow_jobs(limit=min(limit, 100), days=days)}
+
+
+@router.get("/admin/queue")
+def get_queue(auth=Depends(require_admin)):
+    """Pending jobs in the order the worker will pick them, plus per-submitter queue wait times."""
+    since = (datetime.now(UTC) - timedelta(days=QUEUE_STATS_WINDOW_DAYS)).isoformat()
+    with db() as conn:
+        pending = get_pending_jobs(conn, include_delayed=True)
+        wait_rows = conn.execute(
+            """
+            SELECT t.submitter, COUNT(*) AS jobs, AVG(j.queue_wait_s) AS avg_wait_s,
+                   MAX(j.queue_wait_s) AS max_wait_s
+            FROM jobs j
+            JOIN tracks t ON t.id = j.track_id
+            WHERE j.queue_wait_s IS NOT NULL AND j.created_at >= ?
+            GROUP BY t.submitter
+            ORDER BY avg_wait_s DESC
+            """,
+            (since,),
+        ).fetchall()
+    return {
+        "pending": [
+            {
+                "job_id": r["id"],
+                "track_id": r["track_id"],
+                "title": r["title"],
+                "submitter": r["submitter"],
+                "priority": r["priority"],
+                "created_at": r["created_at"],
+                "source_bytes": r["source_bytes"],
+                "est_duration_s": r["est_duration_s"],
+                "attempts": r["attempts"],
+                "next_attempt_at": r["next_attempt_at"],
+            }
+            for r in pending
+        ],
+        "wait_by_submitter": [
+            {
+                "submitter": r["submitter"],
+                "jobs": r["jobs"],
+                "avg_wait_s": round(r["avg_wait_s"], 1),
+                "max_wait_s": round(r["max_wait_s"], 1),
+            }
+            for r in wait_rows
+        ],
+        "window_days": QUEUE_STATS_WINDOW_DAYS,
+    }
+
+
+@router.post("/admin/jobs/{job_id}/priority")
+def set_job_priority(job_id: int, update: JobPriorityUpdate, auth=Depends(require_admin)):
+    """Move a pending job up (positive) or down (negative) the queue."""
+    if not (-10 <= update.priority <= 10):
+        raise HTTPException(400, "priority must be -10 to 10")
+    with db() as conn:
+        cur = conn.execute(
+            "UPDATE jobs SET priority=? WHERE id=? AND status='pending'",
+            (update.priority, job_id),
+        )
+    if cur.rowcount == 0:
+        raise HTTPException(404, "Pending job not found")
+    logger.info(f"Job {job_id} priority set to {update.priority}")
+    return {"ok": True}
+
+
+@router.get("/admin/jobs/dead")
+def list_dead_jobs(auth=Depends(require_admin)):
+    """Jobs that exhausted their retries (or failed before retries existed)."""
+    with db() as conn:
+        rows = conn.execute(
+            """
+            SELECT j.id, j.track_id, j.attempts, j.finished_at, j.error_msg,
+                   t.title, t.submitter, t.source_url
+            FROM jobs j
+            JOIN tracks t ON t.id = j.track_id
+            WHERE j.status IN ('dead', 'failed')
+            ORDER BY j.finished_at DESC
+            """
+        ).fetchall()
+    return {
+        "jobs": [
+            {
+                "job_id": r["id"],
+                "track_id": r["track_id"],
+                "title": r["title"],
+                "submitter": r["submitter"],
+                "source_url": r["source_url"],
+                "attempts": r["attempts"],
+                "finished_at": r["finished_at"],
+                "error_msg": r["error_msg"],
+            }
+            for r in rows
+        ]
+    }
+
+
+@router.post("/admin/jobs/requeue-dead")
+def requeue_dead_jobs(req: RequeueRequest, auth=Depends(require_admin)):
+    """Put dead jobs back in the queue with a fresh retry budget."""
+    with db() as conn:
+        rows = conn.execute("SELECT id, track_id, source_key FROM jobs WHERE status IN ('dead', 'failed')").fetchall()
+        if req.job_ids is not None:
+            wanted = set(req.job_ids)
+            rows = [r for r in rows if r["id"] in wanted]
+        for r in rows:
+            followers = [
+                f["track_id"] for f in conn.execute("SELECT track_id FROM job_followers WHERE job_id=?", (r["id"],))
+            ]
+            try:
+                conn.execute(
+                    "UPDATE jobs SET status='pending', attempts=0, next_attempt_at=NULL, finished_at=NULL,"
+                    " error_msg=NULL WHERE id=?",
+                    (r["id"],),
+                )
+            except sqlite3.IntegrityError:
+                # The same source was submitted again and is in flight: join that job instead
+                conn.execute("DELETE FROM job_followers WHERE job_id=?", (r["id"],))
+                for track_id in [r["track_id"], *followers]:
+                    attach_to_inflight(conn, r["source_key"], track_id)
+                    conn.execute("UPDATE tracks SET error_msg=NULL WHERE id=?", (track_id,))
+                conn.execute("DELETE FROM jobs WHERE id=?", (r["id"],))
+                continue
+            for track_id in [r["track_id"], *followers]:
+                conn.execute("UPDATE tracks SET status='pending', error_msg=NULL WHERE id=?", (track_id,))
+    logger.info(f"Re-queued {len(rows)} dead job(s)")
+    return {"ok": True, "requeued": len(rows)}
@@ -1,6 +1,7 @@
 import logging
 from datetime import UTC, datetime
 
+from audio import playout_gain_db
 from database import db
 from fastapi import APIRouter
 from fastapi.responses import PlainTextResponse
@@ -15,12 +16,38 @@ def _now() -> str:
 
 
 def _build_annotate_uri(track: dict) -> str:
-    """Build a Liquidsoap annotate URI embedding title and artist from the DB."""
+    """Build a Liquidsoap annotate URI embedding track id, title and artist from the DB.
+
+    The track id is annotated because a file can be shared by several tracks (the same
+    source submitted twice), so the comment tag written at conversion doesn't identify it.
+
+    Tracks with measured loudness and cue points also get liq_amplify (gain to the
+    target loudness), liq_cue_in and liq_cue_out, so playout needs no analysis of its own.
+    """
 
     def esc(s: str) -> str:
         return (s or "").replace("\\", "\\\\").replace('"', '\\"')
 
-    return f'annotate:title="{esc(track["title"])}",artist="{esc(track["artist"])}":{track["file_path"]}'
+    annotations = [
+        f'track_id="{esc(track["id"])}"',
+        f'title="{esc(track["title"])}"',
+        f'artist="{esc(track["artist"])}"',
+    ]
+    gain_db = playout_gain_db(track.get("loudness_lufs"), track.get("peak_dbfs"))
+    if gain_db is not None:
+        annotations.append(f'liq_amplify="{gain_db:.2f} dB"')
+    if track.get("cue_in_s") is not None and track.get("cue_out_s") is not None:
+        annotations.append(f'liq_cue_in="{track["cue_in_s"]:.3f}"')
+        annotations.append(f'liq_cue_out="{track["cue_out_s"]:.3f}"')
+    return f"annotate:{','.join(annotations)}:{track['file_path']}"
+
+
+def _playout_params(track_id: str) -> dict:
+    with db() as conn:
+        row = conn.execute(
+            "SELECT loudness_lufs, peak_dbfs, cue_in_s, cue_out_s FROM tracks WHERE id=?", (track_id,)
+        ).fetchone()
+    return dict(row) if row else {}
 
 
 @router.get("/internal/next-track", response_class=PlainTextResponse)
@@ -30,7 +57,7 @@ def next_track():
     if not track:
         logger.info("next-track returning: '' (no track available)")
         return ""
-    uri = _build_annotate_uri(track)
+    uri = _build_annotate_uri({**track, **_playout_params(track["id"])})
     logger.info(f"next-track returning: {uri!r}")
     return uri
 
@@ -1,5 +1,6 @@
 import logging
 import os
+import re
 
 from database import db
 from fastapi import APIRouter, Depends, HTTPException
@@ -10,6 +11,10 @@ from routers.auth import require_user
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+LIBRARY_PAGE_MAX = 100
+# bm25 column weights for title, artist, submitter, comment
+LIBRARY_SEARCH_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
 
 def _track_row_to_dict(row) -> dict:
     return {
@@ -108,6 +113,19 @@ def get_library(user: dict = Depends(require_user)):
     return {"tracks": [_track_row_to_dict(r) for r in rows]}
 
 
+def _library_row_to_dict(row) -> dict:
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "artist": row["artist"],
+        "submitter": row["submitter"],
+        "submitted_at": row["submitted_at"],
+        "duration_s": row["duration_s"],
+        "play_count": row["play_count"],
+        "user_id": row["user_id"],
+    }
+
+
 @router.get("/public-library")
 def get_public_library(user: dict = Depends(require_user)):
     """Ready tracks with play counts, ordered by submitter then title."""
@@ -123,21 +141,49 @@ def get_public_library(user: dict = Depends(require_user)):
             ORDER BY t.submitter COLLATE NOCASE, t.title COLLATE NOCASE
             """
         ).fetchall()
-    return {
-        "tracks": [
-            {
-                "id": r["id"],
-                "title": r["title"],
-                "artist": r["artist"],
-                "submitter": r["submitter"],
-                "submitted_at": r["submitted_at"],
-                "duration_s": r["duration_s"],
-                "play_count": r["play_count"],
-                "user_id": r["user_id"],
-            }
-            for r in rows
-        ]
-    }
+    return {"tracks": [_library_row_to_dict(r) for r in rows]}
+
+
+def _match_expression(q: str) -> str | None:
+    """An FTS5 query matching tracks that have every word of q as a word prefix."""
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{word}"*' for word in words) if words else None
+
+
+@router.get("/library/search")
+def search_library(q: str = "", limit: int = 50, offset: int = 0, user: dict = Depends(require_user)):
+    """A page of ready tracks matching q by word prefix in title, artist, submitter or comment, best first.
+
+    Without q, pages through the library ordered by submitter then title, as /public-library.
+    """
+    limit = max(1, min(limit, LIBRARY_PAGE_MAX))
+    offset = max(0, offset)
+    columns = """
+        t.id, t.title, t.artist, t.submitter, t.submitted_at, t.duration_s, t.user_id,
+        (SELECT COUNT(*) FROM play_log pl WHERE pl.track_id = t.id) AS play_count
+    """
+    match = _match_expression(q)
+    with db() as conn:
+        if match:
+            found = (
+                "FROM tracks_fts f JOIN tracks t ON t.rowid = f.rowid WHERE tracks_fts MATCH ? AND t.status = 'ready'"
+            )
+            total = conn.execute(f"SELECT COUNT(*) {found}", (match,)).fetchone()[0]  # noqa: S608
+            rows = conn.execute(
+                f"SELECT {columns} {found} ORDER BY bm25(tracks_fts, ?, ?, ?, ?) LIMIT ? OFFSET ?",  # noqa: S608
+                (match, *LIBRARY_SEARCH_WEIGHTS, limit, offset),
+            ).fetchall()
+        else:
+            total = conn.execute("SELECT COUNT(*) FROM tracks WHERE status = 'ready'").fetchone()[0]
+            rows = conn.execute(
+                f"""
+                SELECT {columns} FROM tracks t WHERE t.status = 'ready'
+                ORDER BY t.submitter COLLATE NOCASE, t.title COLLATE NOCASE
+                LIMIT ? OFFSET ?
+                """,  # noqa: S608
+                (limit, offset),
+            ).fetchall()
+    return {"tracks": [_library_row_to_dict(r) for r in rows], "total": total, "offset": offset, "limit": limit}
 
 
 @router.get("/submitters")
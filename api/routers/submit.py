@@ -1,14 +1,33 @@
-import difflib
+import asyncio
+import glob
+import json
 import logging
 import os
-import re
+import sqlite3
 import uuid
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
 from urllib.parse import parse_qs, urlparse
 
+import aiofiles
 from database import db
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from downloader import list_youtube_playlist
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import JSONResponse
+from fingerprint_index import matches_for, remove_track
+from media_store import file_sha256, unreferenced_file
+from pydantic import BaseModel
+from scheduler import recompute_feature_stats
+from starlette.requests import ClientDisconnect
+from title_index import similar_tracks
+from upload_stream import SNIFF_BYTES, StreamedUpload, UploadRejected, check_audio, receive_upload
+from worker import (
+    PENDING_PLACEHOLDER,
+    attach_to_inflight,
+    release_track,
+    request_metadata,
+    source_key,
+    wake_metadata_lane,
+)
 
 from routers.auth import require_user
 
@@ -19,7 +38,16 @@ MEDIA_DIR = os.environ.get("MEDIA_DIR", "/media")
 ALLOWED_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".ogg", ".opus"}
 YOUTUBE_HOSTS = {"youtube.com", "www.youtube.com", "youtu.be", "m.youtube.com"}
 MAX_FILE_SIZE = 200 * 1024 * 1024  # 200MB
-MAX_PENDING_PER_SUBMITTER = 5
+MAX_PENDING_PER_SUBMITTER = 5  # single submissions; imported tracks don't count
+# New tracks one playlist import may queue, and the gap between their jobs' first attempts
+IMPORT_BUDGET = int(os.environ.get("PLAYLIST_IMPORT_BUDGET", "25"))
+IMPORT_SPACING_S = float(os.environ.get("PLAYLIST_IMPORT_SPACING_S", "30"))
+IMPORT_MAX_LISTED = 500  # playlist entries listed per import
+# Resumable uploads (/uploads): the chunk size suggested to clients (PATCH takes any),
+# how long an unfinished one is kept after its last chunk, and how many a user may have open
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_EXPIRE_S = float(os.environ.get("UPLOAD_EXPIRE_HOURS", "24")) * 3600
+MAX_OPEN_UPLOADS = 3
 
 
 DUPLICATE_SIMILARITY_THRESHOLD = 0.75
@@ -41,10 +69,19 @@ def _extract_youtube_video_id(url: str) -> str | None:
     return None
 
 
-def _normalize_title(text: str) -> str:
-    text = text.lower()
-    text = re.sub(r"[\(\[][^\)\]]*[\)\]]", "", text)
-    return " ".join(text.split())
+class PlaylistImportRequest(BaseModel):
+    submitter: str
+    playlist_url: str
+    comment: str | None = None
+
+
+class UploadCreateRequest(BaseModel):
+    submitter: str
+    filename: str
+    length: int
+    title: str | None = None
+    artist: str | None = None
+    comment: str | None = None
 
 
 def _create_track_and_job(
@@ -58,7 +95,16 @@ def _create_track_and_job(
     comment: str | None = None,
     youtube_video_id: str | None = None,
     user_id: str | None = None,
-):
+    source_bytes: int | None = None,
+    est_duration_s: float | None = None,
+    key: str | None = None,
+) -> int | None:
+    """Insert a pending track and its job.
+
+    With a source key, a submission of a source that is already being ingested gets no
+    job of its own: the track attaches to the in-flight job and the id of that job is
+    returned (None otherwise).
+    """
     conn.execute(
         """
         INSERT INTO tracks (id, title, artist, submitter, source_type, source_url,
@@ -67,9 +113,31 @@ def _create_track_and_job(
         """,
         (track_id, title, artist, submitter, source_type, source_url, _now(), comment, youtube_video_id, user_id),
     )
-    conn.execute(
-        "INSERT INTO jobs (track_id, status, created_at) VALUES (?, 'pending', ?)",
-        (track_id, _now()),
+    if key is not None and (job_id := attach_to_inflight(conn, key, track_id)) is not None:
+        return job_id
+    try:
+        conn.execute(
+            "INSERT INTO jobs (track_id, status, created_at, source_bytes, est_duration_s, source_key)"
+            " VALUES (?, 'pending', ?, ?, ?, ?)",
+            (track_id, _now(), source_bytes, est_duration_s, key),
+        )
+    except sqlite3.IntegrityError:
+        # A concurrent submission of the same source created the job first
+        if key is None or (job_id := attach_to_inflight(conn, key, track_id)) is None:
+            raise
+        return job_id
+    return None
+
+
+def _attached_response(track_id: str, job_id: int) -> JSONResponse:
+    logger.info(f"Submission {track_id} attached to in-flight job {job_id}")
+    return JSONResponse(
+        {
+            "track_id": track_id,
+            "status": "pending",
+            "attached_to_job": job_id,
+            "warning": "Someone else just submitted this song too. You're both credited, and it's only added once.",
+        }
     )
 
 
@@ -100,59 +168,45 @@ def check_duplicate(
                     }
                 )
 
+        if not matches and video_id and not title:
+            # Fuzzy-match on the video's title if the metadata lane has looked it up
+            cached = conn.execute(
+                "SELECT title, artist FROM youtube_metadata WHERE video_id = ? AND status = 'done'",
+                (video_id,),
+            ).fetchone()
+            if cached:
+                title, artist = cached["title"], artist or cached["artist"]
+
         if not matches and title:
-            norm_query_title = _normalize_title(title)
-            norm_query_artist = _normalize_title(artist) if artist else None
-            rows = conn.execute(
-                "SELECT id, title, artist, submitter FROM tracks WHERE status != 'failed' AND title != ''"
-            ).fetchall()
-            candidates = []
-            for row in rows:
-                norm_title = _normalize_title(row["title"])
-                title_sim = difflib.SequenceMatcher(None, norm_query_title, norm_title).ratio()
-                if norm_query_artist and row["artist"]:
-                    artist_sim = difflib.SequenceMatcher(
-                        None, norm_query_artist, _normalize_title(row["artist"])
-                    ).ratio()
-                    sim = title_sim * 0.8 + artist_sim * 0.2
-                else:
-                    sim = title_sim
-                if sim >= DUPLICATE_SIMILARITY_THRESHOLD:
-                    candidates.append(
-                        {
-                            "id": row["id"],
-                            "title": row["title"],
-                            "artist": row["artist"],
-                            "submitter": row["submitter"],
-                            "similarity": round(sim, 3),
-                            "match_type": "fuzzy",
-                        }
-                    )
-            candidates.sort(key=lambda x: x["similarity"], reverse=True)
-            matches = candidates[:DUPLICATE_MAX_RESULTS]
+            for found in similar_tracks(conn, title, artist, DUPLICATE_SIMILARITY_THRESHOLD, DUPLICATE_MAX_RESULTS):
+                matches.append({**found, "match_type": "fuzzy"})
+
+        # Tracks that sound like a match are the same song under another title or source
+        seen = {m["id"] for m in matches}
+        sounds_like = []
+        for found in matches_for(conn, list(seen)):
+            if found["match_id"] in seen:
+                continue
+            seen.add(found["match_id"])
+            row = conn.execute(
+                "SELECT id, title, artist, submitter FROM tracks WHERE id = ?", (found["match_id"],)
+            ).fetchone()
+            if row:
+                sounds_like.append({**dict(row), "similarity": found["score"], "match_type": "fingerprint"})
+        matches += sounds_like[:DUPLICATE_MAX_RESULTS]
 
     return {"matches": matches}
 
 
-@router.post("/submit")
-async def submit_track(
-    submitter: str = Form(...),
-    youtube_url: str = Form(None),
-    title: str = Form(None),
-    artist: str = Form(None),
-    file: UploadFile = File(None),
-    comment: str | None = Form(None),
-    user: dict = Depends(require_user),
-):
-    if not submitter or not submitter.strip():
-        raise HTTPException(400, "submitter is required")
-
-    submitter = submitter.strip()[:50]
-    comment = comment.strip()[:280] if comment and comment.strip() else None
-
+def _check_pending(submitter: str):
+    """Refuse a single submission from someone with MAX_PENDING_PER_SUBMITTER songs in progress."""
     with db() as conn:
         pending = conn.execute(
-            "SELECT COUNT(*) FROM tracks WHERE submitter=? AND status IN ('pending', 'processing')",
+            """
+            SELECT COUNT(*) FROM tracks t
+            WHERE t.submitter=? AND t.status IN ('pending', 'processing')
+              AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.track_id = t.id AND j.import_id IS NOT NULL)
+            """,
             (submitter,),
         ).fetchone()[0]
     if pending >= MAX_PENDING_PER_SUBMITTER:
@@ -161,77 +215,488 @@ async def submit_track(
             f"You already have {pending} songs being processed. Please wait for them to finish before adding more.",
         )
 
-    # Determine source
-    has_file = bool(file is not None and file.filename)
-    has_youtube = youtube_url and youtube_url.strip()
 
-    if sum([has_file, bool(has_youtube)]) != 1:
-        raise HTTPException(400, "Provide exactly one of: file or youtube_url")
+def _submit_upload(
+    track_id: str,
+    dest: str,
+    filename: str,
+    size: int,
+    sha256: str,
+    submitter: str,
+    title: str | None,
+    artist: str | None,
+    comment: str | None,
+    user: dict,
+) -> JSONResponse:
+    """Queue an uploaded file, already saved at dest (MEDIA_DIR/raw/{track_id}{ext}), as a new track."""
+    track_title = (title or os.path.splitext(filename)[0])[:200]
+    track_artist = (artist or submitter)[:200]
 
-    track_id = str(uuid.uuid4())
+    with db() as conn:
+        attached_to = _create_track_and_job(
+            conn,
+            track_id,
+            track_title,
+            track_artist,
+            submitter,
+            "upload",
+            comment=comment,
+            user_id=user["id"],
+            source_bytes=size,
+            key=source_key("upload", sha256),
+        )
+    if attached_to is not None:
+        os.unlink(dest)  # the job works from the first submitter's identical copy
+        return _attached_response(track_id, attached_to)
 
-    if has_file:
-        assert file is not None and file.filename is not None
-        ext = os.path.splitext(file.filename)[1].lower()
+    logger.info(f"Upload submission: track_id={track_id} file={dest}")
+    return JSONResponse({"track_id": track_id, "status": "pending"})
+
+
+@router.post("/submit")
+async def submit_track(request: Request, user: dict = Depends(require_user)):
+    """Submit a file upload or a YouTube URL (multipart form: submitter, file or youtube_url, title, artist, comment).
+
+    An upload is streamed straight to MEDIA_DIR/raw as it arrives (upload_stream). The
+    checks that can be made before its data (submitter, pending limit, extension) are
+    made as soon as its part starts, when the fields before it have been read.
+    """
+    track_id = str(uuid.uuid4())
+    checked: list[str] = []  # the submitter already checked against the pending limit
+
+    def file_destination(filename: str, fields: dict[str, str]) -> str:
+        submitter = (fields.get("submitter") or "").strip()[:50]
+        if submitter:
+            _check_pending(submitter)
+            checked.append(submitter)
+        ext = os.path.splitext(filename)[1].lower()
         if ext not in ALLOWED_EXTENSIONS:
             raise HTTPException(400, f"Unsupported file type: {ext}")
-
         raw_dir = os.path.join(MEDIA_DIR, "raw")
         os.makedirs(raw_dir, exist_ok=True)
-        dest = os.path.join(raw_dir, f"{track_id}{ext}")
-
-        size = 0
-        with open(dest, "wb") as f_out:
-            while chunk := await file.read(65536):
-                size += len(chunk)
-                if size > MAX_FILE_SIZE:
-                    os.unlink(dest)
-                    raise HTTPException(413, "File too large (max 200MB)")
-                f_out.write(chunk)
-
-        track_title = (title or os.path.splitext(file.filename)[0])[:200]
-        track_artist = (artist or submitter)[:200]
-
-        with db() as conn:
-            _create_track_and_job(
-                conn,
-                track_id,
-                track_title,
-                track_artist,
-                submitter,
-                "upload",
-                comment=comment,
-                user_id=user["id"],
-            )
-
-        logger.info(f"Upload submission: track_id={track_id} file={dest}")
-        return JSONResponse({"track_id": track_id, "status": "pending"})
+        return os.path.join(raw_dir, f"{track_id}{ext}")
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        try:
+            upload = await receive_upload(request, file_destination, MAX_FILE_SIZE)
+        except UploadRejected as e:
+            raise HTTPException(e.status_code, e.detail) from None
+        fields = upload.fields
+    else:
+        upload = StreamedUpload()  # a url-encoded form can't carry a file
+        fields = {k: v for k, v in (await request.form()).items() if isinstance(v, str)}
+
+    try:
+        submitter = (fields.get("submitter") or "").strip()
+        if not submitter:
+            raise HTTPException(400, "submitter is required")
+        submitter = submitter[:50]
+        if submitter not in checked:
+            _check_pending(submitter)
+        comment = (fields.get("comment") or "").strip()[:280] or None
+        title = fields.get("title") or None
+        artist = fields.get("artist") or None
+        youtube_url = (fields.get("youtube_url") or "").strip()
+        if (upload.filename is not None) == bool(youtube_url):
+            raise HTTPException(400, "Provide exactly one of: file or youtube_url")
+    except HTTPException:
+        if upload.path is not None:
+            os.unlink(upload.path)
+        raise
+
+    if upload.filename is not None:
+        assert upload.path is not None and upload.sha256 is not None
+        return _submit_upload(
+            track_id, upload.path, upload.filename, upload.size, upload.sha256, submitter, title, artist, comment, user
+        )
 
-    elif has_youtube:
-        url = youtube_url.strip()
+    else:
+        url = youtube_url
         if urlparse(url).netloc.lower() not in YOUTUBE_HOSTS:
             raise HTTPException(400, "Only YouTube URLs are supported (youtube.com, youtu.be)")
 
         video_id = _extract_youtube_video_id(url)
 
+        # Title, artist and duration come from the metadata lane within seconds (or from its
+        # cache right away), long before the download finishes
         with db() as conn:
-            _create_track_and_job(
+            metadata = (request_metadata(conn, video_id, url) if video_id else None) or {}
+            attached_to = _create_track_and_job(
                 conn,
                 track_id,
-                title or "Pending...",
-                artist or "Pending...",
+                title or metadata.get("title") or PENDING_PLACEHOLDER,
+                artist or metadata.get("artist") or PENDING_PLACEHOLDER,
                 submitter,
                 "youtube",
                 url,
                 comment=comment,
                 youtube_video_id=video_id,
                 user_id=user["id"],
+                est_duration_s=metadata.get("duration_s"),
+                key=source_key("youtube", video_id) if video_id else None,
             )
+        if video_id and not metadata:
+            wake_metadata_lane()
+        if attached_to is not None:
+            return _attached_response(track_id, attached_to)
 
         logger.info(f"YouTube submission: track_id={track_id} url={url}")
         return JSONResponse({"track_id": track_id, "status": "pending"})
 
-    raise HTTPException(400, "Provide exactly one of: file or youtube_url")  # unreachable
+
+# Resumable uploads, after the tus protocol (tus.io): POST /uploads declares the file,
+# PATCH /uploads/{id} appends chunks at the offset the server has (HEAD tells it after a
+# dropped connection), and POST /uploads/{id}/finish queues it like a /submit upload.
+# Uploads with a PATCH or /finish in progress; the API runs as a single process.
+_writing: set[str] = set()
+
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(MEDIA_DIR, "raw", f"upload-{upload_id}.part")
+
+
+def _offset_headers(offset: int, length: int) -> dict[str, str]:
+    return {"Upload-Offset": str(offset), "Upload-Length": str(length), "Cache-Control": "no-store"}
+
+
+def _get_upload(conn, upload_id: str, user: dict):
+    row = conn.execute("SELECT * FROM uploads WHERE id=? AND user_id=?", (upload_id, user["id"])).fetchone()
+    if not row:
+        raise HTTPException(404, "Upload not found")
+    return row
+
+
+def _discard_upload(conn, upload_id: str):
+    conn.execute("DELETE FROM uploads WHERE id=?", (upload_id,))
+    path = _part_path(upload_id)
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+def expire_uploads():
+    """Delete unfinished uploads not written to for UPLOAD_EXPIRE_HOURS, and stray partial files as old."""
+    cutoff = datetime.now(UTC) - timedelta(seconds=UPLOAD_EXPIRE_S)
+    with db() as conn:
+        expired = conn.execute("SELECT id FROM uploads WHERE updated_at < ?", (cutoff.isoformat(),)).fetchall()
+        expired = [row["id"] for row in expired if row["id"] not in _writing]
+        for upload_id in expired:
+            _discard_upload(conn, upload_id)
+        live = {row["id"] for row in conn.execute("SELECT id FROM uploads").fetchall()}
+    # Left by an upload whose row is gone (its user was deleted)
+    strays = [
+        path
+        for path in glob.glob(os.path.join(glob.escape(os.path.join(MEDIA_DIR, "raw")), "upload-*.part"))
+        if os.path.basename(path)[len("upload-") : -len(".part")] not in live
+        and os.path.getmtime(path) < cutoff.timestamp()
+    ]
+    for path in strays:
+        os.unlink(path)
+    if expired or strays:
+        logger.info(f"Expired {len(expired)} unfinished upload(s), removed {len(strays)} stray partial file(s)")
+
+
+async def _sniff_part(upload_id: str) -> tuple[str, str | None]:
+    """Container and codec of an upload's first bytes; an upload that isn't audio is discarded."""
+    async with aiofiles.open(_part_path(upload_id), "rb") as f:
+        head = await f.read(SNIFF_BYTES)
+    try:
+        sniffed = check_audio(head)
+    except UploadRejected as e:
+        with db() as conn:
+            _discard_upload(conn, upload_id)
+        raise HTTPException(e.status_code, e.detail) from None
+    with db() as conn:
+        conn.execute("UPDATE uploads SET container=?, codec=? WHERE id=?", (*sniffed, upload_id))
+    return sniffed
+
+
+@router.post("/uploads", status_code=201)
+def create_upload(req: UploadCreateRequest, user: dict = Depends(require_user)):
+    """Start a resumable upload of a req.length-byte file; its data goes to PATCH /uploads/{upload_id}."""
+    submitter = req.submitter.strip()[:50]
+    if not submitter:
+        raise HTTPException(400, "submitter is required")
+    ext = os.path.splitext(req.filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(400, f"Unsupported file type: {ext}")
+    if req.length <= 0:
+        raise HTTPException(400, "The file is empty")
+    if req.length > MAX_FILE_SIZE:
+        raise HTTPException(413, "File too large (max 200MB)")
+    _check_pending(submitter)
+    expire_uploads()
+
+    upload_id = str(uuid.uuid4())
+    with db() as conn:
+        open_uploads = conn.execute("SELECT COUNT(*) FROM uploads WHERE user_id=?", (user["id"],)).fetchone()[0]
+        if open_uploads >= MAX_OPEN_UPLOADS:
+            raise HTTPException(429, f"You have {open_uploads} unfinished uploads. Finish or cancel one first.")
+        conn.execute(
+            """
+            INSERT INTO uploads (id, user_id, submitter, filename, length, title, artist, comment,
+                                 created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                upload_id,
+                user["id"],
+                submitter,
+                os.path.basename(req.filename),
+                req.length,
+                req.title or None,
+                req.artist or None,
+                (req.comment or "").strip()[:280] or None,
+                _now(),
+                _now(),
+            ),
+        )
+        os.makedirs(os.path.join(MEDIA_DIR, "raw"), exist_ok=True)
+        with open(_part_path(upload_id), "wb") as f:
+            f.truncate(req.length)  # sparse: takes no disk space until the data arrives
+    logger.info(f"Resumable upload {upload_id} started: {req.filename} ({req.length} bytes)")
+    return {"upload_id": upload_id, "offset": 0, "length": req.length, "chunk_size": UPLOAD_CHUNK_SIZE}
+
+
+@router.head("/uploads/{upload_id}")
+def upload_offset(upload_id: str, user: dict = Depends(require_user)):
+    """How much of the upload has arrived, in Upload-Offset: where to resume."""
+    with db() as conn:
+        row = _get_upload(conn, upload_id, user)
+    return Response(headers=_offset_headers(row["offset"], row["length"]))
+
+
+@router.patch("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, user: dict = Depends(require_user)):
+    """Write the request body into the upload at Upload-Offset, which must be the upload's current offset.
+
+    Whatever arrives is kept, even when the connection drops part way through.
+    """
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(415, "Expected Content-Type: application/offset+octet-stream")
+    try:
+        offset = int(request.headers["upload-offset"])
+    except (KeyError, ValueError):
+        raise HTTPException(400, "Upload-Offset header is required") from None
+    with db() as conn:
+        row = _get_upload(conn, upload_id, user)
+    if upload_id in _writing:
+        raise HTTPException(409, "This upload is already being written")
+    if offset != row["offset"]:
+        headers = _offset_headers(row["offset"], row["length"])
+        raise HTTPException(409, f"The upload is at offset {row['offset']}", headers=headers)
+
+    _writing.add(upload_id)
+    try:
+        async with aiofiles.open(_part_path(upload_id), "r+b") as out:
+            await out.seek(offset)
+            try:
+                async for chunk in request.stream():
+                    if offset + len(chunk) > row["length"]:
+                        raise HTTPException(413, f"The upload is only {row['length']} bytes")
+                    await out.write(chunk)
+                    offset += len(chunk)
+            except ClientDisconnect:
+                pass  # keep what arrived; the client resumes from the new offset
+            finally:
+                # Only count data as received once it is on disk
+                await out.flush()
+                await asyncio.to_thread(os.fsync, out.fileno())
+                with db() as conn:
+                    conn.execute("UPDATE uploads SET offset=?, updated_at=? WHERE id=?", (offset, _now(), upload_id))
+        if row["container"] is None and offset >= min(SNIFF_BYTES, row["length"]):
+            await _sniff_part(upload_id)
+    finally:
+        _writing.discard(upload_id)
+    return Response(status_code=204, headers=_offset_headers(offset, row["length"]))
+
+
+@router.post("/uploads/{upload_id}/finish")
+async def finish_upload(upload_id: str, user: dict = Depends(require_user)):
+    """Queue a fully received upload as a new track, like a file sent to /submit."""
+    with db() as conn:
+        row = _get_upload(conn, upload_id, user)
+    if upload_id in _writing:
+        raise HTTPException(409, "This upload is still being written")
+    if row["offset"] < row["length"]:
+        headers = _offset_headers(row["offset"], row["length"])
+        raise HTTPException(409, f"Only {row['offset']} of {row['length']} bytes have arrived", headers=headers)
+    _check_pending(row["submitter"])  # the upload is kept, to finish later
+
+    _writing.add(upload_id)
+    try:
+        container, codec = (row["container"], row["codec"]) if row["container"] else await _sniff_part(upload_id)
+        sha256 = await asyncio.to_thread(file_sha256, _part_path(upload_id))
+        track_id = str(uuid.uuid4())
+        dest = os.path.join(MEDIA_DIR, "raw", f"{track_id}{os.path.splitext(row['filename'])[1].lower()}")
+        os.replace(_part_path(upload_id), dest)
+        with db() as conn:
+            conn.execute("DELETE FROM uploads WHERE id=?", (upload_id,))
+    finally:
+        _writing.discard(upload_id)
+    logger.info(f"Resumable upload {upload_id} finished: {row['length']} bytes, {container}/{codec or 'unknown codec'}")
+    return _submit_upload(
+        track_id,
+        dest,
+        row["filename"],
+        row["length"],
+        sha256,
+        row["submitter"],
+        row["title"],
+        row["artist"],
+        row["comment"],
+        user,
+    )
+
+
+@router.delete("/uploads/{upload_id}")
+async def cancel_upload(upload_id: str, user: dict = Depends(require_user)):
+    """Abandon an unfinished upload and delete what has arrived."""
+    with db() as conn:
+        _get_upload(conn, upload_id, user)
+        if upload_id in _writing:
+            raise HTTPException(409, "This upload is being written")
+        _discard_upload(conn, upload_id)
+    logger.info(f"Resumable upload {upload_id} cancelled")
+    return {"ok": True}
+
+
+@router.post("/import/playlist")
+def import_playlist(req: PlaylistImportRequest, user: dict = Depends(require_user)):
+    """Queue every video of a YouTube playlist that isn't in the library yet.
+
+    The playlist is listed flat (one request per page, no per-video lookups), the listing
+    is deduplicated against the library in one query, and all tracks and jobs are
+    inserted in one transaction. At most IMPORT_BUDGET tracks are queued per import, and
+    their jobs become eligible IMPORT_SPACING_S apart so the import trickles into the
+    worker instead of flooding it (and YouTube). A submitter can run one import at a time.
+    """
+    submitter = req.submitter.strip()[:50]
+    if not submitter:
+        raise HTTPException(400, "submitter is required")
+    comment = req.comment.strip()[:280] if req.comment and req.comment.strip() else None
+    url = req.playlist_url.strip()
+    parsed = urlparse(url)
+    if parsed.netloc.lower() not in YOUTUBE_HOSTS or not parse_qs(parsed.query).get("list"):
+        raise HTTPException(400, "Provide a YouTube playlist URL (one with a list= parameter)")
+
+    with db() as conn:
+        running = conn.execute(
+            """
+            SELECT COUNT(*) FROM jobs j JOIN tracks t ON t.id = j.track_id
+            WHERE t.submitter=? AND j.import_id IS NOT NULL AND j.status IN ('pending', 'processing')
+            """,
+            (submitter,),
+        ).fetchone()[0]
+    if running:
+        raise HTTPException(
+            429,
+            f"Your last playlist import still has {running} songs to process. Please wait for it to finish.",
+        )
+
+    try:
+        playlist_title, entries = list_youtube_playlist(url, IMPORT_MAX_LISTED)
+    except RuntimeError as e:
+        raise HTTPException(502, f"Could not list the playlist: {e}") from e
+
+    # A playlist can hold the same video twice; keep the first
+    unique, seen = [], set()
+    for entry in entries:
+        if entry["video_id"] not in seen:
+            seen.add(entry["video_id"])
+            unique.append(entry)
+    now = datetime.now(UTC)
+    with db() as conn:
+        known = {
+            row[0]
+            for row in conn.execute(
+                "SELECT youtube_video_id FROM tracks"
+                " WHERE status != 'failed' AND youtube_video_id IN (SELECT value FROM json_each(?))",
+                (json.dumps([entry["video_id"] for entry in unique]),),
+            )
+        }
+        new = [entry for entry in unique if entry["video_id"] not in known]
+        queued = new[:IMPORT_BUDGET]
+        import_id = conn.execute(
+            """
+            INSERT INTO imports (source_url, playlist_title, submitter, user_id, created_at,
+                                 listed, queued, duplicates, over_budget)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                url,
+                playlist_title,
+                submitter,
+                user["id"],
+                now.isoformat(),
+                len(entries),
+                len(queued),
+                len(unique) - len(new),
+                len(new) - len(queued),
+            ),
+        ).lastrowid
+        track_ids = [str(uuid.uuid4()) for _ in queued]
+        conn.executemany(
+            """
+            INSERT INTO tracks (id, title, artist, submitter, source_type, source_url,
+                                status, submitted_at, comment, youtube_video_id, user_id)
+            VALUES (?, ?, ?, ?, 'youtube', ?, 'pending', ?, ?, ?, ?)
+            """,
+            [
+                (
+                    track_id,
+                    entry["title"],
+                    entry["artist"],
+                    submitter,
+                    f"https://www.youtube.com/watch?v={entry['video_id']}",
+                    now.isoformat(),
+                    comment,
+                    entry["video_id"],
+                    user["id"],
+                )
+                for track_id, entry in zip(track_ids, queued, strict=True)
+            ],
+        )
+        # A video with an in-flight job (say, submitted on its own while the playlist was
+        # being listed) gets no second job: its track follows that one, as in
+        # _create_track_and_job. The unique source_key index would reject the insert.
+        jobs = []
+        attached = 0
+        for track_id, entry in zip(track_ids, queued, strict=True):
+            key = source_key("youtube", entry["video_id"])
+            if attach_to_inflight(conn, key, track_id) is not None:
+                attached += 1
+                continue
+            jobs.append(
+                (
+                    track_id,
+                    now.isoformat(),
+                    entry["duration_s"],
+                    (now + timedelta(seconds=len(jobs) * IMPORT_SPACING_S)).isoformat(),
+                    import_id,
+                    key,
+                )
+            )
+        conn.executemany(
+            """
+            INSERT INTO jobs (track_id, status, created_at, est_duration_s, next_attempt_at, import_id, source_key)
+            VALUES (?, 'pending', ?, ?, ?, ?, ?)
+            """,
+            jobs,
+        )
+
+    logger.info(
+        f"Playlist import {import_id} by {submitter}: {len(entries)} listed, {len(queued)} queued "
+        f"({attached} attached to in-flight jobs), {len(unique) - len(new)} already in the library, "
+        f"{len(new) - len(queued)} over budget ({url})"
+    )
+    return {
+        "import_id": import_id,
+        "playlist_title": playlist_title,
+        "queued": len(queued),
+        "duplicates": len(unique) - len(new),
+        "over_budget": len(new) - len(queued),
+        "track_ids": track_ids,
+    }
 
 
 @router.delete("/track/{track_id}")
@@ -243,7 +708,9 @@ def delete_own_track(track_id: str, user: dict = Depends(require_user)):
             raise HTTPException(404, "Track not found")
         if row["user_id"] != user["id"]:
             raise HTTPException(403, "You can only delete your own tracks")
-        file_path = row["file_path"]
+        file_path = unreferenced_file(conn, track_id)  # None while another track plays the same file
+        release_track(conn, track_id)
+        remove_track(conn, track_id)
         conn.execute("DELETE FROM play_log WHERE track_id = ?", (track_id,))
         conn.execute("DELETE FROM jobs WHERE track_id = ?", (track_id,))
         conn.execute("DELETE FROM tracks WHERE id = ?", (track_id,))
@@ -251,5 +718,6 @@ def delete_own_track(track_id: str, user: dict = Depends(require_user)):
     if file_path and os.path.exists(file_path):
         os.unlink(file_path)
         logger.info("Deleted file: %s", file_path)
+    recompute_feature_stats()
     logger.info("User %s deleted track: %s", user["id"], track_id)
     return {"ok": True}
@@ -1,9 +1,11 @@
 import logging
 import math
 import random
+import threading
 from datetime import UTC, datetime, timedelta
 
-from audio import AudioFeatures, euclidean_distance, normalize_features
+import numpy as np
+from audio import EMBEDDING_DIM, EMBEDDING_DTYPE, FEATURE_NAMES, cosine_distances, embedding_matrix, normalize_matrix
 from database import db, get_config, set_config
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,18 @@ logger = logging.getLogger(__name__)
 COOLDOWN_THRESHOLD_S = 3600  # activate when total library runtime exceeds 60 min
 COOLDOWN_WINDOW_S = 3600  # don't replay a track within 60 min
 
+# Mood normalization bounds: these percentiles of the library, so one mis-detected
+# outlier can't squash everyone else into a corner of the mood space
+BOUNDS_PERCENTILES = (5, 95)
+# Bounds are only rewritten (and the mood matrix re-normalized) when one moves by more
+# than this fraction of its current range
+BOUNDS_TOLERANCE = 0.02
+
+# Normalized feature vectors keyed by (track id, raw features), valid for _mood_bounds
+_mood_lock = threading.Lock()
+_mood_bounds: tuple[np.ndarray, np.ndarray] | None = None
+_mood_vectors: dict[tuple, np.ndarray] = {}
+
 
 def _total_ready_runtime_s() -> float:
     with db() as conn:
@@ -196,12 +210,17 @@ def _pick_rotation_track(depth: int = 0) -> dict | None:
 
 
 def _pick_mood_track() -> dict | None:
-    """Pick track with minimum Euclidean distance from the last played track."""
+    """Pick the track closest to the last played track.
+
+    The mood_distance config chooses the measure: Euclidean distance between the four
+    normalized features, or cosine distance between embeddings. Embedding mode falls
+    back to the features while the last track or every candidate still lacks one.
+    """
     # Get the last played track's features
     with db() as conn:
         last_row = conn.execute(
             """
-            SELECT t.tempo_bpm, t.rms_energy, t.spectral_centroid, t.zero_crossing_rate
+            SELECT t.id, t.tempo_bpm, t.rms_energy, t.spectral_centroid, t.zero_crossing_rate, t.embedding
             FROM play_log pl
             JOIN tracks t ON pl.track_id = t.id
             WHERE t.tempo_bpm IS NOT NULL
@@ -215,29 +234,6 @@ def _pick_mood_track() -> dict | None:
         logger.info("No play history for mood matching, falling back to rotation")
         return _pick_rotation_track()
 
-    last_features = AudioFeatures(
-        tempo_bpm=last_row["tempo_bpm"],
-        rms_energy=last_row["rms_energy"],
-        spectral_centroid=last_row["spectral_centroid"],
-        zero_crossing_rate=last_row["zero_crossing_rate"],
-    )
-
-    # Load normalization bounds from config
-    mins = {
-        "tempo_bpm": float(get_config("feature_min_tempo_bpm")),
-        "rms_energy": float(get_config("feature_min_rms_energy")),
-        "spectral_centroid": float(get_config("feature_min_spectral_centroid")),
-        "zero_crossing_rate": float(get_config("feature_min_zero_crossing_rate")),
-    }
-    maxs = {
-        "tempo_bpm": float(get_config("feature_max_tempo_bpm")),
-        "rms_energy": float(get_config("feature_max_rms_energy")),
-        "spectral_centroid": float(get_config("feature_max_spectral_centroid")),
-        "zero_crossing_rate": float(get_config("feature_max_zero_crossing_rate")),
-    }
-
-    last_vec = normalize_features(last_features, mins, maxs)
-
     # Compute how many distinct recently-played tracks to exclude.
     # Scales with library size so small libraries always have at least one candidate.
     with db() as conn:
@@ -252,7 +248,7 @@ def _pick_mood_track() -> dict | None:
         rows = conn.execute(
             f"""
             SELECT t.id, t.title, t.artist, t.file_path, t.tempo_bpm, t.rms_energy,
-                   t.spectral_centroid, t.zero_crossing_rate
+                   t.spectral_centroid, t.zero_crossing_rate, t.embedding
             FROM tracks t
             WHERE t.status='ready' AND t.tempo_bpm IS NOT NULL
               AND t.id NOT IN (
@@ -268,56 +264,122 @@ def _pick_mood_track() -> dict | None:
         # No candidates with features; try rotation
         return _pick_rotation_track()
 
-    best_id = None
-    best_title = None
-    best_artist = None
-    best_path = None
-    best_dist = float("inf")
-
-    for row in rows:
-        features = AudioFeatures(
-            tempo_bpm=row["tempo_bpm"],
-            rms_energy=row["rms_energy"],
-            spectral_centroid=row["spectral_centroid"],
-            zero_crossing_rate=row["zero_crossing_rate"],
-        )
-        vec = normalize_features(features, mins, maxs)
-        dist = euclidean_distance(last_vec, vec)
-        if dist < best_dist:
-            best_dist = dist
-            best_id = row["id"]
-            best_title = row["title"]
-            best_artist = row["artist"]
-            best_path = row["file_path"]
-
-    if not best_id:
-        return None
+    measure = "embedding"
+    distances = _embedding_distances(last_row, rows) if get_config("mood_distance") == "embedding" else None
+    if distances is None:
+        measure = "features"
+        bounds = load_feature_bounds()
+        if bounds is None:
+            recompute_feature_stats()
+            bounds = load_feature_bounds()
+        if bounds is None:
+            return _pick_rotation_track()
+        vectors = _mood_matrix([last_row, *rows], bounds)
+        distances = np.linalg.norm(vectors[1:] - vectors[0], axis=1)
+    best = int(np.argmin(distances))
+    best_id = rows[best]["id"]
+    best_dist = float(distances[best])
+
     set_config("last_returned_track_id", best_id)
-    logger.info(f"Mood: picked track with distance={best_dist:.4f}")
+    logger.info(f"Mood: picked track with {measure} distance={best_dist:.4f}")
     return {
         "id": best_id,
-        "title": best_title,
-        "artist": best_artist,
-        "file_path": best_path,
+        "title": rows[best]["title"],
+        "artist": rows[best]["artist"],
+        "file_path": rows[best]["file_path"],
     }
 
 
-def update_feature_bounds(features: AudioFeatures):
-    """Update running min/max for each audio feature in config."""
-    fields = {
-        "tempo_bpm": features.tempo_bpm,
-        "rms_energy": features.rms_energy,
-        "spectral_centroid": features.spectral_centroid,
-        "zero_crossing_rate": features.zero_crossing_rate,
-    }
-    for name, val in fields.items():
-        current_min = float(get_config(f"feature_min_{name}"))
-        current_max = float(get_config(f"feature_max_{name}"))
-        # On first real value (still at defaults 0/1), use the actual value as seed
-        # but keep expanding from there
-        new_min = min(current_min, val)
-        new_max = max(current_max, val)
-        if new_min != current_min:
-            set_config(f"feature_min_{name}", str(new_min))
-        if new_max != current_max:
-            set_config(f"feature_max_{name}", str(new_max))
+def _embedding_distances(last_row, rows: list) -> np.ndarray | None:
+    """Cosine distance from last_row's embedding to each row's; inf for rows without one.
+
+    None when last_row has no embedding or no row does.
+    """
+    size = EMBEDDING_DIM * np.dtype(EMBEDDING_DTYPE).itemsize
+    if not last_row["embedding"] or len(last_row["embedding"]) != size:
+        return None
+    usable = np.array([bool(r["embedding"]) and len(r["embedding"]) == size for r in rows])
+    if not usable.any():
+        return None
+    distances = np.full(len(rows), np.inf)
+    candidates = embedding_matrix([r["embedding"] for r, ok in zip(rows, usable, strict=True) if ok])
+    distances[usable] = cosine_distances(embedding_matrix([last_row["embedding"]])[0], candidates)
+    return distances
+
+
+def _mood_matrix(rows: list, bounds: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    """Normalized feature vectors for rows, one per row.
+
+    Vectors are cached until the bounds change, so a new or re-analyzed track only
+    normalizes its own row.
+    """
+    global _mood_bounds, _mood_vectors
+    lo, hi = bounds
+    keys = [(r["id"], *(r[name] for name in FEATURE_NAMES)) for r in rows]
+    with _mood_lock:
+        if _mood_bounds is None or not (np.array_equal(_mood_bounds[0], lo) and np.array_equal(_mood_bounds[1], hi)):
+            _mood_bounds = bounds
+            _mood_vectors = {}
+        missing = [key for key in keys if key not in _mood_vectors]
+        if missing:
+            normalized = normalize_matrix(np.array([key[1:] for key in missing], dtype=float), lo, hi)
+            _mood_vectors.update(zip(missing, normalized, strict=True))
+        # Keep only what this pick used, so deleted and re-analyzed tracks don't accumulate
+        _mood_vectors = {key: _mood_vectors[key] for key in keys}
+        return np.array([_mood_vectors[key] for key in keys])
+
+
+def load_feature_bounds() -> tuple[np.ndarray, np.ndarray] | None:
+    """(lo, hi) arrays in FEATURE_NAMES order, or None before the first recompute."""
+    with db() as conn:
+        rows = {r["feature"]: r for r in conn.execute("SELECT feature, lo, hi FROM feature_stats")}
+    if not all(name in rows for name in FEATURE_NAMES):
+        return None
+    return (
+        np.array([rows[name]["lo"] for name in FEATURE_NAMES]),
+        np.array([rows[name]["hi"] for name in FEATURE_NAMES]),
+    )
+
+
+def recompute_feature_stats() -> bool:
+    """Recompute the percentile bounds from every analyzed ready track in one pass.
+
+    Called after each ingest, re-analysis or deletion. The stored bounds only change
+    when one moves by more than BOUNDS_TOLERANCE of its range, and are cleared when no
+    analyzed ready track is left. Returns True if they changed.
+    """
+    with db() as conn:
+        values = np.array(
+            [
+                tuple(r)
+                for r in conn.execute(
+                    f"SELECT {', '.join(FEATURE_NAMES)} FROM tracks WHERE status='ready' AND tempo_bpm IS NOT NULL"  # noqa: S608
+                )
+            ],
+            dtype=float,
+        )
+        if not len(values):
+            # The last analyzed track is gone: drop its bounds rather than keep normalizing
+            # future tracks against them, and let the first new ingest set fresh ones
+            cleared = conn.execute("DELETE FROM feature_stats").rowcount
+            if cleared:
+                logger.info("Feature bounds cleared: no analyzed ready tracks")
+            return bool(cleared)
+        lo, hi = np.percentile(values, BOUNDS_PERCENTILES, axis=0)
+
+        current = {r["feature"]: r for r in conn.execute("SELECT feature, lo, hi FROM feature_stats")}
+        if all(name in current for name in FEATURE_NAMES):
+            cur_lo = np.array([current[name]["lo"] for name in FEATURE_NAMES])
+            cur_hi = np.array([current[name]["hi"] for name in FEATURE_NAMES])
+            allowed = BOUNDS_TOLERANCE * (cur_hi - cur_lo)
+            if not (np.any(np.abs(lo - cur_lo) > allowed) or np.any(np.abs(hi - cur_hi) > allowed)):
+                return False
+
+        now = datetime.now(UTC).isoformat()
+        conn.executemany(
+            "INSERT OR REPLACE INTO feature_stats (feature, lo, hi, track_count, updated_at) VALUES (?, ?, ?, ?, ?)",
+            [(name, float(lo[i]), float(hi[i]), len(values), now) for i, name in enumerate(FEATURE_NAMES)],
+        )
+    summary = ", ".join(f"{name} {lo[i]:.4g}-{hi[i]:.4g}" for i, name in enumerate(FEATURE_NAMES))
+    logger.info(f"Feature bounds updated from {len(values)} tracks: {summary}")
+    return True
@@ -0,0 +1,326 @@
+import logging
+import os
+import resource
+import subprocess
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+
+import numpy as np
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Upper bucket edges (seconds) for the per-stage latency histograms
+HISTOGRAM_BUCKETS_S = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+
+_local = threading.local()
+# Stages being timed right now, across threads: VmHWM is per process, so the API's own
+# peak RSS only belongs to a stage that had the process to itself
+_active: list["StageTiming"] = []
+_active_lock = threading.Lock()
+
+
+@dataclass
+class StageTiming:
+    stage: str
+    input_bytes: int | None = None
+    child_peak_rss_kb: int = 0
+    child_cpu_s: float = 0.0
+    overlapped: bool = False  # another stage ran at some point during this one
+
+
+def _thread_cpu_s() -> float:
+    """CPU used so far by this thread."""
+    own = resource.getrusage(resource.RUSAGE_THREAD)
+    return own.ru_utime + own.ru_stime
+
+
+def _reset_peak_rss():
+    """Reset this process's VmHWM so it reflects only the stage about to run (Linux 4.0+)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass  # not Linux, or not permitted; peak then covers the whole process lifetime
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextmanager
+def stage_timer(job_id: int, track_id: str, stage: str, input_path: str | None = None):
+    """Time one pipeline stage and store it in job_timings when it completes.
+
+    Records wall time, CPU time, peak RSS and input size. Callers that only learn the
+    input size inside the block can set it on the yielded StageTiming. Failed stages
+    are not recorded.
+
+    Stages run concurrently (several worker threads, fast-tier upgrades), so nothing
+    process-wide is attributed to a stage. CPU time is this thread's plus that of the
+    subprocesses the stage started through run() and run_streaming(), each from its own
+    os.wait4 usage; warm yt-dlp engines (ytdl_service) aren't included. Peak RSS is the
+    largest of those subprocesses, or the API process's own peak if that is larger and
+    no other stage overlapped this one. An overlapped stage with no subprocess of its
+    own gets NULL. The metadata lane isn't a stage and can still raise the process peak.
+    """
+    timing = StageTiming(stage=stage)
+    if input_path and os.path.exists(input_path):
+        timing.input_bytes = os.path.getsize(input_path)
+    with _active_lock:
+        if _active:
+            timing.overlapped = True
+            for other in _active:
+                other.overlapped = True
+        else:
+            _reset_peak_rss()
+        _active.append(timing)
+    _local.timing = timing
+    wall_start = time.monotonic()
+    cpu_start = _thread_cpu_s()
+    try:
+        yield timing
+    finally:
+        _local.timing = None
+        with _active_lock:
+            _active[:] = [t for t in _active if t is not timing]
+    wall_s = time.monotonic() - wall_start
+    cpu_s = _thread_cpu_s() - cpu_start + timing.child_cpu_s
+    own_peak_kb = 0 if timing.overlapped else _peak_rss_kb()
+    peak_rss_kb = max(own_peak_kb, timing.child_peak_rss_kb) or None
+    with db() as conn:
+        conn.execute(
+            """
+            INSERT INTO job_timings (job_id, track_id, stage, wall_s, cpu_s, peak_rss_kb, input_bytes, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (job_id, track_id, stage, wall_s, cpu_s, peak_rss_kb, timing.input_bytes, datetime.now(UTC).isoformat()),
+        )
+    peak = f"{peak_rss_kb // 1024} MB" if peak_rss_kb else "unknown (overlapped)"
+    logger.info(f"Job {job_id} stage {stage}: {wall_s:.1f}s wall, {cpu_s:.1f}s cpu, peak {peak}")
+
+
+def run(cmd: list[str], timeout: float) -> subprocess.CompletedProcess:
+    """subprocess.run(cmd, capture_output=True, text=True, timeout=...) that also measures the child.
+
+    The child is reaped with os.wait4 so its peak RSS can be attributed to the active
+    stage_timer, which subprocess.run cannot report.
+    """
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) as proc:  # noqa: S603
+        stdout_pipe, stderr_pipe = _pipes(proc)
+        output = {}
+        readers = [
+            threading.Thread(target=lambda name=name, pipe=pipe: output.__setitem__(name, pipe.read()), daemon=True)
+            for name, pipe in (("stdout", stdout_pipe), ("stderr", stderr_pipe))
+        ]
+        for reader in readers:
+            reader.start()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.monotonic() > deadline:
+                proc.kill()
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                for reader in readers:
+                    reader.join()
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            time.sleep(0.05)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+        for reader in readers:
+            reader.join()
+
+    _note_child_usage(usage)
+    return subprocess.CompletedProcess(cmd, proc.returncode, output.get("stdout", ""), output.get("stderr", ""))
+
+
+def run_streaming(
+    cmd: list[str], on_stdout: Callable[[bytes], None], timeout: float, chunk_bytes: int = 1 << 16
+) -> subprocess.CompletedProcess:
+    """Like run(), but passes stdout to on_stdout in chunks as it arrives instead of buffering it.
+
+    Chunks are exactly chunk_bytes long except the last. stdout in the result is empty;
+    stderr is decoded text.
+    """
+    timed_out = threading.Event()
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:  # noqa: S603
+        stdout_pipe, stderr_pipe = _pipes(proc)
+        stderr = []
+        reader = threading.Thread(target=lambda: stderr.append(stderr_pipe.read()), daemon=True)
+        reader.start()
+
+        def _kill():
+            timed_out.set()
+            proc.kill()
+
+        watchdog = threading.Timer(timeout, _kill)
+        watchdog.start()
+        try:
+            while chunk := stdout_pipe.read(chunk_bytes):
+                on_stdout(chunk)
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            watchdog.cancel()
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            reader.join()
+
+    _note_child_usage(usage)
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    return subprocess.CompletedProcess(cmd, proc.returncode, b"", b"".join(stderr).decode(errors="replace"))
+
+
+def _pipes(proc: subprocess.Popen):
+    if proc.stdout is None or proc.stderr is None:
+        raise RuntimeError("subprocess started without stdout/stderr pipes")
+    return proc.stdout, proc.stderr
+
+
+def _note_child_usage(usage):
+    """Attribute a reaped child's CPU time and peak RSS to this thread's stage_timer, if any."""
+    timing = getattr(_local, "timing", None)
+    if timing is not None:
+        timing.child_peak_rss_kb = max(timing.child_peak_rss_kb, usage.ru_maxrss)
+        timing.child_cpu_s += usage.ru_utime + usage.ru_stime
+
+
+def summarize(days: int = 30) -> dict:
+    """Per-stage latency percentiles and histogram over the last `days` days."""
+    since = (datetime.now(UTC) - timedelta(days=days)).isoformat()
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT stage, wall_s, peak_rss_kb FROM job_timings WHERE recorded_at >= ?",
+            (since,),
+        ).fetchall()
+
+    by_stage: dict[str, list] = {}
+    for r in rows:
+        by_stage.setdefault(r["stage"], []).append(r)
+
+    stages = {}
+    for stage, stage_rows in by_stage.items():
+        wall = np.array([r["wall_s"] for r in stage_rows])
+        rss = [r["peak_rss_kb"] for r in stage_rows if r["peak_rss_kb"]]
+        p50, p90, p99 = np.percentile(wall, [50, 90, 99])
+        counts = np.histogram(wall, bins=[0, *HISTOGRAM_BUCKETS_S, np.inf])[0]
+        stages[stage] = {
+            "count": len(stage_rows),
+            "p50_s": round(float(p50), 2),
+            "p90_s": round(float(p90), 2),
+            "p99_s": round(float(p99), 2),
+            "max_peak_rss_mb": round(max(rss) / 1024, 1) if rss else None,
+            "histogram": [
+                {"le_s": le, "count": int(n)} for le, n in zip([*HISTOGRAM_BUCKETS_S, "inf"], counts, strict=True)
+            ],
+        }
+    return {"window_days": days, "stages": stages, "transcode": _transcode_summary(since)}
+
+
+def _transcode_summary(since: str) -> dict:
+    """How often the transcode was a remux, and the CPU that saved.
+
+    CPU is compared per minute of audio, since encode cost scales with duration. The
+    saving is what the copied jobs would have cost at the encode rate, minus what they
+    did cost (both include the analysis that runs alongside).
+    """
+    with db() as conn:
+        rows = conn.execute(
+            """
+            SELECT j.transcode_mode AS mode, COUNT(*) AS n, SUM(jt.cpu_s) AS cpu_s, SUM(t.duration_s) AS audio_s
+            FROM job_timings jt
+            JOIN jobs j ON j.id = jt.job_id
+            JOIN tracks t ON t.id = jt.track_id
+            WHERE jt.stage='transcode' AND jt.recorded_at >= ? AND j.transcode_mode IS NOT NULL
+              AND t.duration_s > 0 AND jt.cpu_s IS NOT NULL
+            GROUP BY j.transcode_mode
+            """,
+            (since,),
+        ).fetchall()
+    by_mode = {r["mode"]: r for r in rows}
+    total = sum(r["n"] for r in rows)
+
+    def cpu_per_audio_min(mode: str) -> float | None:
+        r = by_mode.get(mode)
+        return r["cpu_s"] / r["audio_s"] * 60 if r else None
+
+    encode_rate = cpu_per_audio_min("encode")
+    copy_rate = cpu_per_audio_min("copy")
+    cpu_saved_s = None
+    if encode_rate is not None and copy_rate is not None:
+        cpu_saved_s = round((encode_rate - copy_rate) * by_mode["copy"]["audio_s"] / 60, 1)
+    return {
+        "jobs": total,
+        "copied": by_mode["copy"]["n"] if "copy" in by_mode else 0,
+        "bypass_rate": round(by_mode["copy"]["n"] / total, 3) if "copy" in by_mode else 0.0,
+        "encode_cpu_s_per_audio_min": round(encode_rate, 2) if encode_rate is not None else None,
+        "copy_cpu_s_per_audio_min": round(copy_rate, 2) if copy_rate is not None else None,
+        "cpu_saved_s": cpu_saved_s,
+    }
+
+
+def slow_jobs(limit: int = 10, days: int = 30) -> list[dict]:
+    """The slowest recent jobs by total stage time, with their per-stage breakdown."""
+    since = (datetime.now(UTC) - timedelta(days=days)).isoformat()
+    with db() as conn:
+        jobs = conn.execute(
+            """
+            SELECT jt.job_id, jt.track_id, t.title, t.submitter, t.source_type,
+                   SUM(jt.wall_s) AS total_s, MAX(jt.recorded_at) AS finished_at
+            FROM job_timings jt
+            LEFT JOIN tracks t ON t.id = jt.track_id
+            WHERE jt.recorded_at >= ?
+            GROUP BY jt.job_id
+            ORDER BY total_s DESC
+            LIMIT ?
+            """,
+            (since, limit),
+        ).fetchall()
+        result = []
+        for job in jobs:
+            stages = conn.execute(
+                """
+                SELECT stage, wall_s, cpu_s, peak_rss_kb, input_bytes FROM job_timings
+                WHERE job_id=? ORDER BY id
+                """,
+                (job["job_id"],),
+            ).fetchall()
+            result.append(
+                {
+                    "job_id": job["job_id"],
+                    "track_id": job["track_id"],
+                    "title": job["title"],
+                    "submitter": job["submitter"],
+                    "source_type": job["source_type"],
+                    "total_s": round(job["total_s"], 2),
+                    "finished_at": job["finished_at"],
+                    "stages": [
+                        {
+                            "stage": s["stage"],
+                            "wall_s": round(s["wall_s"], 2),
+                            "cpu_s": round(s["cpu_s"], 2) if s["cpu_s"] is not None else None,
+                            "peak_rss_mb": round(s["peak_rss_kb"] / 1024, 1) if s["peak_rss_kb"] else None,
+                            "input_bytes": s["input_bytes"],
+                        }
+                        for s in stages
+                    ],
+                }
+            )
+    return result
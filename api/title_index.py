@@ -0,0 +1,115 @@
+"""Trigram index over normalized track titles, for the fuzzy duplicate check.
+
+The check runs on a debounced keystroke timer, and scoring every title in the library
+with difflib on each call is too slow for a large library. title_trigrams maps each
+trigram of a normalized title (padded like pg_trgm's, so short titles have some) to the
+tracks containing it. A lookup shortlists the SHORTLIST_SIZE tracks whose titles share
+the largest fraction of the query's trigrams (Dice coefficient), and only those are
+scored with difflib, against the same threshold as before. A title similar enough to
+pass shares most of its trigrams with the query, so it ranks near the top of the
+shortlist; it could only be missed if more than SHORTLIST_SIZE other titles overlapped
+the query more closely.
+
+Triggers on tracks keep the index current: an inserted or retitled track is queued
+(title_index.trigram_count NULL) and a deleted one drops its postings. build() indexes
+the whole backlog once at startup (after an upgrade, the entire library), and sync()
+indexes whatever was queued since at the start of each lookup, so no writer of tracks
+has to call in here and no check pays for more than the tracks changed since the last.
+"""
+
+import difflib
+import logging
+import re
+import time
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+SHORTLIST_SIZE = 200
+# An artist match can only add this much to a title's similarity
+ARTIST_WEIGHT = 0.2
+
+
+def normalize_title(text: str) -> str:
+    text = text.lower()
+    text = re.sub(r"[\(\[][^\)\]]*[\)\]]", "", text)
+    return " ".join(text.split())
+
+
+def trigrams(normalized: str) -> set[str]:
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def sync(conn) -> int:
+    """Index queued tracks: those inserted or retitled since the last lookup. Returns how many."""
+    rows = conn.execute(
+        "SELECT i.track_id, t.title FROM title_index i JOIN tracks t ON t.id = i.track_id WHERE i.trigram_count IS NULL"
+    ).fetchall()
+    if not rows:
+        return 0
+    grams = {r["track_id"]: trigrams(normalize_title(r["title"] or "")) for r in rows}
+    conn.executemany("DELETE FROM title_trigrams WHERE track_id=?", [(track_id,) for track_id in grams])
+    conn.executemany(
+        "INSERT INTO title_trigrams (trigram, track_id) VALUES (?, ?)",
+        [(gram, track_id) for track_id, track_grams in grams.items() for gram in track_grams],
+    )
+    conn.executemany(
+        "UPDATE title_index SET trigram_count=? WHERE track_id=?",
+        [(len(track_grams), track_id) for track_id, track_grams in grams.items()],
+    )
+    return len(rows)
+
+
+def build():
+    """Index every queued track at startup, so the first duplicate check doesn't have to."""
+    start = time.perf_counter()
+    with db() as conn:
+        count = sync(conn)
+    if count:
+        logger.info(f"Title index: indexed {count} tracks in {time.perf_counter() - start:.1f}s")
+
+
+def shortlist(conn, normalized: str, limit: int = SHORTLIST_SIZE) -> list:
+    """Non-failed tracks whose normalized titles best overlap normalized, by trigram Dice coefficient."""
+    sync(conn)
+    grams = sorted(trigrams(normalized))
+    return conn.execute(
+        f"""
+        WITH shared AS (
+            SELECT track_id, COUNT(*) AS n FROM title_trigrams
+            WHERE trigram IN ({",".join("?" * len(grams))})
+            GROUP BY track_id
+        )
+        SELECT t.id, t.title, t.artist, t.submitter FROM shared s
+        JOIN title_index i ON i.track_id = s.track_id
+        JOIN tracks t ON t.id = s.track_id
+        WHERE t.status != 'failed' AND t.title != ''
+        ORDER BY 2.0 * s.n / (? + i.trigram_count) DESC
+        LIMIT ?
+        """,  # noqa: S608
+        [*grams, len(grams), limit],
+    ).fetchall()
+
+
+def similarity(norm_title: str, norm_artist: str | None, row) -> float:
+    """How alike a track is to a normalized title (and artist, when both sides have one)."""
+    title_sim = difflib.SequenceMatcher(None, norm_title, normalize_title(row["title"])).ratio()
+    if not norm_artist or not row["artist"]:
+        return title_sim
+    artist_sim = difflib.SequenceMatcher(None, norm_artist, normalize_title(row["artist"])).ratio()
+    return title_sim * (1 - ARTIST_WEIGHT) + artist_sim * ARTIST_WEIGHT
+
+
+def similar_tracks(conn, title: str, artist: str | None, threshold: float, limit: int) -> list[dict]:
+    """Tracks with similarity >= threshold, best first: [{"id", "title", "artist", "submitter", "similarity"}]."""
+    norm_title = normalize_title(title)
+    norm_artist = normalize_title(artist) if artist else None
+    matches = []
+    for row in shortlist(conn, norm_title):
+        sim = similarity(norm_title, norm_artist, row)
+        if sim >= threshold:
+            matches.append({**dict(row), "similarity": round(sim, 3)})
+    matches.sort(key=lambda m: m["similarity"], reverse=True)
+    return matches[:limit]
@@ -0,0 +1,140 @@
+"""Cost of one fuzzy duplicate check: difflib over the whole library vs. the trigram shortlist.
+
+Run from api/:
+
+    python -m tools.bench_duplicate_check [--tracks 50000] [--queries 100]
+
+Builds a throwaway database of synthetic titles and artists, then checks a mix of
+queries: library titles with a typo, a dropped word or an added "(Live)", and titles
+not in the library. Both paths score with title_index.similarity against the same
+threshold. The report shows their time per check, and how many queries got equally
+similar matches from both (tracks tied at the cutoff can differ). Indexing the whole
+library, which the API does once at startup, is timed separately.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+import uuid
+from datetime import UTC, datetime
+
+THRESHOLD = 0.75  # routers.submit.DUPLICATE_SIMILARITY_THRESHOLD
+MAX_RESULTS = 3
+
+
+def _words(rng: random.Random, n: int) -> list[str]:
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(n)]
+
+
+def _populate(n: int, rng: random.Random) -> list[tuple[str, str]]:
+    from database import db
+
+    vocabulary = _words(rng, 3000)
+    artists = [" ".join(rng.choices(vocabulary, k=rng.randint(1, 3))).title() for _ in range(n // 10)]
+    now = datetime.now(UTC).isoformat()
+    rows = []
+    for _ in range(n):
+        title = " ".join(rng.choices(vocabulary, k=rng.randint(1, 5))).title()
+        if rng.random() < 0.2:
+            title += rng.choice([" (Official Video)", " [Remastered]", " (feat. Someone)"])
+        rows.append((str(uuid.uuid4()), title, rng.choice(artists), "bench", "upload", now))
+    with db() as conn:
+        conn.executemany(
+            "INSERT INTO tracks (id, title, artist, submitter, source_type, status, submitted_at)"
+            " VALUES (?, ?, ?, ?, ?, 'ready', ?)",
+            rows,
+        )
+    return [(title, artist) for _, title, artist, *_ in rows]
+
+
+def _query(library: list[tuple[str, str]], rng: random.Random) -> tuple[str, str | None]:
+    title, artist = rng.choice(library)
+    kind = rng.randrange(4)
+    if kind == 0:  # a typo
+        i = rng.randrange(len(title))
+        title = title[:i] + rng.choice(string.ascii_lowercase) + title[i + 1 :]
+    elif kind == 1:  # a word dropped
+        words = title.split()
+        if len(words) > 1:
+            words.pop(rng.randrange(len(words)))
+        title = " ".join(words)
+    elif kind == 2:
+        title += " (Live)"
+    else:  # not in the library
+        title = " ".join(_words(rng, rng.randint(1, 4)))
+    return title, artist if rng.random() < 0.5 else None
+
+
+def _full_scan(conn, title: str, artist: str | None) -> list[dict]:
+    """check_duplicate as it was: difflib against every non-failed track."""
+    from title_index import normalize_title, similarity
+
+    norm_title = normalize_title(title)
+    norm_artist = normalize_title(artist) if artist else None
+    rows = conn.execute(
+        "SELECT id, title, artist, submitter FROM tracks WHERE status != 'failed' AND title != ''"
+    ).fetchall()
+    matches = []
+    for row in rows:
+        sim = similarity(norm_title, norm_artist, row)
+        if sim >= THRESHOLD:
+            matches.append({**dict(row), "similarity": round(sim, 3)})
+    matches.sort(key=lambda m: m["similarity"], reverse=True)
+    return matches[:MAX_RESULTS]
+
+
+def _scores(matches: list[dict]) -> list[float]:
+    """What two results must agree on; with ties at the cutoff, either may keep a different track."""
+    return [m["similarity"] for m in matches]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Fuzzy duplicate check: full difflib scan vs. trigram shortlist.")
+    parser.add_argument("--tracks", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        import database
+
+        database.DB_PATH = os.path.join(directory, "bench.db")
+        database.init_db()
+
+        from title_index import similar_tracks, sync
+
+        rng = random.Random(0)  # noqa: S311 — synthetic data
+        library = _populate(args.tracks, rng)
+        queries = [_query(library, rng) for _ in range(args.queries)]
+
+        with database.db() as conn:
+            start = time.perf_counter()
+            sync(conn)
+            build_s = time.perf_counter() - start
+
+            scan_ms, indexed_ms, same, found = [], [], 0, 0
+            for title, artist in queries:
+                start = time.perf_counter()
+                expected = _full_scan(conn, title, artist)
+                scan_ms.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                got = similar_tracks(conn, title, artist, THRESHOLD, MAX_RESULTS)
+                indexed_ms.append((time.perf_counter() - start) * 1000)
+                same += _scores(got) == _scores(expected)
+                found += bool(expected)
+
+        print(f"{args.tracks} tracks, {args.queries} queries ({found} with matches)")
+        print(f"{'path':<10} {'mean ms':>8} {'median ms':>10} {'p99 ms':>8}")
+        for name, times in (("full scan", scan_ms), ("trigram", indexed_ms)):
+            p99 = statistics.quantiles(times, n=100)[98]
+            print(f"{name:<10} {statistics.mean(times):>8.2f} {statistics.median(times):>10.2f} {p99:>8.2f}")
+        print(f"same matches: {same}/{args.queries}; startup index build: {build_s * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,102 @@
+"""Peak memory of feature extraction per input type: streaming engine vs. the original.
+
+Run from api/ (needs ffmpeg on PATH):
+
+    python -m tools.bench_features [--minutes 10] [audio files...]
+
+With no files, synthetic inputs are generated: a 128k MP3, a 48 kHz WAV, a 96 kHz/24-bit
+FLAC and a long 44.1 kHz FLAC. Each measurement runs in a fresh interpreter, after a
+warm-up, so the numbers are the extra memory the extraction itself needs. The ffmpeg
+decoder the streaming engine starts is a separate process and not included; its
+ru_maxrss is not meaningful because Linux carries the parent's RSS across fork/exec.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SYNTHETIC = {
+    # name: (extension, ffmpeg output args, length in multiples of --minutes)
+    "mp3_44k_128k": ("mp3", ["-ar", "44100", "-c:a", "libmp3lame", "-b:a", "128k"], 1),
+    "wav_48k_16bit": ("wav", ["-ar", "48000", "-c:a", "pcm_s16le"], 1),
+    "flac_96k_24bit": ("flac", ["-ar", "96000", "-c:a", "flac", "-sample_fmt", "s32"], 1),
+    "flac_44k_long": ("flac", ["-ar", "44100", "-c:a", "flac"], 6),
+}
+
+
+def _generate(directory: str, minutes: float) -> list[str]:
+    paths = []
+    for name, (ext, args, multiple) in SYNTHETIC.items():
+        path = os.path.join(directory, f"{name}.{ext}")
+        source = "aevalsrc='0.4*sin(2*PI*220*t)*exp(-20*mod(t,0.5))+0.05*random(0)':s=96000"
+        cmd = ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", source, "-t", str(minutes * 60 * multiple), "-ac", "2"]
+        subprocess.run([*cmd, *args, "-y", path], check=True)  # noqa: S603
+        paths.append(path)
+    return paths
+
+
+def _measure(method: str, path: str) -> dict:
+    """Runs in the child interpreter: warm up, reset the high-water mark, extract once."""
+    import librosa  # ty: ignore[unresolved-import]
+    from audio import extract_features, features_from_pcm
+    from timing import _peak_rss_kb, _reset_peak_rss
+    from tools.compare_features import reference_features
+
+    # Warm up imports, numba JIT and FFT plans on 10 s of noise
+    warmup = np.random.default_rng(0).standard_normal(441000).astype(np.float32)
+    features_from_pcm(warmup, 44100)
+    if method == "original":
+        reference_features(warmup, 44100)
+        librosa.load(path, sr=None, mono=True, duration=0.1)
+    _reset_peak_rss()
+    baseline_kb = _peak_rss_kb()
+
+    start = time.monotonic()
+    if method == "streaming":
+        extract_features(path)
+    else:
+        y, sr = librosa.load(path, sr=None, mono=True, duration=120.0)
+        reference_features(y, sr)
+    return {
+        "wall_s": round(time.monotonic() - start, 1),
+        "peak_mb": round((_peak_rss_kb() - baseline_kb) / 1024, 1),
+    }
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Peak memory of feature extraction per input type.")
+    parser.add_argument("--minutes", type=float, default=10.0, help="length of generated inputs")
+    parser.add_argument("--measure", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(_measure(*args.measure)))
+        return 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = args.paths or _generate(directory, args.minutes)
+        print(f"{'input':<24} {'size MB':>8} {'method':<10} {'wall s':>7} {'peak MB':>8}")
+        for path in paths:
+            size_mb = os.path.getsize(path) / 1e6
+            for method in ("original", "streaming"):
+                out = subprocess.run(  # noqa: S603
+                    [sys.executable, "-m", "tools.bench_features", "--measure", method, path],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                name = os.path.basename(path)
+                print(f"{name:<24} {size_mb:>8.1f} {method:<10} {r['wall_s']:>7} {r['peak_mb']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,116 @@
+"""Cost of one mood pick per library size: 4-feature vs. embedding distance.
+
+Run from api/:
+
+    python -m tools.bench_mood_search [--tracks 10000] [--repeat 20]
+
+Builds a throwaway database of synthetic analyzed tracks and times two things per
+mode: the distance computation alone over the whole library, and a complete
+scheduler._pick_mood_track (queries, unpacking and config writes included).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import UTC, datetime
+
+import numpy as np
+
+
+def _populate(n: int, rng: np.random.Generator):
+    from audio import EMBEDDING_DIM, embedding_blob
+    from database import db
+
+    now = datetime.now(UTC).isoformat()
+    # Roughly the real scales: MFCC means in the tens to hundreds, chroma in 0-1
+    scales = np.concatenate([np.full(EMBEDDING_DIM // 2, 50.0), np.full(EMBEDDING_DIM // 2, 0.3)])
+    embeddings = rng.standard_normal((n, EMBEDDING_DIM)) * scales
+    rows = [
+        (
+            str(uuid.uuid4()),
+            f"Track {i}",
+            "Artist",
+            "bench",
+            "upload",
+            f"/tmp/{i}.mp3",  # noqa: S108 — never opened
+            200.0,
+            float(rng.uniform(60, 180)),
+            float(rng.uniform(0.01, 0.3)),
+            float(rng.uniform(500, 4000)),
+            float(rng.uniform(0.01, 0.2)),
+            embedding_blob(embeddings[i].tolist()),
+            now,
+        )
+        for i in range(n)
+    ]
+    with db() as conn:
+        conn.executemany(
+            """
+            INSERT INTO tracks (id, title, artist, submitter, source_type, file_path, duration_s, tempo_bpm,
+                rms_energy, spectral_centroid, zero_crossing_rate, embedding, status, submitted_at, ready_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'ready', ?, ?)
+            """,
+            [(*row, now) for row in rows],
+        )
+        conn.execute("INSERT INTO play_log (track_id, played_at) VALUES (?, ?)", (rows[0][0], now))
+
+
+def _time_ms(fn, repeat: int) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Cost of one mood pick: 4-feature vs. embedding distance.")
+    parser.add_argument("--tracks", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        import database
+
+        database.DB_PATH = os.path.join(directory, "bench.db")
+        database.init_db()
+
+        import scheduler
+        from audio import FEATURE_NAMES, cosine_distances, embedding_matrix, normalize_matrix
+
+        rng = np.random.default_rng(0)
+        _populate(args.tracks, rng)
+        scheduler.recompute_feature_stats()
+        bounds = scheduler.load_feature_bounds()
+        if bounds is None:
+            raise RuntimeError("no feature bounds after populating")
+
+        with database.db() as conn:
+            rows = conn.execute(f"SELECT {', '.join(FEATURE_NAMES)}, embedding FROM tracks").fetchall()  # noqa: S608
+        features = np.array([tuple(r)[:-1] for r in rows], dtype=float)
+        blobs = [r["embedding"] for r in rows]
+
+        def features_search():
+            vectors = normalize_matrix(features, *bounds)
+            np.argmin(np.linalg.norm(vectors[1:] - vectors[0], axis=1))
+
+        def embedding_search():
+            matrix = embedding_matrix(blobs)
+            np.argmin(cosine_distances(matrix[0], matrix[1:]))
+
+        per_10k = 10000 / args.tracks
+        print(f"{args.tracks} tracks")
+        print(f"{'mode':<10} {'search ms':>10} {'pick ms':>10} {'pick ms/10k':>12}")
+        for mode, search in (("features", features_search), ("embedding", embedding_search)):
+            database.set_config("mood_distance", mode)
+            search_ms = _time_ms(search, args.repeat)
+            pick_ms = _time_ms(scheduler._pick_mood_track, args.repeat)
+            print(f"{mode:<10} {search_ms:>10.2f} {pick_ms:>10.2f} {pick_ms * per_10k:>12.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
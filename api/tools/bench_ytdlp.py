@@ -0,0 +1,116 @@
+"""Per-download overhead: yt-dlp CLI per download vs. a warm ytdl_service engine.
+
+Run from api/ (needs yt-dlp and ffmpeg):
+
+    python -m tools.bench_ytdlp [--downloads 20]
+
+Downloads go through a stand-in extractor plugin that serves a short local M4A over
+HTTP, so the numbers are yt-dlp's own startup and per-download cost, not YouTube's. Both
+paths use downloader.ytdlp_args(). The engine's first download, which starts the
+process, is reported separately.
+"""
+
+import argparse
+import functools
+import http.server
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PLUGIN = """
+from yt_dlp.extractor.common import InfoExtractor
+
+
+class BenchLocalIE(InfoExtractor):
+    _VALID_URL = r"benchlocal:(?P<port>[0-9]+):(?P<id>[0-9a-z]+)"
+
+    def _real_extract(self, url):
+        port, video_id = self._match_valid_url(url).group("port", "id")
+        return {
+            "id": video_id,
+            "title": f"Bench {video_id}",
+            "uploader": "bench",
+            "formats": [
+                {
+                    "url": f"http://127.0.0.1:{port}/audio.m4a",
+                    "format_id": "audio",
+                    "ext": "m4a",
+                    "vcodec": "none",
+                    "acodec": "aac",
+                }
+            ],
+        }
+"""
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):  # noqa: A002 — the base class's signature
+        pass
+
+
+def _setup(directory: str) -> int:
+    """Write the plugin and the audio file; serve the directory over HTTP. Returns the port."""
+    plugin_dir = os.path.join(directory, "yt_dlp_plugins", "extractor")
+    os.makedirs(plugin_dir)
+    with open(os.path.join(plugin_dir, "bench_local.py"), "w") as f:
+        f.write(PLUGIN)
+    subprocess.run(  # noqa: S603
+        ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "sine=f=440:d=10", "-c:a", "aac", "-y", "audio.m4a"],  # noqa: S607
+        cwd=directory,
+        check=True,
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="yt-dlp per-download overhead: CLI vs. warm engine.")
+    parser.add_argument("--downloads", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    import ytdl_service
+    from downloader import ytdlp_args
+
+    with tempfile.TemporaryDirectory() as directory:
+        port = _setup(directory)
+        sys.path.insert(0, directory)  # spawned engines inherit sys.path, and find the plugin through it
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join([directory, os.environ.get("PYTHONPATH", "")])}
+        executable = shutil.which("yt-dlp")
+        cli = [executable] if executable else [sys.executable, "-m", "yt_dlp"]
+        options = ytdlp_args()
+        cookies = os.path.join(directory, "cookies.txt")  # absent
+        out_dir = os.path.join(directory, "out")
+
+        cli_s = []
+        for i in range(args.downloads):
+            template = os.path.join(out_dir, f"cli{i}.%(ext)s")
+            start = time.perf_counter()
+            subprocess.run([*cli, *options, "--output", template, f"benchlocal:{port}:cli{i}"], env=env, check=True)  # noqa: S603
+            cli_s.append(time.perf_counter() - start)
+
+        engine_s = []
+        for i in range(args.downloads + 1):
+            template = os.path.join(out_dir, f"engine{i}.%(ext)s")
+            start = time.perf_counter()
+            ytdl_service.download(options, f"benchlocal:{port}:engine{i}", template, cookies)
+            engine_s.append(time.perf_counter() - start)
+        ytdl_service.shutdown()
+
+        first, engine_s = engine_s[0], engine_s[1:]
+        print(f"{args.downloads} downloads of a 10 s local M4A")
+        print(f"{'path':<16} {'mean ms':>8} {'median ms':>10}")
+        for name, times in (("cli subprocess", cli_s), ("warm engine", engine_s)):
+            print(f"{name:<16} {statistics.mean(times) * 1000:>8.0f} {statistics.median(times) * 1000:>10.0f}")
+        saved = statistics.mean(cli_s) - statistics.mean(engine_s)
+        print(f"engine start (first download): {first * 1000:.0f} ms; saved per download: {saved * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,89 @@
+"""Regression check: the shared-STFT feature engine against the original implementation.
+
+Run from api/:
+
+    python -m tools.compare_features [--tier fast] [audio files...]
+
+With no files, a set of synthetic signals is used. --tier fast checks the fast tier
+against the same reference, with a looser tempo tolerance. Exits non-zero if any feature
+differs from the reference by more than its tolerance.
+"""
+
+import argparse
+import sys
+from dataclasses import asdict
+
+import librosa  # ty: ignore[unresolved-import]
+import numpy as np
+from audio import ANALYSIS_SR, ANALYSIS_WINDOW_S, TIERS, features_from_pcm
+
+# Relative tolerance per feature
+TOLERANCES = {
+    "tempo_bpm": 0.02,
+    "rms_energy": 0.01,
+    "spectral_centroid": 0.01,
+    "zero_crossing_rate": 0.001,
+}
+# Tempo from three excerpts without HPSS; fine for mood matching, not beat-exact
+FAST_TEMPO_TOLERANCE = 0.05
+
+
+def reference_features(y: np.ndarray, sr: int) -> dict:
+    """The feature extraction as it was before the shared STFT (three STFTs plus an inverse)."""
+    _, y_percussive = librosa.effects.hpss(y)
+    tempo, _ = librosa.beat.beat_track(y=y_percussive, sr=sr)
+    S = np.abs(librosa.stft(y))
+    return {
+        "tempo_bpm": float(np.atleast_1d(tempo)[0]),
+        "rms_energy": float(librosa.feature.rms(S=S).mean()),
+        "spectral_centroid": float(librosa.feature.spectral_centroid(y=y, sr=sr).mean()),
+        "zero_crossing_rate": float(librosa.feature.zero_crossing_rate(y).mean()),
+    }
+
+
+def synthetic_signals(sr: int = ANALYSIS_SR, seconds: float = 30.0) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sr * seconds)) / sr
+    signals = {}
+    for bpm in (72, 120, 150):
+        clicks = librosa.clicks(times=np.arange(0, seconds, 60 / bpm), sr=sr, length=len(t))
+        pad = 0.2 * np.sin(2 * np.pi * 220 * t) + 0.1 * np.sin(2 * np.pi * 330 * t)
+        signals[f"clicks_{bpm}bpm"] = (clicks + pad + 0.01 * rng.standard_normal(len(t))).astype(np.float32)
+    signals["sweep"] = librosa.chirp(fmin=100, fmax=8000, sr=sr, duration=seconds).astype(np.float32) * 0.5
+    # Decaying noise bursts, like a snare at 100 bpm; steady noise has no tempo to compare
+    envelope = np.exp(-30 * ((t % 0.6) / 0.6))
+    signals["noise_bursts_100bpm"] = (0.3 * envelope * rng.standard_normal(len(t))).astype(np.float32)
+    return signals
+
+
+def compare(name: str, y: np.ndarray, sr: int, tier: str) -> bool:
+    expected = reference_features(y, sr)
+    actual = asdict(features_from_pcm(y, sr, tier))
+    tolerances = TOLERANCES if tier == "full" else {**TOLERANCES, "tempo_bpm": FAST_TEMPO_TOLERANCE}
+    ok = True
+    for key, tolerance in tolerances.items():
+        ref, new = expected[key], actual[key]
+        rel = abs(new - ref) / abs(ref) if ref else abs(new)
+        status = "ok" if rel <= tolerance else "FAIL"
+        ok &= status != "FAIL"
+        print(f"{name:<24} {key:<20} ref={ref:<12.5g} new={new:<12.5g} diff={rel:.2%} {status}")
+    return ok
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Compare feature extraction against the original implementation.")
+    parser.add_argument("--tier", choices=TIERS, default="full")
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args(argv)
+    paths = args.paths
+    if paths:
+        signals = {path: librosa.load(path, sr=ANALYSIS_SR, mono=True, duration=ANALYSIS_WINDOW_S)[0] for path in paths}
+    else:
+        signals = synthetic_signals()
+    results = [compare(name, y, ANALYSIS_SR, args.tier) for name, y in signals.items()]
+    print(f"\n{sum(results)}/{len(results)} signals within tolerance")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
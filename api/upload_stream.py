@@ -0,0 +1,221 @@
+"""Streaming multipart uploads: parsed as the body arrives, written straight to disk.
+
+With File() parameters, Starlette parses the whole body and spools the file to a
+temporary file before the handler runs, and the handler then copies it again.
+receive_upload parses the request body incrementally instead. Text fields are collected,
+and the file part is written straight to its destination with aiofiles (off the event
+loop) and hashed on the way. Nothing is written until the file's first SNIFF_BYTES have
+been checked for a known audio container, so anything else is rejected as soon as those
+bytes are in, not after the whole body.
+"""
+
+import hashlib
+import logging
+import os
+import struct
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import aiofiles
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+SNIFF_BYTES = 64 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+# WAVE fmt chunk format tags ffmpeg sees most often
+_WAV_CODECS = {0x0001: "pcm", 0x0003: "pcm_float", 0x0055: "mp3", 0xFFFE: "extensible"}
+# First packet of an Ogg stream
+_OGG_CODECS = ((b"OpusHead", "opus"), (b"\x01vorbis", "vorbis"), (b"\x7fFLAC", "flac"), (b"Speex   ", "speex"))
+# MP4 audio sample entries
+_MP4_CODECS = ((b"mp4a", "aac"), (b"alac", "alac"), (b"Opus", "opus"), (b"fLaC", "flac"), (b".mp3", "mp3"))
+
+
+class UploadRejected(Exception):
+    """The upload was refused; status_code and detail are for the HTTP response."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class StreamedUpload:
+    fields: dict[str, str] = field(default_factory=dict)
+    filename: str | None = None  # None when the request had no (non-empty) file part
+    path: str | None = None
+    size: int = 0
+    sha256: str | None = None
+    container: str | None = None
+    codec: str | None = None  # None when the first bytes don't tell (an MP4 with its index at the end)
+
+
+def sniff_audio(head: bytes) -> tuple[str, str | None] | None:
+    """(container, codec) from a file's first bytes, or None if they aren't a known audio format."""
+    if head[:3] == b"ID3" and len(head) >= 10:
+        # ID3v2 tag (size is syncsafe), then the audio; a tag bigger than head (cover art) is trusted
+        tag_size = 10 + ((head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | (head[9] & 0x7F))
+        return sniff_audio(head[tag_size:]) if len(head) > tag_size + 4 else ("mp3", None)
+    if head[:4] == b"fLaC":
+        return "flac", "flac"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav", _wav_codec(head)
+    if head[:4] == b"OggS" and len(head) > 27:
+        packet = head[27 + head[26] :]
+        return "ogg", next((codec for magic, codec in _OGG_CODECS if packet.startswith(magic)), None)
+    if head[4:8] == b"ftyp":
+        return "mp4", next((codec for fourcc, codec in _MP4_CODECS if fourcc in head), None)
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        layer = (head[1] >> 1) & 0x3
+        if layer == 0 and head[1] & 0xF0 == 0xF0:
+            return "adts", "aac"
+        return ("mp3", {1: "mp3", 2: "mp2", 3: "mp1"}[layer]) if layer else None
+    return None
+
+
+def check_audio(head: bytes) -> tuple[str, str | None]:
+    """sniff_audio, raising UploadRejected for a file that isn't audio."""
+    sniffed = sniff_audio(head)
+    if sniffed is None:
+        raise UploadRejected(400, "This file doesn't look like audio (MP3, WAV, FLAC, M4A, Ogg or Opus)")
+    return sniffed
+
+
+def _wav_codec(head: bytes) -> str | None:
+    pos = 12
+    while pos + 10 <= len(head):
+        chunk_id, chunk_size = head[pos : pos + 4], struct.unpack("<I", head[pos + 4 : pos + 8])[0]
+        if chunk_id == b"fmt ":
+            tag = struct.unpack("<H", head[pos + 8 : pos + 10])[0]
+            return _WAV_CODECS.get(tag, f"0x{tag:04x}")
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+async def receive_upload(
+    request: Request, destination: Callable[[str, dict[str, str]], str], max_bytes: int
+) -> StreamedUpload:
+    """Parse a multipart/form-data request as it streams in, saving its one file part.
+
+    destination(filename, fields so far) is called when the file part starts and returns
+    the path to write it to; it may raise UploadRejected (or anything else) to refuse the
+    upload before its data is read. Raises UploadRejected for a malformed body, a second
+    file, a file over max_bytes or one that isn't audio. The file is deleted on any error.
+    """
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise UploadRejected(400, "Expected a multipart/form-data body")
+
+    # The parser is synchronous and calls back with slices of its input; queue them as
+    # events, then handle them (with awaited writes) after each chunk
+    events: list[tuple[str, bytes]] = []
+
+    def on(name: str):
+        return lambda *args: events.append((name, bytes(args[0][args[1] : args[2]]) if args else b""))
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on("part_begin"),
+            "on_header_field": on("header_field"),
+            "on_header_value": on("header_value"),
+            "on_header_end": on("header_end"),
+            "on_headers_finished": on("headers_finished"),
+            "on_part_data": on("part_data"),
+            "on_part_end": on("part_end"),
+        },
+    )
+
+    upload = StreamedUpload()
+    digest = hashlib.sha256()
+    out = None
+    head = b""
+    headers: dict[bytes, bytes] = {}
+    header_field = header_value = b""
+    name = ""
+    value = b""
+    kind = None  # the current part: "field", "file", or "skip" (an empty file input)
+
+    async def write(data: bytes):
+        upload.size += len(data)
+        if upload.size > max_bytes:
+            raise UploadRejected(413, f"File too large (max {max_bytes // (1024 * 1024)}MB)")
+        digest.update(data)
+        await out.write(data)  # ty: ignore[unresolved-attribute] -- opened before any file data
+
+    async def sniff_and_write_head():
+        nonlocal head
+        upload.container, upload.codec = check_audio(head)
+        data, head = head, b""
+        await write(data)
+
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise UploadRejected(400, f"Malformed upload: {e}") from None
+            for event, data in events:
+                if event == "part_begin":
+                    headers, header_field, header_value = {}, b"", b""
+                elif event == "header_field":
+                    header_field += data
+                elif event == "header_value":
+                    header_value += data
+                elif event == "header_end":
+                    headers[header_field.lower()] = header_value
+                    header_field = header_value = b""
+                elif event == "headers_finished":
+                    _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+                    name = disposition.get(b"name", b"").decode("utf-8", "replace")
+                    filename = disposition.get(b"filename")
+                    value = b""
+                    if filename is None:
+                        kind = "field"
+                    elif not filename:
+                        kind = "skip"
+                    elif upload.filename is not None:
+                        raise UploadRejected(400, "Only one file per submission")
+                    else:
+                        kind = "file"
+                        upload.filename = os.path.basename(filename.decode("utf-8", "replace"))
+                        upload.path = destination(upload.filename, upload.fields)
+                        out = await aiofiles.open(upload.path, "wb")
+                elif event == "part_data":
+                    if kind == "field":
+                        value += data
+                        if len(value) > MAX_FIELD_BYTES:
+                            raise UploadRejected(413, f"Form field {name} is too large")
+                    elif kind == "file" and upload.container is None:
+                        head += data
+                        if len(head) >= SNIFF_BYTES:
+                            await sniff_and_write_head()
+                    elif kind == "file":
+                        await write(data)
+                elif event == "part_end":
+                    if kind == "field":
+                        upload.fields[name] = value.decode("utf-8", "replace")
+                    elif kind == "file" and upload.container is None:
+                        await sniff_and_write_head()  # the whole file was shorter than SNIFF_BYTES
+                    kind = None
+            events.clear()
+        parser.finalize()
+        if kind is not None:
+            raise UploadRejected(400, "The upload ended in the middle of the form")
+        if upload.filename is not None:
+            upload.sha256 = digest.hexdigest()
+            logger.info(
+                f"Received {upload.filename}: {upload.size} bytes, {upload.container}/{upload.codec or 'unknown codec'}"
+            )
+        return upload
+    except BaseException:
+        if upload.path is not None and os.path.exists(upload.path):
+            os.unlink(upload.path)
+        raise
+    finally:
+        if out is not None:
+            await out.close()
@@ -1,47 +1,266 @@
+import glob
+import json
 import logging
 import os
 import threading
-from datetime import UTC, datetime
+import time
+from dataclasses import asdict
+from datetime import UTC, datetime, timedelta
 
 from alerts import send_alert
-from audio import extract_features
-from database import db
-from downloader import convert_to_standard_mp3, download_youtube
+from audio import (
+    ANALYSIS_SR,
+    FEATURE_VERSION,
+    PCM_CHANNELS,
+    TIERS,
+    FeatureAccumulator,
+    embedding_blob,
+    extract_features,
+)
+from database import db, get_config
+from downloader import convert_to_standard_mp3, download_youtube, fetch_youtube_metadata, probe_duration_s
+from fingerprint_index import index_track
+from governor import MAX_CONCURRENCY, decide
+from media_store import (
+    cached_analysis,
+    cached_source,
+    hash_references,
+    incoming_path,
+    path_for,
+    save_analysis,
+    save_source,
+    store,
+)
+from models import AudioFeatures
 from push import send_push_to_all
-from scheduler import update_feature_bounds
+from retry import POLICIES, classify
+from scheduler import recompute_feature_stats
+from timing import stage_timer
 
 logger = logging.getLogger(__name__)
 
-_worker_thread: threading.Thread | None = None
+_worker_threads: list[threading.Thread] = []
+_active_jobs: dict[int, int] = {}  # worker slot -> job id in progress
 _stop_event = threading.Event()
+_upgrade_failed: set[str] = set()  # tracks whose full re-analysis failed; not retried until restart
+_metadata_wakeup = threading.Event()
+
+UPLOAD_BYTES_PER_S = 32_000  # ~256 kbps: between a 128k MP3 and a FLAC, good enough to rank uploads
+UNKNOWN_DURATION_S = 600.0  # assumed length of a YouTube job whose duration isn't known yet
+PENDING_PLACEHOLDER = "Pending..."  # title/artist of a YouTube submission until its metadata arrives
+DRAIN_TIMEOUT_S = float(os.environ.get("WORKER_DRAIN_TIMEOUT_S", "120"))
+# With analysis_tier 'auto', jobs are analyzed in the fast tier while this many others are waiting
+FAST_TIER_QUEUE_DEPTH = int(os.environ.get("ANALYSIS_FAST_QUEUE_DEPTH", "3"))
+
+# Pipeline stages in order. jobs.stage holds the last one completed; each stage's output
+# (raw_path, converted_path, features_json) is saved with it so a restart can resume.
+STAGES = ("downloaded", "converted", "analyzed")
+_STAGE_OUTPUT_COLUMNS = {"raw_path", "converted_path", "features_json", "media_hash"}
+
+# The tracks a job's status and result apply to: its own, and those of later submissions
+# of the same source that attached to it (job_followers). Takes the job id twice.
+_JOB_TRACKS = "SELECT track_id FROM jobs WHERE id=? UNION SELECT track_id FROM job_followers WHERE job_id=?"
+
+
+class JobInterrupted(Exception):
+    """Raised between stages when the worker is asked to stop."""
 
 
 def _now() -> str:
     return datetime.now(UTC).isoformat()
 
 
-def _process_job(job_id: int, track_id: str):
-    """Process a single job: download, convert, analyze."""
-    logger.info(f"Processing job {job_id} for track {track_id}")
+def _checkpoint(job_id: int, stage: str, **outputs: str):
+    """Record that a stage finished, along with the output the next stage needs."""
+    with db() as conn:
+        _write_checkpoint(conn, job_id, stage, **outputs)
+
+
+def _write_checkpoint(conn, job_id: int, stage: str, **outputs: str):
+    """_checkpoint within the caller's transaction."""
+    if not set(outputs) <= _STAGE_OUTPUT_COLUMNS:
+        raise ValueError(f"Unknown stage output column(s): {set(outputs) - _STAGE_OUTPUT_COLUMNS}")
+    assignments = "".join(f", {column}=?" for column in outputs)
+    conn.execute(
+        f"UPDATE jobs SET stage=?{assignments} WHERE id=?",  # noqa: S608 — columns checked against allowlist
+        (stage, *outputs.values(), job_id),
+    )
+
+
+def _update_job_tracks(conn, job_id: int, assignments: str, params: tuple = ()):
+    conn.execute(
+        f"UPDATE tracks SET {assignments} WHERE id IN ({_JOB_TRACKS})",  # noqa: S608 — assignments are constants
+        (*params, job_id, job_id),
+    )
+
+
+def source_key(source_type: str, identity: str) -> str:
+    """Single-flight key of a submission: "youtube:<video id>" or "upload:<sha256 of the file>"."""
+    return f"{source_type}:{identity}"
+
+
+def attach_to_inflight(conn, key: str, track_id: str) -> int | None:
+    """Make track_id a follower of the in-flight job for key, if there is one; returns its id.
 
-    # Mark job as started
+    The job's result fans out to the follower when it finishes, so the same source is
+    never downloaded or analyzed twice at once.
+    """
+    job = conn.execute(
+        "SELECT id, status FROM jobs WHERE source_key=? AND status IN ('pending', 'processing')", (key,)
+    ).fetchone()
+    if not job:
+        return None
+    conn.execute(
+        "INSERT INTO job_followers (track_id, job_id, attached_at) VALUES (?, ?, ?)", (track_id, job["id"], _now())
+    )
+    conn.execute("UPDATE tracks SET status=? WHERE id=?", (job["status"], track_id))
+    return job["id"]
+
+
+def release_track(conn, track_id: str):
+    """Detach a track that is about to be deleted, along with its jobs, from other tracks.
+
+    A follower just leaves its job. A track whose in-flight job has followers hands the
+    job over to the earliest of them, so deleting it doesn't cancel their submissions.
+    """
+    conn.execute("DELETE FROM job_followers WHERE track_id=?", (track_id,))
+    job = conn.execute(
+        "SELECT id, stage FROM jobs WHERE track_id=? AND status IN ('pending', 'processing')", (track_id,)
+    ).fetchone()
+    heir = (
+        job
+        and conn.execute(
+            "SELECT track_id FROM job_followers WHERE job_id=? ORDER BY attached_at LIMIT 1", (job["id"],)
+        ).fetchone()
+    )
+    if job and heir:
+        conn.execute("DELETE FROM job_followers WHERE track_id=?", (heir["track_id"],))
+        conn.execute("UPDATE jobs SET track_id=? WHERE id=?", (heir["track_id"], job["id"]))
+        if job["stage"] is None:
+            # Until the first checkpoint the worker finds an uploaded file by its track id
+            upload_dir = os.path.join(os.environ.get("MEDIA_DIR", "/media"), "raw")
+            for path in glob.glob(os.path.join(glob.escape(upload_dir), f"{glob.escape(track_id)}.*")):
+                os.replace(path, os.path.join(upload_dir, heir["track_id"] + os.path.splitext(path)[1]))
+        logger.info(f"Job {job['id']} handed over from deleted track {track_id} to {heir['track_id']}")
+    # Followers of the track's finished jobs have their own copy of the result
+    conn.execute("DELETE FROM job_followers WHERE job_id IN (SELECT id FROM jobs WHERE track_id=?)", (track_id,))
+
+
+def _join_names(names: list[str]) -> str:
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+
+
+def _completed_stages(job) -> int:
+    """Number of stages that can be skipped; a stage whose output file is gone must be redone."""
+    done = STAGES.index(job["stage"]) + 1 if job["stage"] in STAGES else 0
+    if done >= 2 and not (job["converted_path"] and os.path.exists(job["converted_path"])):
+        done = 0  # the raw file is deleted after conversion, so start over
+    if done == 1 and not (job["raw_path"] and os.path.exists(job["raw_path"])):
+        done = 0
+    return done
+
+
+def _find_upload(track_id: str) -> str | None:
+    upload_dir = os.path.join(os.environ.get("MEDIA_DIR", "/media"), "raw")
+    for ext in ["mp3", "wav", "flac", "m4a", "ogg", "opus"]:
+        candidate = os.path.join(upload_dir, f"{track_id}.{ext}")
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _raise_if_stopping():
+    if _stop_event.is_set():
+        raise JobInterrupted
+
+
+def _choose_tier() -> str:
+    """Analysis tier for the job about to be analyzed: the configured one, or by queue depth."""
+    setting = get_config("analysis_tier")
+    if setting in TIERS:
+        return setting
     with db() as conn:
-        conn.execute(
-            "UPDATE jobs SET status='processing', started_at=? WHERE id=?",
-            (_now(), job_id),
-        )
-        conn.execute(
-            "UPDATE tracks SET status='processing' WHERE id=?",
-            (track_id,),
-        )
+        waiting = conn.execute("SELECT COUNT(*) FROM jobs WHERE status='pending'").fetchone()[0]
+    return "fast" if waiting >= FAST_TIER_QUEUE_DEPTH else "full"
+
+
+def _estimated_duration_s(row) -> float:
+    """Rough audio length of a pending job, used to run short jobs ahead of long ones."""
+    if row["est_duration_s"]:
+        return row["est_duration_s"]
+    if row["source_bytes"]:
+        return row["source_bytes"] / UPLOAD_BYTES_PER_S
+    return UNKNOWN_DURATION_S
 
+
+def get_pending_jobs(conn, include_delayed: bool = False) -> list:
+    """Return pending jobs in the order the worker will pick them.
+
+    Jobs waiting out a retry backoff (next_attempt_at in the future) are left out
+    unless include_delayed is set.
+
+    Higher priority always goes first. Within a priority level submitters take turns:
+    the submitter whose most recent job started longest ago (or never) is served next,
+    and their shortest job runs first. Order is re-evaluated before every pick, so one
+    person pasting five long YouTube links can't hold up everyone else's single upload.
+    """
+    rows = conn.execute(
+        """
+        SELECT j.id, j.track_id, j.priority, j.created_at, j.source_bytes, j.est_duration_s,
+               j.attempts, j.next_attempt_at, t.submitter, t.title, ls.last_served_at
+        FROM jobs j
+        JOIN tracks t ON t.id = j.track_id
+        LEFT JOIN (
+            SELECT t2.submitter, MAX(j2.started_at) AS last_served_at
+            FROM jobs j2
+            JOIN tracks t2 ON t2.id = j2.track_id
+            GROUP BY t2.submitter
+        ) ls ON ls.submitter = t.submitter
+        WHERE j.status='pending' AND (? OR j.next_attempt_at IS NULL OR j.next_attempt_at <= ?)
+        """,
+        (include_delayed, _now()),
+    ).fetchall()
+    return sorted(
+        rows,
+        key=lambda r: (-r["priority"], r["last_served_at"] or "", _estimated_duration_s(r), r["created_at"]),
+    )
+
+
+def _claim_job(job_id: int) -> bool:
+    """Mark a pending job as processing. False if another worker thread got there first."""
+    now = datetime.now(UTC)
+    with db() as conn:
+        created_at = conn.execute("SELECT created_at FROM jobs WHERE id=?", (job_id,)).fetchone()["created_at"]
+        # Queue wait is measured to the first start only
+        queue_wait_s = (now - datetime.fromisoformat(created_at)).total_seconds()
+        claimed = conn.execute(
+            "UPDATE jobs SET status='processing', started_at=?, queue_wait_s=COALESCE(queue_wait_s, ?)"
+            " WHERE id=? AND status='pending'",
+            (now.isoformat(), queue_wait_s, job_id),
+        ).rowcount
+        if claimed:
+            _update_job_tracks(conn, job_id, "status='processing'")
+    return bool(claimed)
+
+
+def _process_job(job_id: int, track_id: str):
+    """Process a single claimed job: download, convert, analyze."""
+    logger.info(f"Processing job {job_id} for track {track_id}")
+
+    submitter = ""
+    source_url = ""
+    media_hash = None
     try:
-        # Get track details
+        # Get track details and whatever a previous run of this job already finished
         with db() as conn:
             row = conn.execute(
                 "SELECT source_type, source_url, submitter, comment FROM tracks WHERE id=?",
                 (track_id,),
             ).fetchone()
+            job = conn.execute(
+                "SELECT stage, raw_path, converted_path, features_json, source_key, media_hash FROM jobs WHERE id=?",
+                (job_id,),
+            ).fetchone()
 
         if not row:
             raise RuntimeError(f"Track {track_id} not found")
@@ -50,76 +269,142 @@ def _process_job(job_id: int, track_id: str):
         source_url = row["source_url"] or ""
         submitter = row["submitter"] or ""
         comment = row["comment"] or ""
-        raw_path = None
-        title = None
-        artist = None
-
-        if source_type == "upload":
-            # File was already uploaded to /media/raw/{track_id}.*
-            upload_dir = os.path.join(os.environ.get("MEDIA_DIR", "/media"), "raw")
-            for ext in ["mp3", "wav", "flac", "m4a", "ogg", "opus"]:
-                candidate = os.path.join(upload_dir, f"{track_id}.{ext}")
-                if os.path.exists(candidate):
-                    raw_path = candidate
-                    break
-            if not raw_path:
-                raise RuntimeError(f"Uploaded file not found for track {track_id}")
-            # Title/artist already set at submission time; just get them
+        raw_path = job["raw_path"]
+        final_path = job["converted_path"]
+        features_json = job["features_json"]
+        media_hash = job["media_hash"]
+        done = _completed_stages(job)
+        if done:
+            logger.info(f"Job {job_id} resuming after stage '{STAGES[done - 1]}'")
+
+        if done < 1 and job["source_key"]:
+            # One transaction from finding the stored file to the job's reference to it
+            # (jobs.media_hash), so a concurrent delete can't unlink it in between
             with db() as conn:
-                t = conn.execute("SELECT title, artist FROM tracks WHERE id=?", (track_id,)).fetchone()
-            title = t["title"]
-            artist = t["artist"]
+                cached = cached_source(conn, job["source_key"])
+                if cached:
+                    # Ingested before and still in the store: nothing to download, convert or analyze
+                    media_hash, final_path = cached["media_hash"], cached["path"]
+                    features_json = json.dumps(cached["analysis"])
+                    conn.execute(
+                        "UPDATE tracks SET title=?, artist=? WHERE id=? AND source_type='youtube'",
+                        (cached["title"], cached["artist"], track_id),
+                    )
+                    _write_checkpoint(
+                        conn,
+                        job_id,
+                        "analyzed",
+                        converted_path=final_path,
+                        features_json=features_json,
+                        media_hash=media_hash,
+                    )
+            if cached:
+                if source_type == "upload" and (upload := _find_upload(track_id)):
+                    os.unlink(upload)
+                logger.info(f"Job {job_id}: source already stored as {media_hash}, skipping to the result")
+                done = 3
+
+        if done < 1:
+            raw_path = None
+            if source_type == "upload":
+                # File was already uploaded to /media/raw/{track_id}.*
+                raw_path = _find_upload(track_id)
+                if not raw_path:
+                    raise RuntimeError(f"Uploaded file not found for track {track_id}")
+                # Title/artist already set at submission time
+                _checkpoint(job_id, "downloaded", raw_path=raw_path)
+
+            elif source_type == "youtube":
+                with stage_timer(job_id, track_id, "download") as timing:
+                    title, artist, raw_path = download_youtube(source_url, track_id)
+                    timing.input_bytes = os.path.getsize(raw_path)
+                with db() as conn:
+                    conn.execute("UPDATE tracks SET title=?, artist=? WHERE id=?", (title, artist, track_id))
+                _checkpoint(job_id, "downloaded", raw_path=raw_path)
 
-        elif source_type == "youtube":
-            title, artist, raw_path = download_youtube(source_url, track_id)
+            else:
+                raise RuntimeError(f"Unknown source_type: {source_type}")
 
+        with db() as conn:
+            t = conn.execute("SELECT title, artist FROM tracks WHERE id=?", (track_id,)).fetchone()
+        title = t["title"]
+        artist = t["artist"]
+
+        # The transcode decodes the source once and streams its PCM into the feature
+        # accumulator as it goes, so most of the analysis overlaps the transcode and
+        # neither analysis nor duration needs to decode the MP3 again
+        tier = _choose_tier()
+        accumulator = None
+        if done < 2:
+            _raise_if_stopping()
+            accumulator = FeatureAccumulator(sr=ANALYSIS_SR, tier=tier, channels=PCM_CHANNELS)
+            # Convert to standard MP3, then file it in the content-addressed store (where
+            # identical audio from an earlier submission may already be)
+            with stage_timer(job_id, track_id, "transcode", input_path=raw_path):
+                converted_path, transcode_mode = convert_to_standard_mp3(
+                    raw_path,
+                    incoming_path(track_id),
+                    pcm_sink=accumulator.feed,
+                    pcm_rate=ANALYSIS_SR,
+                    pcm_channels=PCM_CHANNELS,
+                )
+                # The job references the stored file (jobs.media_hash) in the same transaction
+                # that stores it, so a concurrent delete never sees it unreferenced
+                with db() as conn:
+                    media_hash, final_path = store(conn, converted_path)
+                    conn.execute("UPDATE jobs SET transcode_mode=? WHERE id=?", (transcode_mode, job_id))
+                    _write_checkpoint(conn, job_id, "converted", converted_path=final_path, media_hash=media_hash)
+
+        saved: dict  # the "analyzed" checkpoint: features plus duration_s, analysis_tier, feature_version
+        if done < 3:
+            _raise_if_stopping()
+            with db() as conn:
+                cached = cached_analysis(conn, media_hash) if media_hash else None
+            if cached:
+                logger.info(f"Job {job_id}: {media_hash} was analyzed before, reusing its features")
+                saved = cached
+            else:
+                # Finish feature extraction; only a job resumed after conversion has to decode the MP3
+                with stage_timer(job_id, track_id, "analysis", input_path=final_path):
+                    if accumulator is not None:
+                        features = accumulator.result()
+                        duration_s = accumulator.duration_s
+                    else:
+                        features = extract_features(final_path, tier)
+                        duration_s = None
+                saved = {
+                    **asdict(features),
+                    "duration_s": duration_s,
+                    "analysis_tier": tier,
+                    "feature_version": FEATURE_VERSION,
+                }
+            _checkpoint(job_id, "analyzed", features_json=json.dumps(saved))
         else:
-            raise RuntimeError(f"Unknown source_type: {source_type}")
-
-        # Convert to standard MP3 with track_id embedded as comment tag
-        final_path = convert_to_standard_mp3(raw_path, track_id, track_id, title=title or "", artist=artist or "")
-
-        # Extract audio features
-        features = extract_features(final_path)
-
-        # Update feature normalization bounds
-        update_feature_bounds(features)
-
-        # Get duration via ffprobe
-        import subprocess
-
-        result = subprocess.run(  # noqa: S603
-            [  # noqa: S607
-                "ffprobe",
-                "-v",
-                "quiet",
-                "-print_format",
-                "json",
-                "-show_streams",
-                final_path,
-            ],
-            capture_output=True,
-            text=True,
-        )
-        duration_s = None
-        if result.returncode == 0:
-            import json
-
-            info = json.loads(result.stdout)
-            for stream in info.get("streams", []):
-                if stream.get("codec_type") == "audio":
-                    duration_s = float(stream.get("duration", 0)) or None
-                    break
-
-        # Update track in DB
+            saved = json.loads(features_json)
+        duration_s = saved.pop("duration_s", None)
+        tier = saved.pop("analysis_tier", "full")
+        feature_version = saved.pop("feature_version", None)
+        features = AudioFeatures(**saved)
+
+        if duration_s is None:
+            with stage_timer(job_id, track_id, "probe", input_path=final_path):
+                duration_s = probe_duration_s(final_path)
+
+        # Update the track in DB, and those of anyone who submitted the same source meanwhile:
+        # they share the file and features. Titles of YouTube tracks come from the download;
+        # uploads keep the title their submitter gave.
         with db() as conn:
-            conn.execute(
+            _update_job_tracks(
+                conn,
+                job_id,
                 """
-                UPDATE tracks SET
-                    title=?, artist=?, file_path=?, duration_s=?,
+                    title=CASE WHEN source_type='youtube' THEN ? ELSE title END,
+                    artist=CASE WHEN source_type='youtube' THEN ? ELSE artist END,
+                    file_path=?, duration_s=?,
                     tempo_bpm=?, rms_energy=?, spectral_centroid=?,
-                    zero_crossing_rate=?, status='ready', ready_at=?, error_msg=NULL
-                WHERE id=?
+                    zero_crossing_rate=?, embedding=?, loudness_lufs=?, peak_dbfs=?, cue_in_s=?, cue_out_s=?,
+                    analysis_tier=?, feature_version=?, media_hash=?, status='ready', ready_at=?,
+                    error_msg=NULL
                 """,
                 (
                     title,
@@ -130,14 +415,40 @@ def _process_job(job_id: int, track_id: str):
                     features.rms_energy,
                     features.spectral_centroid,
                     features.zero_crossing_rate,
+                    embedding_blob(features.embedding),
+                    features.loudness_lufs,
+                    features.peak_dbfs,
+                    features.cue_in_s,
+                    features.cue_out_s,
+                    tier,
+                    feature_version,
+                    media_hash,
                     _now(),
-                    track_id,
                 ),
             )
+            if media_hash:
+                analysis = {**asdict(features), "duration_s": duration_s, "analysis_tier": tier}
+                save_analysis(conn, media_hash, {**analysis, "feature_version": feature_version})
+                if job["source_key"]:
+                    save_source(conn, job["source_key"], media_hash, title, artist)
+            # Fingerprint the new tracks against the library; matches are flagged to the admin
+            for row in conn.execute(_JOB_TRACKS, (job_id, job_id)).fetchall():
+                matches = index_track(conn, row["track_id"], features.fingerprint)
+                if matches and row["track_id"] == track_id:
+                    logger.info(f"Job {job_id}: sounds like track(s) {', '.join(m['track_id'] for m in matches)}")
             conn.execute(
                 "UPDATE jobs SET status='done', finished_at=? WHERE id=?",
                 (_now(), job_id),
             )
+            followers = conn.execute(
+                "SELECT t.submitter FROM job_followers f JOIN tracks t ON t.id = f.track_id"
+                " WHERE f.job_id=? ORDER BY f.attached_at",
+                (job_id,),
+            ).fetchall()
+        submitters = list(dict.fromkeys([submitter, *(f["submitter"] for f in followers)]))
+
+        # Update feature normalization bounds now that the track counts as ready
+        recompute_feature_stats()
 
         logger.info(f"Job {job_id} completed: track {track_id} ready at {final_path}")
         if comment:
@@ -146,25 +457,55 @@ def _process_job(job_id: int, track_id: str):
         else:
             body = "Tune in to hear its upcoming debut."
         send_push_to_all(
-            title=f"{submitter} added {title} to the radio!",
+            title=f"{_join_names(submitters)} added {title} to the radio!",
             body=body,
         )
 
+    except JobInterrupted:
+        # Shutting down: completed stages are checkpointed, so hand the job back to the queue
+        with db() as conn:
+            conn.execute("UPDATE jobs SET status='pending', started_at=NULL WHERE id=?", (job_id,))
+            _update_job_tracks(conn, job_id, "status='pending'")
+        logger.info(f"Job {job_id} checkpointed and returned to the queue for shutdown")
+
     except Exception as e:
         error_msg = str(e)
-        logger.error(f"Job {job_id} failed: {error_msg}", exc_info=True)
+        error_class = classify(e)
+        policy = POLICIES[error_class]
         with db() as conn:
-            conn.execute(
-                "UPDATE jobs SET status='failed', finished_at=?, error_msg=? WHERE id=?",
-                (_now(), error_msg, job_id),
-            )
-            conn.execute(
-                "UPDATE tracks SET status='failed', error_msg=? WHERE id=?",
-                (error_msg, track_id),
+            job = conn.execute("SELECT attempts FROM jobs WHERE id=?", (job_id,)).fetchone()
+            if job is None:
+                logger.warning(f"Job {job_id} failed after it was deleted ({error_class}): {error_msg}")
+                _discard_outputs(conn, track_id, media_hash)
+                return
+            attempts = job["attempts"] + 1
+            if attempts < policy.max_attempts:
+                delay_s = policy.delay_s(attempts)
+                next_attempt_at = (datetime.now(UTC) + timedelta(seconds=delay_s)).isoformat()
+                conn.execute(
+                    "UPDATE jobs SET status='pending', attempts=?, next_attempt_at=?, error_msg=? WHERE id=?",
+                    (attempts, next_attempt_at, error_msg, job_id),
+                )
+                _update_job_tracks(conn, job_id, "status='pending'")
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status='dead', next_attempt_at=NULL, attempts=?, finished_at=?, error_msg=?"
+                    " WHERE id=?",
+                    (attempts, _now(), error_msg, job_id),
+                )
+                _update_job_tracks(conn, job_id, "status='failed', error_msg=?", (error_msg,))
+
+        if attempts < policy.max_attempts:
+            logger.warning(
+                f"Job {job_id} failed ({error_class}, attempt {attempts}/{policy.max_attempts}), "
+                f"retrying in {delay_s:.0f}s: {error_msg}"
             )
-        if "bot-check failed" in error_msg:
-            hostname = os.environ.get("SERVER_HOSTNAME", "")
-            admin_url = f"https://{hostname}/admin" if hostname else "(admin panel)"
+            return
+
+        logger.error(f"Job {job_id} dead ({error_class}) after {attempts} attempt(s): {error_msg}", exc_info=True)
+        hostname = os.environ.get("SERVER_HOSTNAME", "")
+        admin_url = f"https://{hostname}/admin" if hostname else "(admin panel)"
+        if error_class == "bot_check":
             send_alert(
                 subject="[Family Radio] YouTube bot-check failed",
                 body=(
@@ -176,6 +517,127 @@ def _process_job(job_id: int, track_id: str):
                     f"Error: {error_msg}"
                 ),
             )
+        else:
+            send_alert(
+                subject="[Family Radio] Track processing gave up",
+                body=(
+                    f"A submission failed {attempts} time(s) and was moved to the dead-letter queue.\n\n"
+                    f"Submitted by: {submitter}\n"
+                    f"Source: {source_url or 'upload'}\n"
+                    f"Error class: {error_class}\n\n"
+                    f"Once the cause is fixed, re-queue it from the admin panel:\n"
+                    f"{admin_url}\n\n"
+                    f"Error: {error_msg}"
+                ),
+            )
+
+
+def _discard_outputs(conn, track_id: str, media_hash: str | None):
+    """Delete the files a job left behind after its row was deleted mid-run."""
+    for path in (_find_upload(track_id), incoming_path(track_id)):
+        if path and os.path.exists(path):
+            os.unlink(path)
+    # A file this job stored is kept if anything else has come to reference it
+    if media_hash and not hash_references(conn, media_hash) and os.path.exists(path_for(media_hash)):
+        os.unlink(path_for(media_hash))
+        logger.info(f"Deleted stored file {media_hash} of deleted job")
+
+
+def request_metadata(conn, video_id: str, url: str) -> dict | None:
+    """Cached metadata for a YouTube video, or queue a lookup on the metadata lane.
+
+    Returns {"title", "artist", "duration_s"} when the video has been looked up before.
+    Otherwise (or when the last lookup failed) queues one and returns None; call
+    wake_metadata_lane() once the transaction has committed.
+    """
+    row = conn.execute(
+        "SELECT status, title, artist, duration_s FROM youtube_metadata WHERE video_id=?", (video_id,)
+    ).fetchone()
+    if row and row["status"] == "done":
+        return {"title": row["title"], "artist": row["artist"], "duration_s": row["duration_s"]}
+    conn.execute(
+        """
+        INSERT INTO youtube_metadata (video_id, url, status, requested_at) VALUES (?, ?, 'pending', ?)
+        ON CONFLICT(video_id) DO UPDATE SET url=excluded.url, status='pending', requested_at=excluded.requested_at
+        WHERE status='failed'
+        """,
+        (video_id, url, _now()),
+    )
+    return None
+
+
+def wake_metadata_lane():
+    _metadata_wakeup.set()
+
+
+def _apply_metadata(conn, video_id: str, title: str, artist: str, duration_s: float | None):
+    """Fill in unfinished tracks of a video that still show the placeholder, and their job's estimate."""
+    tracks = "SELECT id FROM tracks WHERE youtube_video_id=? AND status IN ('pending', 'processing')"
+    conn.execute(
+        f"UPDATE tracks SET title=? WHERE title=? AND id IN ({tracks})",  # noqa: S608 — constant subquery
+        (title, PENDING_PLACEHOLDER, video_id),
+    )
+    conn.execute(
+        f"UPDATE tracks SET artist=? WHERE artist=? AND id IN ({tracks})",  # noqa: S608 — constant subquery
+        (artist, PENDING_PLACEHOLDER, video_id),
+    )
+    if duration_s:
+        conn.execute(
+            f"UPDATE tracks SET duration_s=? WHERE duration_s IS NULL AND id IN ({tracks})",  # noqa: S608
+            (duration_s, video_id),
+        )
+        # Lets get_pending_jobs rank the job by its real length instead of UNKNOWN_DURATION_S
+        conn.execute(
+            f"UPDATE jobs SET est_duration_s=? WHERE status='pending' AND est_duration_s IS NULL"  # noqa: S608
+            f" AND track_id IN ({tracks})",
+            (duration_s, video_id),
+        )
+
+
+def _fetch_next_metadata() -> bool:
+    """Look up the oldest queued video. False if the queue was empty."""
+    with db() as conn:
+        row = conn.execute(
+            "SELECT video_id, url FROM youtube_metadata WHERE status='pending' ORDER BY requested_at LIMIT 1"
+        ).fetchone()
+    if not row:
+        return False
+
+    try:
+        title, artist, duration_s = fetch_youtube_metadata(row["url"])
+    except Exception as e:
+        # Not worth retrying: the full download fills in the same fields anyway
+        logger.warning(f"Metadata lookup for video {row['video_id']} failed: {e}")
+        with db() as conn:
+            conn.execute(
+                "UPDATE youtube_metadata SET status='failed', fetched_at=?, error_msg=? WHERE video_id=?",
+                (_now(), str(e), row["video_id"]),
+            )
+        return True
+
+    with db() as conn:
+        conn.execute(
+            "UPDATE youtube_metadata SET status='done', title=?, artist=?, duration_s=?, fetched_at=?, error_msg=NULL"
+            " WHERE video_id=?",
+            (title, artist, duration_s, _now(), row["video_id"]),
+        )
+        _apply_metadata(conn, row["video_id"], title, artist, duration_s)
+    logger.info(f"Metadata for video {row['video_id']}: {artist} - {title} ({duration_s or '?'}s)")
+    return True
+
+
+def _metadata_loop():
+    """Fast lane: look up queued YouTube metadata, independent of the (possibly busy) job workers."""
+    logger.info("Metadata lane started")
+    while not _stop_event.is_set():
+        try:
+            if not _fetch_next_metadata():
+                _metadata_wakeup.wait(timeout=5.0)
+                _metadata_wakeup.clear()
+        except Exception as e:
+            logger.error(f"Metadata lane error: {e}", exc_info=True)
+            _stop_event.wait(timeout=10.0)
+    logger.info("Metadata lane stopped")
 
 
 def reset_stuck_jobs():
@@ -191,28 +653,94 @@ def reset_stuck_jobs():
                 "UPDATE jobs SET status='pending', started_at=NULL WHERE id=?",
                 (row["id"],),
             )
-            conn.execute(
-                "UPDATE tracks SET status='pending' WHERE id=?",
-                (row["track_id"],),
-            )
+            _update_job_tracks(conn, row["id"], "status='pending'")
     if stuck:
-        logger.warning(f"Reset {len(stuck)} stuck processing job(s) to pending on startup")
+        logger.warning(
+            f"Reset {len(stuck)} stuck processing job(s) to pending on startup; they resume from their last checkpoint"
+        )
     else:
         logger.info("No stuck processing jobs found on startup")
 
 
-def _worker_loop():
-    """Background worker: poll for pending jobs and process them."""
-    logger.info("Worker thread started")
+def _upgrade_fast_track() -> bool:
+    """Re-analyze one fast-tier track in the full tier. False if there was nothing to do."""
+    if get_config("analysis_tier") == "fast":
+        return False  # fast was chosen explicitly; keep it
+    with db() as conn:
+        rows = conn.execute(
+            "SELECT id, file_path, media_hash, duration_s FROM tracks"
+            " WHERE status='ready' AND analysis_tier='fast' ORDER BY ready_at"
+        ).fetchall()
+    row = next((r for r in rows if r["id"] not in _upgrade_failed), None)
+    if not row:
+        return False
+
+    try:
+        features = extract_features(row["file_path"], "full")
+    except Exception as e:
+        _upgrade_failed.add(row["id"])
+        logger.warning(f"Full re-analysis of track {row['id']} failed: {e}")
+        return False
+
+    with db() as conn:
+        # Every track playing the same stored file gets the upgrade
+        conn.execute(
+            """
+            UPDATE tracks SET tempo_bpm=?, rms_energy=?, spectral_centroid=?, zero_crossing_rate=?,
+                embedding=?, loudness_lufs=?, peak_dbfs=?, cue_in_s=?, cue_out_s=?,
+                analysis_tier='full', feature_version=?
+            WHERE analysis_tier='fast' AND (id=? OR media_hash=?)
+            """,
+            (
+                features.tempo_bpm,
+                features.rms_energy,
+                features.spectral_centroid,
+                features.zero_crossing_rate,
+                embedding_blob(features.embedding),
+                features.loudness_lufs,
+                features.peak_dbfs,
+                features.cue_in_s,
+                features.cue_out_s,
+                FEATURE_VERSION,
+                row["id"],
+                row["media_hash"],
+            ),
+        )
+        if row["media_hash"]:
+            analysis = {**asdict(features), "duration_s": row["duration_s"], "analysis_tier": "full"}
+            save_analysis(conn, row["media_hash"], {**analysis, "feature_version": FEATURE_VERSION})
+    recompute_feature_stats()
+    logger.info(f"Track {row['id']} upgraded to full analysis")
+    return True
+
+
+def _worker_loop(slot: int):
+    """Background worker: poll for pending jobs and process them.
+
+    Slot 0 always runs; higher slots only take work while the governor allows that
+    much concurrency. When the queue is empty and nobody is listening, slot 0 upgrades
+    fast-tier tracks to full analysis, one per poll.
+    """
+    logger.info(f"Worker thread {slot} started")
     while not _stop_event.is_set():
         try:
+            decision = decide()
+            if slot >= decision.max_concurrency:
+                _stop_event.wait(timeout=5.0)
+                continue
+
             with db() as conn:
-                row = conn.execute(
-                    "SELECT id, track_id FROM jobs WHERE status='pending' ORDER BY created_at ASC LIMIT 1"
-                ).fetchone()
+                pending = get_pending_jobs(conn)
+            row = next((r for r in pending if _claim_job(r["id"])), None)
 
             if row:
-                _process_job(row["id"], row["track_id"])
+                _active_jobs[slot] = row["id"]
+                try:
+                    _process_job(row["id"], row["track_id"])
+                finally:
+                    _active_jobs.pop(slot, None)
+            elif slot == 0 and not decision.throttled and _upgrade_fast_track():
+                continue
             else:
                 # No pending jobs; wait before polling again
                 _stop_event.wait(timeout=5.0)
@@ -221,17 +749,36 @@ def _worker_loop():
             logger.error(f"Worker loop error: {e}", exc_info=True)
             _stop_event.wait(timeout=10.0)
 
-    logger.info("Worker thread stopped")
+    logger.info(f"Worker thread {slot} stopped")
+
+
+def get_worker_status() -> dict:
+    return {
+        "threads": len(_worker_threads),
+        "active_job_ids": sorted(_active_jobs.values()),
+    }
 
 
 def start_worker():
-    global _worker_thread
     _stop_event.clear()
-    _worker_thread = threading.Thread(target=_worker_loop, daemon=True, name="radio-worker")
-    _worker_thread.start()
+    _worker_threads.clear()
+    for slot in range(MAX_CONCURRENCY):
+        thread = threading.Thread(target=_worker_loop, args=(slot,), daemon=True, name=f"radio-worker-{slot}")
+        thread.start()
+        _worker_threads.append(thread)
+    threading.Thread(target=_metadata_loop, daemon=True, name="radio-metadata").start()
 
 
 def stop_worker():
+    """Ask the workers to stop and wait for them to drain.
+
+    A job in progress finishes its current stage, checkpoints it and goes back to the
+    queue; the next startup resumes it from there.
+    """
     _stop_event.set()
-    if _worker_thread:
-        _worker_thread.join(timeout=30)
+    _metadata_wakeup.set()
+    deadline = time.monotonic() + DRAIN_TIMEOUT_S
+    for thread in _worker_threads:
+        thread.join(timeout=max(0.0, deadline - time.monotonic()))
+    if any(thread.is_alive() for thread in _worker_threads):
+        logger.warning(f"Worker still busy after {DRAIN_TIMEOUT_S:.0f}s; job will resume from its last checkpoint")
@@ -0,0 +1,201 @@
+"""Warm yt-dlp engines in separate processes, shared by all YouTube downloads.
+
+Running the yt-dlp CLI per download pays for interpreter startup, the yt-dlp import,
+extractor and plugin registration (bgutil) and cookie loading every time, and again on
+each retry. An engine is a spawned process that does that once and keeps a configured
+YoutubeDL, taking requests over a multiprocessing queue. Engines are started lazily, one
+per concurrent download (governor.MAX_CONCURRENCY at most). A crash or a hung download
+only takes down that engine, which is replaced on the next request. Metadata lookups
+(the --skip-download equivalent) have an engine of their own, so they never wait behind
+a download.
+
+Options are the same CLI arguments download_youtube always used, parsed by yt-dlp
+itself. The YoutubeDL is rebuilt when they change, or when the cookies file changes
+(a fresh upload from the admin panel).
+
+Each request carries the ingest governor's current niceness and I/O class, and the
+engine applies them to itself before handling it. So downloads run at full priority
+while nobody is listening and at THROTTLED_NICENESS in the idle I/O class otherwise,
+as the CLI did through governor.wrap_command; Deno and ffmpeg, started by yt-dlp during
+the request, inherit them.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import governor
+from governor import MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+_ctx = multiprocessing.get_context("spawn")  # no forked copy of the API's threads and sockets
+_POLL_S = 1.0
+_IONICE = shutil.which("ionice")
+
+
+class YtdlError(RuntimeError):
+    """A download failed inside the engine; the message is yt-dlp's error, as the CLI printed it."""
+
+
+class YtdlEngine:
+    """One engine process and its request/response queues."""
+
+    def __init__(self):
+        self._process = None
+        self._requests = None
+        self._responses = None
+
+    def extract(
+        self, args: list[str], url: str, cookies_path: str, timeout: float, output_template: str | None = None
+    ) -> dict:
+        """Look up url and, given an output template, download it.
+
+        Returns {"title", "artist", "uploader", "duration", "filepath", "entries"}; filepath
+        is None for a metadata-only lookup, and entries lists a playlist's videos as
+        {"id", "title", "artist", "duration"}. Raises YtdlError for a yt-dlp failure and TimeoutError
+        (after killing the engine) when it takes longer than timeout.
+        """
+        if self._process is None or not self._process.is_alive() or self._requests is None or self._responses is None:
+            self._requests, self._responses = self._start()
+        decision = governor.current()
+        self._requests.put((args, url, output_template, cookies_path, decision.niceness, decision.ionice_idle))
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                ok, payload = self._responses.get(timeout=_POLL_S)
+                break
+            except queue.Empty:
+                if self._process is None or not self._process.is_alive():
+                    self.stop()
+                    raise YtdlError("yt-dlp engine exited during download") from None
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise TimeoutError(f"yt-dlp timed out after {timeout:.0f}s") from None
+        if not ok:
+            raise YtdlError(payload)
+        return payload
+
+    def stop(self):
+        if self._process is None:
+            return
+        if self._process.is_alive() and self._requests is not None:
+            self._requests.put(None)
+            self._process.join(timeout=2)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._process = None
+
+    def _start(self):
+        """Start the engine process; returns its (requests, responses) queues."""
+        requests, responses = _ctx.Queue(), _ctx.Queue()
+        self._process = _ctx.Process(target=_serve, args=(requests, responses), name="ytdl-engine", daemon=True)
+        self._process.start()
+        logger.info(f"Started yt-dlp engine (pid {self._process.pid})")
+        return requests, responses
+
+
+_lock = threading.Lock()
+_engines: list[YtdlEngine] = []
+_idle: queue.SimpleQueue[YtdlEngine] = queue.SimpleQueue()
+_metadata_lock = threading.Lock()
+_metadata_engine = YtdlEngine()
+
+
+def download(args: list[str], url: str, output_template: str, cookies_path: str, timeout: float = 300) -> dict:
+    """Run one download on an idle engine, starting one if all are busy and the cap allows."""
+    with _lock:
+        if _idle.empty() and len(_engines) < MAX_CONCURRENCY:
+            _engines.append(YtdlEngine())
+            _idle.put(_engines[-1])
+    engine = _idle.get()
+    try:
+        return engine.extract(args, url, cookies_path, timeout, output_template)
+    finally:
+        _idle.put(engine)
+
+
+def fetch_metadata(args: list[str], url: str, cookies_path: str, timeout: float = 60) -> dict:
+    """Look up url without downloading it, on the metadata engine."""
+    with _metadata_lock:
+        return _metadata_engine.extract(args, url, cookies_path, timeout)
+
+
+def shutdown():
+    with _lock:
+        for engine in _engines:
+            engine.stop()
+    with _metadata_lock:
+        _metadata_engine.stop()
+
+
+def _set_priority(base_niceness: int, niceness: int, ionice_idle: bool):
+    """Give this engine the governor's niceness (on top of the API's) and I/O class."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, base_niceness + niceness)
+    except PermissionError:
+        pass  # lowering niceness again needs root (the API container runs as root)
+    if _IONICE:
+        # Class 3 is idle; class 0 is the default, which follows the CPU niceness
+        subprocess.run([_IONICE, "-c", "3" if ionice_idle else "0", "-p", str(os.getpid())], check=False)  # noqa: S603
+
+
+def _serve(requests, responses):
+    """Engine process main loop."""
+    import yt_dlp  # ty: ignore[unresolved-import]
+
+    base_niceness = os.getpriority(os.PRIO_PROCESS, 0)
+    priority = None
+    ydl = None
+    built_for = None
+    while (request := requests.get()) is not None:
+        args, url, output_template, cookies_path, niceness, ionice_idle = request
+        if priority != (niceness, ionice_idle):
+            _set_priority(base_niceness, niceness, ionice_idle)
+            priority = (niceness, ionice_idle)
+        cookies_mtime = os.path.getmtime(cookies_path) if os.path.exists(cookies_path) else None
+        if ydl is None or built_for != (args, cookies_mtime):
+            if ydl is not None:
+                ydl.close()
+            params = yt_dlp.parse_options(args).ydl_opts
+            params["ignoreerrors"] = False  # raise instead of only logging, so the error can be returned
+            ydl = yt_dlp.YoutubeDL(params)
+            built_for = (args, cookies_mtime)
+        if output_template is not None:
+            ydl.params["outtmpl"]["default"] = output_template
+        try:
+            info = ydl.extract_info(url, download=output_template is not None)
+            downloads = info.get("requested_downloads") or [{}]
+            result = {
+                "title": info.get("title"),
+                "artist": info.get("artist"),
+                "uploader": info.get("uploader"),
+                "duration": info.get("duration"),
+                "filepath": downloads[0].get("filepath"),
+                "entries": [
+                    {
+                        "id": entry.get("id"),
+                        "title": entry.get("title"),
+                        "artist": entry.get("artist") or entry.get("uploader") or entry.get("channel"),
+                        "duration": entry.get("duration"),
+                    }
+                    for entry in info.get("entries") or []
+                    if entry
+                ],
+            }
+            responses.put((True, result))
+        except Exception as e:
+            responses.put((False, str(e)))
+        finally:
+            # The CLI writes refreshed cookies back when it exits; do the same per download
+            if cookies_mtime is not None:
+                ydl.save_cookies()
+                built_for = (args, os.path.getmtime(cookies_path))
+    if ydl is not None:
+        ydl.close()